@@ -260,6 +260,7 @@ class TestConfiguration(BaseConfiguration):
 
     # Disable caching for tests
     DOGPILE_CACHE_BACKEND = "dogpile.cache.null"
+    KOJI_BUILD_METADATA_CACHE_TTL = 0
 
     AUTH_BACKEND = 'noauth'
     AUTH_LDAP_SERVER = 'ldap://ldap.example.com'
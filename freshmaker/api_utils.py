@@ -21,6 +21,7 @@
 
 import copy
 from flask import request, url_for, jsonify
+from sqlalchemy.orm import selectinload
 
 from freshmaker import db
 from freshmaker.errors import ValidationError
@@ -190,7 +191,11 @@ def filter_events(flask_request):
     :return: flask_sqlalchemy.Pagination
     """
 
-    query = Event.query
+    # Load the dependencies of all the events on the page at once, they are
+    # part of the JSON representation of each event.
+    query = Event.query.options(
+        selectinload(Event.event_dependencies),
+        selectinload(Event.depending_events))
 
     for key in ['message_id', 'search_key', 'event_type_id', 'requester']:
         values = flask_request.args.getlist(key)
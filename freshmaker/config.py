@@ -206,6 +206,11 @@ class Config(object):
             'type': str,
             'default': 'koji',
             'desc': 'Koji Profile from where to load Koji configuration.'},
+        'koji_multicall_batch_size': {
+            'type': int,
+            'default': 500,
+            'desc': 'Maximum number of Koji API calls sent in single '
+                    'multicall request.'},
         'koji_container_scratch_build': {
             'type': bool,
             'default': False,
@@ -371,14 +376,144 @@ class Config(object):
             'type': str,
             'default': 'dogpile.cache.memory',
             'desc': 'Name of dogpile.cache backend to use.'},
+        'koji_build_metadata_cache_ttl': {
+            'type': int,
+            'default': 30 * 24 * 3600,
+            'desc': 'Number of seconds the immutable Koji build metadata '
+                    '(commit, target, parent builds, ODCS composes, ...) are '
+                    'cached in the database. Set to 0 to disable the cache.'},
+        'koji_build_metadata_negative_cache_ttl': {
+            'type': int,
+            'default': 600,
+            'desc': 'Number of seconds failed Koji build metadata lookups '
+                    'are cached in the database.'},
+        'koji_build_metadata_eviction_interval': {
+            'type': int,
+            'default': 3600,
+            'desc': 'Minimal number of seconds between two removals of the '
+                    'expired Koji build metadata from the database by the '
+                    'poller. Expired entries are never used, so they can be '
+                    'kept longer.'},
+        'http_pool_sizes': {
+            'type': dict,
+            'default': {},
+            'desc': 'Maximum number of HTTP connections kept open to the '
+                    'service in the form {"service_name": pool_size}, for '
+                    'example {"lightblue": 20}. Services not listed use '
+                    'the "max_thread_workers" value.'},
         'messaging_backends': {
             'type': dict,
             'default': {},
             'desc': 'Configuration for each supported messaging backend.'},
+        'messaging_async_publish': {
+            'type': bool,
+            'default': False,
+            'desc': 'When True, the outgoing messages are buffered in memory '
+                    'and sent in batches by the background thread instead of '
+                    'being sent synchronously by the code publishing them.'},
+        'messaging_publisher_queue_size': {
+            'type': int,
+            'default': 1000,
+            'desc': 'Maximum number of outgoing messages buffered in memory '
+                    'when "messaging_async_publish" is enabled. When the buffer '
+                    'is full, the messages are sent synchronously.'},
+        'messaging_publisher_batch_size': {
+            'type': int,
+            'default': 100,
+            'desc': 'Maximum number of outgoing messages sent in single batch.'},
+        'messaging_publisher_coalesce_window': {
+            'type': float,
+            'default': 0.0,
+            'desc': 'Number of seconds the background publisher waits for more '
+                    'messages before sending the batch. Repeated '
+                    '"event.state.changed" and "event.state.changed.min" '
+                    'messages of the same event within this window are '
+                    'coalesced and only the last one is sent. 0 disables '
+                    'the coalescing.'},
         'max_thread_workers': {
             'type': int,
             'default': 10,
             'desc': 'Maximum number of thread workers used by Freshmaker.'},
+        'container_build_submission_workers': {
+            'type': int,
+            'default': 1,
+            'desc': 'Number of threads submitting the container image builds '
+                    'to Koji concurrently. Every thread uses its own Koji '
+                    'session. When set to 1, the builds are submitted one by one.'},
+        'container_build_claim_timeout': {
+            'type': int,
+            'default': 3600,
+            'desc': 'Number of seconds after which the claim of a container '
+                    'image build, which has not been submitted to Koji, '
+                    'expires, so other handler can submit the build.'},
+        'container_build_submission_chunk_size': {
+            'type': int,
+            'default': 50,
+            'desc': 'Number of container image builds submitted concurrently '
+                    'and committed to the database in single transaction.'},
+        'consumer_workers': {
+            'type': int,
+            'default': 1,
+            'desc': 'Number of worker threads processing the received events '
+                    'concurrently. The events with the same partition key '
+                    '(for example events of the same advisory) are always '
+                    'processed by the same worker in the order they have been '
+                    'received. When set to 1 and no "consumer_lanes" are '
+                    'configured, the events are processed one by one in the '
+                    'consumer thread.'},
+        'consumer_lanes': {
+            'type': dict,
+            'default': {},
+            'desc': 'Priority lanes of the consumer in the form '
+                    '{"lane_name": number_of_workers}, for example {"fast": 2}. '
+                    'Every lane has its own pool of workers, so the events '
+                    'in one lane never wait for the events in another lane. '
+                    'The events are assigned to the lanes according to '
+                    '"consumer_event_lanes". The events not assigned to any '
+                    'configured lane are processed in the "bulk" lane with '
+                    '"consumer_workers" workers.'},
+        'consumer_event_lanes': {
+            'type': dict,
+            'default': {
+                'BrewContainerTaskStateChangeEvent': 'fast',
+                'ODCSComposeStateChangeEvent': 'fast',
+                'FreshmakerManageEvent': 'fast',
+            },
+            'desc': 'Lane of the consumer processing the particular event '
+                    'type in the form {"EventClassName": "lane_name"}. '
+                    'Used only when "consumer_lanes" are configured. The events '
+                    'in different lanes can start the same builds, but every '
+                    'build is claimed in the database before it is submitted, '
+                    'so it is never submitted twice.'},
+        'durable_event_queue': {
+            'type': bool,
+            'default': False,
+            'desc': 'When True, the internal events (events returned by the '
+                    'handlers for further work, events injected by the producer '
+                    'and messages sent using the "in_memory" messaging backend) '
+                    'are stored in the database until they are processed, so '
+                    'they are not lost when the backend is restarted.'},
+        'durable_event_queue_batch_size': {
+            'type': int,
+            'default': 100,
+            'desc': 'Number of unprocessed internal events loaded from the '
+                    'database at once.'},
+        'durable_event_queue_lease': {
+            'type': int,
+            'default': 300,
+            'desc': 'Number of seconds the internal event loaded from the '
+                    'durable event queue is reserved for the backend which '
+                    'loaded it. The backend renews the reservation while the '
+                    'event waits for processing or is processed. The events '
+                    'with expired reservation, because their backend stopped '
+                    'or failed to process them, are loaded again by any '
+                    'backend.'},
+        'durable_event_queue_max_attempts': {
+            'type': int,
+            'default': 5,
+            'desc': 'Number of times the internal event is loaded from the '
+                    'durable event queue before it is marked as failed and '
+                    'not processed anymore.'},
         'permissions': {
             'type': dict,
             'default': {},
@@ -411,6 +546,11 @@ class Config(object):
             'default': '',
             'desc': 'Server URL of Pyxis.'
         },
+        'pyxis_page_size': {
+            'type': int,
+            'default': 100,
+            'desc': 'Number of items requested in a single page from Pyxis. '
+                    'Pages after the first one are requested concurrently.'},
         'pyxis_index_image_organizations': {
             'type': list,
             'default': [],
@@ -489,7 +629,7 @@ class Config(object):
         if key in self._defaults:
             # type conversion for configuration item
             convert = self._defaults[key]['type']
-            if convert in [bool, int, list, str, set, dict, tuple]:
+            if convert in [bool, int, float, list, str, set, dict, tuple]:
                 try:
                     # Do no try to convert None...
                     if value is not None:
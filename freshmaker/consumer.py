@@ -25,16 +25,157 @@ This class reads and processes messages from the message bus it is configured
 to use.
 """
 
+import queue
+import threading
+import time
+import zlib
+from datetime import datetime, timedelta
+
 import fedmsg.consumers
 import moksha.hub
+from sqlalchemy.exc import SQLAlchemyError
 
-from freshmaker import log, conf, messaging, events, app
+from freshmaker import log, conf, messaging, events, app, db, models
 from freshmaker.monitor import (
     messaging_rx_counter, messaging_rx_ignored_counter,
-    messaging_rx_processed_ok_counter, messaging_rx_failed_counter)
+    messaging_rx_processed_ok_counter, messaging_rx_failed_counter,
+    freshmaker_consumer_lane_queue_depth, freshmaker_consumer_lane_wait_time)
 from freshmaker.utils import load_classes
 
 
+class HandlerRegistry(object):
+    """
+    Handler classes loaded and sorted by their order only once, together
+    with a dispatch table mapping the type of event to the handlers which
+    can possibly handle it according to their `event_types`.
+    """
+
+    def __init__(self, import_paths):
+        """
+        :param list import_paths: Import paths of the handler classes.
+        """
+        self.handler_classes = sorted(
+            load_classes(import_paths),
+            key=lambda handler: getattr(handler, "order", 50))
+        # Event class -> list of candidate handler classes.
+        self._dispatch_table = {}
+        # Handler class -> handler instance, which has been used only to call
+        # `can_handle` so far and therefore can be reused for next event.
+        self._idle_handlers = {}
+
+    def get_candidates(self, event_class):
+        """
+        Returns the sorted list of handler classes which can possibly handle
+        the events of `event_class` type.
+        """
+        candidates = self._dispatch_table.get(event_class)
+        if candidates is None:
+            candidates = []
+            for handler_class in self.handler_classes:
+                event_types = getattr(handler_class, "event_types", None)
+                if event_types is None or issubclass(event_class, event_types):
+                    candidates.append(handler_class)
+            self._dispatch_table[event_class] = candidates
+        return candidates
+
+    def get_handlers(self, event):
+        """
+        Yields the handler instances which can handle the `event`, in the
+        order defined by the handlers.
+
+        The `can_handle` method does not change the state of the handler,
+        so the handler instance is reused for the next events until it
+        is yielded to handle some event. The yielded handler instance is
+        never reused, because handling the event changes its state.
+        """
+        for handler_class in self.get_candidates(type(event)):
+            # The idle handler is popped, so it is never used by two worker
+            # threads at once.
+            handler = self._idle_handlers.pop(handler_class, None)
+            if handler is None:
+                handler = handler_class()
+            if not handler.can_handle(event):
+                self._idle_handlers[handler_class] = handler
+                continue
+            yield handler
+
+
+# Lane processing the events which are not assigned to any other lane.
+DEFAULT_LANE = "bulk"
+
+
+class PartitionedWorkerPool(object):
+    """
+    Pool of worker threads processing the events concurrently. Every event
+    is assigned to the worker according to its `partition_key`, so events
+    with the same key are processed one by one in the order they have been
+    received, while the unrelated events are processed in parallel.
+    """
+
+    def __init__(self, workers, process, lane=DEFAULT_LANE):
+        """
+        :param int workers: Number of worker threads.
+        :param process: Function called by the worker for every event with
+            the event and the extra arguments passed to `put`.
+        :param str lane: Name of the consumer lane this pool belongs to.
+        """
+        self.process = process
+        self.lane = lane
+        self.queues = [queue.Queue() for i in range(workers)]
+        self.threads = []
+        for idx, work_queue in enumerate(self.queues):
+            thread = threading.Thread(
+                target=self._work_loop, args=(work_queue, ),
+                name="freshmaker-%s-worker-%d" % (lane, idx), daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def get_worker_index(self, event):
+        """
+        Returns the index of worker which processes the `event`.
+        """
+        key = str(getattr(event, "partition_key", None))
+        return zlib.crc32(key.encode("utf-8")) % len(self.queues)
+
+    def put(self, event, *args):
+        """
+        Schedules the `event` to be processed by its worker. The `args` are
+        passed to the `process` function together with the `event`.
+        """
+        freshmaker_consumer_lane_queue_depth.labels(lane=self.lane).observe(
+            sum(work_queue.qsize() for work_queue in self.queues))
+        self.queues[self.get_worker_index(event)].put(
+            (time.monotonic(), event, args))
+
+    def stop(self, wait=False):
+        """
+        Stops the workers once they process the already scheduled events.
+
+        :param bool wait: When True, waits until the workers are stopped.
+        """
+        for work_queue in self.queues:
+            work_queue.put(StopIteration)
+        if wait:
+            for thread in self.threads:
+                thread.join()
+
+    def _work_loop(self, work_queue):
+        while True:
+            item = work_queue.get()
+            if item is StopIteration:
+                break
+            queued_time, event, args = item
+            freshmaker_consumer_lane_wait_time.labels(lane=self.lane).observe(
+                time.monotonic() - queued_time)
+            try:
+                self.process(event, *args)
+            finally:
+                # Every worker thread has its own scoped DB session, release
+                # it, so the connection is returned to the pool.
+                db.session.remove()
+                work_queue.task_done()
+
+
 class FreshmakerConsumer(fedmsg.consumers.FedmsgConsumer):
     """
     This is triggered by running fedmsg-hub. This class is responsible for
@@ -46,6 +187,17 @@ class FreshmakerConsumer(fedmsg.consumers.FedmsgConsumer):
         # set topic before super, otherwise topic will not be subscribed
         self.register_parsers()
         super(FreshmakerConsumer, self).__init__(hub)
+        self.handler_registry = HandlerRegistry(conf.handlers)
+        log.debug("Handler classes: %r", self.handler_registry.handler_classes)
+
+        # Lane name -> PartitionedWorkerPool processing the events of the lane.
+        self.worker_pools = {}
+        lanes = dict(conf.consumer_lanes)
+        if lanes or conf.consumer_workers > 1:
+            lanes.setdefault(DEFAULT_LANE, conf.consumer_workers)
+            for lane, workers in lanes.items():
+                self.worker_pools[lane] = PartitionedWorkerPool(
+                    workers, self._process_message, lane)
 
         # These two values are typically provided either by the unit tests or
         # by the local build command.  They are empty in the production environ
@@ -60,6 +212,89 @@ class FreshmakerConsumer(fedmsg.consumers.FedmsgConsumer):
             msg = messaging._initial_messages.pop(0)
             self.incoming.put(msg)
 
+        # IDs of the events from the durable event queue which wait in the
+        # work queue or are being processed. Their claims are renewed by the
+        # renewal thread until they are processed.
+        self._queued_event_ids = set()
+        self._queued_event_ids_lock = threading.Lock()
+        self._stop_renewal = threading.Event()
+        if conf.durable_event_queue:
+            self.load_queued_events()
+            self._renewal_thread = threading.Thread(
+                target=self._renew_queued_events_loop,
+                name="freshmaker-queue-renewal", daemon=True)
+            self._renewal_thread.start()
+
+    def load_queued_events(self):
+        """
+        Puts the internal events from the durable event queue, which have
+        not been processed by the backend which claimed them, because it
+        stopped or failed to process them, into the work queue.
+        """
+        claimed_before = datetime.utcnow() - timedelta(
+            seconds=conf.durable_event_queue_lease)
+        count = 0
+        while True:
+            queued_events = models.QueuedEvent.dequeue(
+                conf.durable_event_queue_batch_size, claimed_before,
+                conf.durable_event_queue_max_attempts)
+            if not queued_events:
+                break
+            for queued_event_id, msg in queued_events:
+                self._track_queued_event(msg, queued_event_id)
+                self.incoming.put(msg)
+            count += len(queued_events)
+        if count:
+            log.info("Loaded %d unprocessed events from the durable queue.", count)
+
+    def _track_queued_event(self, msg, queued_event_id):
+        """
+        Remembers that the `msg` is the event `queued_event_id` from the
+        durable event queue, so its claim is renewed until it is processed.
+        """
+        msg._queued_event_id = queued_event_id
+        with self._queued_event_ids_lock:
+            self._queued_event_ids.add(queued_event_id)
+
+    def _renew_queued_events_loop(self):
+        """
+        Renews the claims of the events from the durable event queue which
+        are still being processed and loads the events with expired claims.
+        """
+        while not self._stop_renewal.wait(max(conf.durable_event_queue_lease / 3, 1)):
+            with self._queued_event_ids_lock:
+                ids = list(self._queued_event_ids)
+            try:
+                with app.app_context():
+                    if ids:
+                        models.QueuedEvent.renew(ids)
+                    self.load_queued_events()
+            except SQLAlchemyError:
+                log.exception("Cannot renew the claims of the queued events.")
+
+    def put_internal_event(self, msg, idempotency_key=None):
+        """
+        Puts the internal event `msg` into the work queue. When the durable
+        event queue is enabled, the event is stored in the database first.
+
+        :param BaseEvent msg: Event to put into the work queue.
+        :param str idempotency_key: The events with the same key are not put
+            into the durable event queue again until the previous one is
+            processed.
+        """
+        if conf.durable_event_queue:
+            try:
+                queued_event_id = models.QueuedEvent.enqueue(msg, idempotency_key)
+            except (SQLAlchemyError, TypeError):
+                log.exception("Cannot store %r in the durable event queue.", msg)
+            else:
+                if queued_event_id is None:
+                    log.info("Event %r with idempotency key %s is already queued.",
+                             msg, idempotency_key)
+                    return
+                self._track_queued_event(msg, queued_event_id)
+        self.incoming.put(msg)
+
     def register_parsers(self):
         parser_classes = load_classes(conf.parsers)
         for parser_class in parser_classes:
@@ -69,6 +304,13 @@ class FreshmakerConsumer(fedmsg.consumers.FedmsgConsumer):
         self.topic = events.BaseEvent.get_parsed_topics()
         log.debug('Setting topics: {}'.format(', '.join(self.topic)))
 
+    def stop(self):
+        self._stop_renewal.set()
+        # Let the workers process the events scheduled already.
+        for worker_pool in self.worker_pools.values():
+            worker_pool.stop(wait=True)
+        super(FreshmakerConsumer, self).stop()
+
     def shutdown(self):
         log.info("Scheduling shutdown.")
         from moksha.hub.reactor import reactor
@@ -103,7 +345,31 @@ class FreshmakerConsumer(fedmsg.consumers.FedmsgConsumer):
             messaging_rx_ignored_counter.inc()
             return
 
-        # Primary work is done here.
+        if self.worker_pools:
+            self.worker_pools[self.get_lane(msg)].put(msg, message)
+        else:
+            self._process_message(msg, message)
+
+    def get_lane(self, msg):
+        """
+        Returns the name of the lane processing the message `msg`.
+        """
+        lane = conf.consumer_event_lanes.get(type(msg).__name__, DEFAULT_LANE)
+        if lane not in self.worker_pools:
+            return DEFAULT_LANE
+        return lane
+
+    def _process_message(self, msg, message):
+        """
+        Processes the abstracted message `msg` in the Flask app context.
+        Called from the consumer thread, or from the worker thread in case
+        the worker pool is enabled.
+
+        :param BaseEvent msg: Abstracted message to process.
+        :param message: Original message `msg` has been created from, passed
+            to the stop condition once the `msg` is processed.
+        """
+        processed = False
         try:
             # There is no Flask app-context in the backend and we need some,
             # because models.Event.json() and models.ArtifactBuild.json() uses
@@ -114,12 +380,27 @@ class FreshmakerConsumer(fedmsg.consumers.FedmsgConsumer):
             # state which might be Flask bug, so the only safe way on backend is
             # to have global app_context.
             with app.app_context():
-                self.process_event(msg)
+                processed = self.process_event(msg)
             messaging_rx_processed_ok_counter.inc()
         except Exception:
             messaging_rx_failed_counter.inc()
             log.exception('Failed while handling {0!r}'.format(msg))
 
+        queued_event_id = getattr(msg, "_queued_event_id", None)
+        if queued_event_id is not None:
+            with self._queued_event_ids_lock:
+                self._queued_event_ids.discard(queued_event_id)
+            if processed:
+                try:
+                    models.QueuedEvent.ack([queued_event_id])
+                except SQLAlchemyError:
+                    log.exception("Cannot acknowledge queued event %d.", queued_event_id)
+            else:
+                # The claim is not renewed anymore, so the event is loaded
+                # again once the claim expires.
+                log.warning("Queued event %d has not been processed, it will be "
+                            "processed again.", queued_event_id)
+
         if self.stop_condition and self.stop_condition(message):
             self.shutdown()
 
@@ -143,24 +424,32 @@ class FreshmakerConsumer(fedmsg.consumers.FedmsgConsumer):
         return events.BaseEvent.from_fedmsg(message['topic'], message)
 
     def process_event(self, msg):
+        """
+        Handles the abstracted message `msg` by all the handlers which can
+        handle it.
+
+        :return: False if some handler failed and the failure has not been
+            recorded in the database by the handler, so the message should be
+            processed again, otherwise True.
+        :rtype: bool
+        """
         log.debug('Received a message with an ID of "{0}" and of type "{1}"'
                   .format(getattr(msg, 'msg_id', None), type(msg).__name__))
 
-        handlers = load_classes(conf.handlers)
-        handlers = sorted(handlers, key=lambda handler: getattr(handler, "order", 50))
-        for handler_class in handlers:
-            handler = handler_class()
-
-            if not handler.can_handle(msg):
-                continue
+        processed = True
 
+        for handler in self.handler_registry.get_handlers(msg):
             idx = "%s: %s, %s" % (type(handler).__name__, type(msg).__name__, msg.msg_id)
             log.debug("Calling %s" % idx)
             try:
                 further_work = handler.handle(msg) or []
-            except Exception:
+            except Exception as e:
                 err = 'Could not process message handler. See the traceback.'
                 log.exception(err)
+                # The failures recorded in the database by the
+                # fail_*_on_handler_exception decorators are final.
+                if getattr(handler, "_last_handled_exception", None) is not e:
+                    processed = False
             else:
                 # Handlers can *optionally* return a list of fake messages that
                 # should be re-inserted back into the main work queue. We can
@@ -171,10 +460,12 @@ class FreshmakerConsumer(fedmsg.consumers.FedmsgConsumer):
                 # its completion.
                 for event in further_work:
                     log.info("  Scheduling faked event %r" % event)
-                    self.incoming.put(event)
+                    self.put_internal_event(event)
 
             log.debug("Done with %s" % idx)
 
+        return processed
+
 
 def get_global_consumer():
     """ Return a handle to the active consumer object, if it exists. """
@@ -189,7 +480,7 @@ def get_global_consumer():
     raise ValueError("No FreshmakerConsumer found among %r." % len(hub.consumers))
 
 
-def work_queue_put(msg):
+def work_queue_put(msg, idempotency_key=None):
     """ Artificially put a message into the work queue of the consumer. """
     consumer = get_global_consumer()
-    consumer.incoming.put(msg)
+    consumer.put_internal_event(msg, idempotency_key)
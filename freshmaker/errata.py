@@ -32,6 +32,7 @@ from freshmaker.events import (
     BrewSignRPMEvent, ErrataBaseEvent,
     FreshmakerManualRebuildEvent)
 from freshmaker import conf, log
+from freshmaker.httpsession import get_session, close_session
 from freshmaker.utils import retry
 
 
@@ -180,15 +181,16 @@ class Errata(object):
     @retry(wait_on=(requests.exceptions.RequestException,), logger=log)
     def _errata_authorized_get(self, *args, **kwargs):
         try:
-            r = requests.get(
-                *args,
-                auth=HTTPKerberosAuth(principal=conf.krb_auth_principal),
-                **kwargs, timeout=conf.requests_timeout)
+            session = get_session(
+                "errata", auth=lambda: HTTPKerberosAuth(principal=conf.krb_auth_principal))
+            r = session.get(*args, **kwargs, timeout=conf.requests_timeout)
             r.raise_for_status()
         except requests.exceptions.RequestException as e:
             if e.response is not None and e.response.status_code == 401:
                 log.info("CCache file probably expired, removing it.")
                 os.unlink(conf.krb_auth_ccache_file)
+                # Drop the session together with its Kerberos context.
+                close_session("errata")
             raise
         return r.json()
 
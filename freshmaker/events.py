@@ -22,6 +22,7 @@
 # Written by Jan Kaluza <jkaluza@redhat.com>
 
 import itertools
+import json
 from typing import Dict, Any  # noqa
 
 from freshmaker import conf
@@ -30,6 +31,53 @@ from freshmaker.types import ArtifactType
 from inspect import signature
 
 
+# Version of the format used by `BaseEvent.dumps`. It must be increased
+# whenever the format changes in a backward incompatible way.
+EVENT_DUMP_VERSION = 1
+
+
+def _get_event_class(name):
+    """
+    Returns the BaseEvent subclass called `name`.
+
+    :raises ValueError: When there is no such event class.
+    """
+    classes = [BaseEvent]
+    while classes:
+        event_class = classes.pop()
+        if event_class.__name__ == name:
+            return event_class
+        classes.extend(event_class.__subclasses__())
+    raise ValueError("Unknown event type %s." % name)
+
+
+def _dump_object(obj):
+    """
+    Used by `BaseEvent.dumps` to serialize the objects stored in the event
+    attributes, which are not serializable to JSON by default.
+    """
+    from freshmaker.errata import ErrataAdvisory
+    if isinstance(obj, ErrataAdvisory):
+        return {"__class__": "ErrataAdvisory", "__dict__": obj.__dict__}
+    raise TypeError("Object of type %s cannot be stored in the event dump."
+                    % type(obj).__name__)
+
+
+def _load_object(data):
+    """
+    Used by `BaseEvent.loads` to load the objects serialized by
+    `_dump_object`.
+    """
+    if "__class__" not in data:
+        return data
+    from freshmaker.errata import ErrataAdvisory
+    if data["__class__"] != "ErrataAdvisory":
+        raise ValueError("Unknown object type %s." % data["__class__"])
+    obj = ErrataAdvisory.__new__(ErrataAdvisory)
+    obj.__dict__.update(data["__dict__"])
+    return obj
+
+
 class BaseEvent(object):
 
     _parsers = {}  # type: Dict[Any, Any]
@@ -107,6 +155,45 @@ class BaseEvent(object):
     def __json__(self):
         return dict(msg_id=self.msg_id, topic=self.topic, body=self.body)
 
+    def dumps(self):
+        """
+        Serializes this event to JSON, so it can be stored and loaded
+        later by `BaseEvent.loads`.
+
+        :return: JSON with the version of the format, the name of the event
+            class and the attributes of the event.
+        :rtype: str
+        :raises TypeError: When some attribute cannot be serialized.
+        """
+        return json.dumps({
+            "version": EVENT_DUMP_VERSION,
+            "type": type(self).__name__,
+            "attributes": self.__dict__,
+        }, default=_dump_object)
+
+    @staticmethod
+    def loads(data):
+        """
+        Loads the event serialized by `BaseEvent.dumps`.
+
+        The event is created without calling its ``__init__`` method, its
+        attributes are set to the stored values.
+
+        :param str data: JSON returned by `BaseEvent.dumps`.
+        :return: Loaded event.
+        :rtype: BaseEvent
+        :raises ValueError: When the event cannot be loaded, for example
+            because its class does not exist anymore.
+        """
+        data = json.loads(data, object_hook=_load_object)
+        if data.get("version") != EVENT_DUMP_VERSION:
+            raise ValueError(
+                "Unsupported version %r of the event dump." % data.get("version"))
+        event_class = _get_event_class(data["type"])
+        event = object.__new__(event_class)
+        event.__dict__.update(data["attributes"])
+        return event
+
     @staticmethod
     def from_fedmsg(topic, msg):
         """
@@ -133,6 +220,16 @@ class BaseEvent(object):
         """
         return self.msg_id
 
+    @property
+    def partition_key(self):
+        """
+        Returns the key used by the consumer to decide which worker processes
+        this event. Events with the same key are processed in the order they
+        have been received, so events related to the same advisory or build
+        should have the same key.
+        """
+        return self.search_key
+
     def is_allowed(self, handler, artifact_type, **kwargs):
         """
         Returns True if allowlist/blocklist allows handling this event.
@@ -383,6 +480,10 @@ class ODCSComposeStateChangeEvent(BaseEvent):
         super(ODCSComposeStateChangeEvent, self).__init__(msg_id, **kwargs)
         self.compose = compose
 
+    @property
+    def partition_key(self):
+        return "odcs-compose-%s" % self.compose["id"]
+
 
 class FreshmakerManualRebuildEvent(BaseEvent):
     """
@@ -22,13 +22,16 @@
 # Written by Jan Kaluza <jkaluza@redhat.com>
 
 import abc
+import contextlib
 import json
+import queue
 import re
-import copy
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
+from typing import Optional, Tuple, Type  # noqa
 
 from freshmaker import conf, log, db, models, events
-from freshmaker.kojiservice import koji_service, parse_NVR
+from freshmaker.kojiservice import KojiService, koji_service, parse_NVR
 from freshmaker.models import ArtifactBuildState
 from freshmaker.types import EventState
 from freshmaker.models import ArtifactBuild, Event
@@ -146,6 +149,23 @@ class BaseHandler(object):
     # have the same order value, they can be called in any random order.
     order = 50
 
+    # Tuple of event classes this handler can possibly handle. The consumer
+    # calls `can_handle` only for the events of these types (including their
+    # subclasses). None means `can_handle` is called for every event.
+    event_types = None  # type: Optional[Tuple[Type[events.BaseEvent], ...]]
+
+    # Compiled allowlist/blocklist rules and memoized allow_build verdicts
+    # shared by all handlers. Both are dropped once the configuration of
+    # the rules is replaced.
+    _allow_build_cache = {
+        "allowlist": None,
+        "blocklist": None,
+        "rules": {},
+        "verdicts": {},
+    }  # type: dict
+    # Maximum number of memoized allow_build verdicts.
+    _allow_build_cache_size = 10000
+
     def __init__(self):
         self._db_event_id = None
         self._db_artifact_build_id = None
@@ -308,12 +328,14 @@ class BaseHandler(object):
         db.session.commit()
         return build
 
-    def _match_allow_build_rule(self, criteria, rule):
+    @classmethod
+    def _compile_allow_build_rule(cls, rule):
         """
-        Returns True if the build criteria matches the rule.
+        Compiles the allowlist or blocklist rule from the Freshmaker
+        configuration to an immutable tree of tuples with pre-compiled
+        regular expressions, which can be evaluated by
+        ``_match_compiled_allow_build_rule``.
 
-        :param dict criteria: key-val criteria defining all the attributes of
-            an artifact which is considered for rebuild.
         :param dict or list of dicts rule: Rule from the Freshmaker
             configuration. It can be list or dict:
 
@@ -329,61 +351,144 @@ class BaseHandler(object):
             Such list is constructed by freshmaker.config's any_() and all_()
             methods. The operator name is either "any" or "all".
 
-            If "any" is used, this method returns True if *any* dict in list
-            after the operator name matches the criteria.
+            If "any" is used, the compiled rule matches the criteria if *any*
+            dict in list after the operator name matches the criteria.
 
-            If "all" is used, this method returns True if *all* dicts in list
-            after the operator name matches the criteria.
-        :rtype: bool
-        :return: True if the criteria matches the rule.
+            If "all" is used, the compiled rule matches the criteria if *all*
+            dicts in list after the operator name matches the criteria.
+        :rtype: tuple
+        :return: Compiled rule, either ("any"/"all", (subrules, ...)) or
+            ("dict", frozenset(keys), ((key, (regexes, ...)), ...)).
+        :raises re.error: If the rule contains invalid regular expression.
         """
-        # If rule is list, check each item (which should be a dict) separately
-        # and return True if any item matches. Support also tuples for
-        # convenience.
+        # If rule is list, compile each item (which should be a dict)
+        # separately. Support also tuples for convenience.
         if isinstance(rule, list):
             if not rule:
-                return False
+                return ("any", ())
 
             if not isinstance(rule[0], str):
                 raise TypeError(
                     "Rule does not have any operator, use any_() or all_() "
                     "methods to construct the rule: %r" % rule)
 
-            if rule[0] == "any":
-                operator = any
-            elif rule[0] == "all":
-                operator = all
-            else:
+            if rule[0] not in ("any", "all"):
                 raise ValueError(
                     "Invalid operator %s in rule: %r." % (rule[0], rule))
 
-            return operator([
-                self._match_allow_build_rule(criteria, subrule)
-                for subrule in rule[1]])
+            return (rule[0], tuple(
+                cls._compile_allow_build_rule(subrule) for subrule in rule[1]))
 
         if not isinstance(rule, dict):
             raise TypeError(
                 "Rebuild rule must be dict or list, got %r." % rule)
 
-        # If none of passed criteria matches configured rule, build is not allowed
-        if not (set(rule.keys()) & set(criteria.keys())):
-            return False
-
-        # For each key-val of artifact to rebuild, check if it matches
-        # the key-val of rule. If the key-val is not in the rule, it means
-        # the configuration does not care about the value.
-        for key, value in criteria.items():
-            value_patterns = rule.get(key, None)
+        patterns = []
+        for key, value_patterns in rule.items():
             if value_patterns is None:
                 continue
 
             if not isinstance(value_patterns, (tuple, list)):
                 value_patterns = [str(value_patterns)]
 
-            if not any((re.match(regex, str(value)) for regex in value_patterns)):
+            patterns.append(
+                (key, tuple(re.compile(regex) for regex in value_patterns)))
+        return ("dict", frozenset(rule.keys()), tuple(patterns))
+
+    @classmethod
+    def _match_compiled_allow_build_rule(cls, criteria, rule):
+        """
+        Returns True if the build criteria matches the compiled rule.
+
+        :param dict criteria: key-val criteria defining all the attributes of
+            an artifact which is considered for rebuild.
+        :param tuple rule: Rule compiled by ``_compile_allow_build_rule``.
+        :rtype: bool
+        :return: True if the criteria matches the rule.
+        """
+        if rule[0] == "any":
+            return any(
+                cls._match_compiled_allow_build_rule(criteria, subrule)
+                for subrule in rule[1])
+        if rule[0] == "all":
+            return all(
+                cls._match_compiled_allow_build_rule(criteria, subrule)
+                for subrule in rule[1])
+
+        _, keys, patterns = rule
+        # If none of passed criteria matches configured rule, build is not allowed
+        if keys.isdisjoint(criteria):
+            return False
+
+        # For each key-val of rule, check if it matches the key-val of
+        # artifact to rebuild. If the key-val is not in the criteria, it means
+        # the configuration does not care about the value.
+        for key, regexes in patterns:
+            if key not in criteria:
+                continue
+
+            value = str(criteria[key])
+            if not any(regex.match(value) for regex in regexes):
                 return False
         return True
 
+    def _get_compiled_allow_build_rules(self, artifact_type):
+        """
+        Returns the compiled allowlist and blocklist rules of this handler
+        for `artifact_type`.
+
+        The rules are compiled only once and kept until the
+        HANDLER_BUILD_ALLOWLIST or HANDLER_BUILD_BLOCKLIST configuration is
+        replaced, which also invalidates all the memoized verdicts.
+
+        :param artifact_type: an enum member of ArtifactType.
+        :rtype: tuple
+        :return: tuple (allowlist, blocklist, allowlist_rule) with the
+            compiled rules and the allowlist rule as configured, which is
+            logged for the allowed builds.
+        """
+        allowlist_conf = conf.handler_build_allowlist
+        blocklist_conf = conf.handler_build_blocklist
+        cache = BaseHandler._allow_build_cache
+        if (cache["allowlist"] is not allowlist_conf or
+                cache["blocklist"] is not blocklist_conf):
+            cache["allowlist"] = allowlist_conf
+            cache["blocklist"] = blocklist_conf
+            cache["rules"] = {}
+            cache["verdicts"] = {}
+
+        handler_name = self.name
+        artifact_name = artifact_type.name.lower()
+        key = (handler_name, artifact_name)
+        rules = cache["rules"].get(key)
+        if rules is not None:
+            return rules
+
+        # Global rules overridden by this handler rules
+        allowlist_rules = dict(allowlist_conf.get("global", {}))
+        allowlist_rules.update(allowlist_conf.get(handler_name, {}))
+        blocklist_rules = dict(blocklist_conf.get("global", {}))
+        blocklist_rules.update(blocklist_conf.get(handler_name, {}))
+
+        allowlist_rule = allowlist_rules.get(artifact_name, [])
+        try:
+            rules = (
+                self._compile_allow_build_rule(allowlist_rule),
+                self._compile_allow_build_rule(blocklist_rules.get(artifact_name, [])),
+                allowlist_rule,
+            )
+        except re.error as exc:
+            err_msg = ("Error while compiling whilelist rule "
+                       "for <handler(%s) artifact(%s)>:\n"
+                       "Incorrect regular expression: %s\n"
+                       "Allowlist will not take effect" %
+                       (handler_name, artifact_name, str(exc)))
+            self.log_error(err_msg)
+            raise UnprocessableEntity(err_msg)
+
+        cache["rules"][key] = rules
+        return rules
+
     def allow_build(self, artifact_type, **criteria):
         """
         Check whether the artifact is allowed to be built by checking
@@ -398,40 +503,34 @@ class BaseHandler(object):
         :return: True if build is allowed, otherwise False is returned.
         :rtype: bool
         """
-        # Global rules
-        allowlist_rules = copy.deepcopy(
-            conf.handler_build_allowlist.get("global", {}))
-        blocklist_rules = copy.deepcopy(
-            conf.handler_build_blocklist.get("global", {}))
-
-        # This handler rules
-        handler_name = self.name
-        allowlist_rules.update(conf.handler_build_allowlist.get(handler_name, {}))
-        blocklist_rules.update(conf.handler_build_blocklist.get(handler_name, {}))
+        allowlist, blocklist, allowlist_rule = self._get_compiled_allow_build_rules(
+            artifact_type)
+        artifact_name = artifact_type.name.lower()
 
+        verdicts = BaseHandler._allow_build_cache["verdicts"]
         try:
-            allowlist = allowlist_rules.get(artifact_type.name.lower(), [])
-            if self._match_allow_build_rule(criteria, allowlist):
-                blocklist = blocklist_rules.get(artifact_type.name.lower(), [])
-                if self._match_allow_build_rule(criteria, blocklist):
-                    self.log_debug('%r, type=%r is blocked.',
-                                   criteria, artifact_type.name.lower())
-                    return False
-                self.log_debug('%r, type=%r is allowed.',
-                               criteria, artifact_type.name.lower())
-                self.log_debug('name=%r, allowlist=%r', handler_name, allowlist)
-                return True
-        except re.error as exc:
-            err_msg = ("Error while compiling whilelist rule "
-                       "for <handler(%s) artifact(%s)>:\n"
-                       "Incorrect regular expression: %s\n"
-                       "Allowlist will not take effect" %
-                       (handler_name, artifact_type.name.lower(), str(exc)))
-            self.log_error(err_msg)
-            raise UnprocessableEntity(err_msg)
-
-        self.log_debug('%r, type=%r is not allowed.',
-                       criteria, artifact_type.name.lower())
+            key = (self.name, artifact_name, tuple(sorted(criteria.items())))
+            verdict = verdicts.get(key)
+        except TypeError:
+            # Some of the criteria values are not hashable.
+            key = verdict = None
+
+        if verdict is None:
+            if not self._match_compiled_allow_build_rule(criteria, allowlist):
+                verdict = "not allowed"
+            elif self._match_compiled_allow_build_rule(criteria, blocklist):
+                verdict = "blocked"
+            else:
+                verdict = "allowed"
+            if key is not None:
+                if len(verdicts) >= self._allow_build_cache_size:
+                    verdicts.clear()
+                verdicts[key] = verdict
+
+        self.log_debug('%r, type=%r is %s.', criteria, artifact_name, verdict)
+        if verdict == "allowed":
+            self.log_debug('name=%r, allowlist=%r', self.name, allowlist_rule)
+            return True
         return False
 
 
@@ -442,7 +541,7 @@ class ContainerBuildHandler(BaseHandler):
                         repo_urls=None, flatpak=False, isolated=False,
                         release=None, koji_parent_build=None,
                         arch_override=None, compose_ids=None,
-                        operator_csv_modifications_url=None):
+                        operator_csv_modifications_url=None, service=None):
         """
         Build a container in Koji.
 
@@ -457,12 +556,18 @@ class ContainerBuildHandler(BaseHandler):
         :param str arch_override: refer to ``KojiService.build_container``.
         :param list[int] compose_ids: refer to ``KojiService.build_container``.
         :param str operator_csv_modifications_url: refer to ``KojiService.build_container``.
+        :param KojiService service: Logged in KojiService to use. If not set,
+            new Koji session is opened just for this build.
         :return: task id returned from Koji buildContainer API.
         :rtype: int
         """
-        with koji_service(
-                profile=conf.koji_profile, logger=log,
-                dry_run=self.dry_run) as service:
+        if service is None:
+            service_context = koji_service(
+                profile=conf.koji_profile, logger=log, dry_run=self.dry_run)
+        else:
+            service_context = contextlib.nullcontext(service)
+
+        with service_context as service:
             log.info('Building container from source: %s, '
                      'release=%r, parent=%r, target=%r, arch=%r, compose_ids=%r',
                      scm_url, release, koji_parent_build, target, arch_override,
@@ -483,53 +588,49 @@ class ContainerBuildHandler(BaseHandler):
                 operator_csv_modifications_url=operator_csv_modifications_url,
             )
 
-    @fail_artifact_build_on_handler_exception(allowlist=[ODCSComposeNotReady])
-    def build_image_artifact_build(self, build, repo_urls=None):
+    def _check_image_artifact_build_state(self, build):
         """
-        Submits ArtifactBuild of 'image' type to Koji.
+        Checks that the ArtifactBuild of 'image' type can be submitted to Koji.
 
         :param build: ArtifactBuild of 'image' type.
-        :param list[str] repo_urls: list of YUM repository URLs that will be
-            passed to the ``buildContainer`` eventually as a build option.
-        :return: Koji build id.
-        :rtype: int
+        :return: True if the build can be submitted, False if it has been
+            moved to the FAILED state.
+        :rtype: bool
         """
         if build.state != ArtifactBuildState.PLANNED.value:
             build.transition(
                 ArtifactBuildState.FAILED.value,
                 "Container image build is not in PLANNED state.")
-            return
+            return False
 
         if not build.build_args:
             build.transition(
                 ArtifactBuildState.FAILED.value,
                 "Container image does not have 'build_args' filled in.")
-            return
+            return False
 
         if not build.original_nvr:
             build.transition(
                 ArtifactBuildState.FAILED.value,
                 "Container image does not have original_nvr set.")
-            return
+            return False
 
-        # If this is a bundle rebuild, check original build's OpenShift versions
-        # range, if its value is invalid, the build system can still rebuild it,
-        # but the rebuilt image will be an invalid bundle image, so we just fail
-        # it before submitting the build task.
-        build_bundle_event_types = (events.BotasErrataShippedEvent, events.ManualBundleRebuild)
-        # check ocp versions range of
-        if build.event.event_type in build_bundle_event_types:
-            with koji_service(
-                    profile=conf.koji_profile, logger=log,
-                    dry_run=self.dry_run, login=False
-            ) as service:
-                ocp_versions_range = service.get_ocp_versions_range(build.original_nvr)
-                if ocp_versions_range and not is_valid_ocp_versions_range(ocp_versions_range):
-                    build.transition(
-                        ArtifactBuildState.FAILED.value,
-                        "Original image has invalid openshift versions range")
-                    return
+        return True
+
+    def _prepare_image_artifact_build(self, build, repo_urls=None):
+        """
+        Gathers everything needed to submit the ArtifactBuild of 'image' type
+        to Koji from the database.
 
+        :param build: ArtifactBuild of 'image' type.
+        :param list[str] repo_urls: list of YUM repository URLs that will be
+            passed to the ``buildContainer`` eventually as a build option.
+        :return: dict with following keys: "compose_ids" - ODCS composes
+            which must be generated before the submission, "rebuilt_nvr" - new
+            NVR of the build, "container_args" and "container_kwargs" - args
+            and kwargs for ``build_container``.
+        :rtype: dict
+        """
         args = json.loads(build.build_args)
         scm_url = "%s/%s#%s" % (conf.git_base_url, args["repository"],
                                 args["commit"])
@@ -561,20 +662,104 @@ class ContainerBuildHandler(BaseHandler):
         if args.get("renewed_odcs_compose_ids"):
             compose_ids += args["renewed_odcs_compose_ids"]
 
+        rebuilt_nvr = get_rebuilt_nvr(build.type, build.original_nvr)
+
+        return {
+            "compose_ids": compose_ids,
+            "rebuilt_nvr": rebuilt_nvr,
+            "container_args": (scm_url, branch, target),
+            "container_kwargs": {
+                "repo_urls": repo_urls,
+                "flatpak": flatpak,
+                "isolated": isolated,
+                "release": parse_NVR(rebuilt_nvr)["release"],
+                "koji_parent_build": parent,
+                "arch_override": arches,
+                "compose_ids": compose_ids,
+                "operator_csv_modifications_url": args.get("operator_csv_modifications_url"),
+            },
+        }
+
+    def _is_bundle_artifact_build(self, build):
+        """
+        Returns True if the ArtifactBuild is a rebuild of bundle image.
+        """
+        build_bundle_event_types = (events.BotasErrataShippedEvent, events.ManualBundleRebuild)
+        return build.event.event_type in build_bundle_event_types
+
+    def _check_ocp_versions_range(self, service, original_nvr):
+        """
+        Checks the OpenShift versions range of the original bundle build.
+
+        If the value is invalid, the build system can still rebuild it, but
+        the rebuilt image will be an invalid bundle image, so we just fail it
+        before submitting the build task.
+
+        :param KojiService service: KojiService used to query Koji.
+        :param str original_nvr: NVR of the original build.
+        :return: None if the range is valid, otherwise the reason why the
+            build should fail.
+        :rtype: str
+        """
+        ocp_versions_range = service.get_ocp_versions_range(original_nvr)
+        if ocp_versions_range and not is_valid_ocp_versions_range(ocp_versions_range):
+            return "Original image has invalid openshift versions range"
+        return None
+
+    def _check_odcs_composes(self, compose_ids):
+        """
+        Checks that all the ODCS composes are generated.
+
+        :param list[int] compose_ids: IDs of the ODCS composes.
+        :raises ODCSComposeNotReady: When some ODCS compose is not generated
+            yet.
+        """
         for compose_id in compose_ids:
             odcs_compose = self.odcs_get_compose(compose_id)
             if odcs_compose["state"] in [COMPOSE_STATES['wait'],
                                          COMPOSE_STATES['generating']]:
                 # In case the ODCS compose is still generating, raise an
                 # exception.
-                msg = ("Compose %s has not been generated yet. Waiting with "
-                       "rebuild." % (str(compose_id)))
-                self.log_info(msg)
-                raise ODCSComposeNotReady(msg)
+                raise ODCSComposeNotReady(
+                    "Compose %s has not been generated yet. Waiting with "
+                    "rebuild." % (str(compose_id)))
             # OSBS can renew a compose if it needs to, so we can just pass
             # it along without further verification for other states.
 
-        rebuilt_nvr = get_rebuilt_nvr(build.type, build.original_nvr)
+    @fail_artifact_build_on_handler_exception(allowlist=[ODCSComposeNotReady])
+    def build_image_artifact_build(self, build, repo_urls=None):
+        """
+        Submits ArtifactBuild of 'image' type to Koji.
+
+        :param build: ArtifactBuild of 'image' type.
+        :param list[str] repo_urls: list of YUM repository URLs that will be
+            passed to the ``buildContainer`` eventually as a build option.
+        :return: Koji build id.
+        :rtype: int
+        """
+        if not self._check_image_artifact_build_state(build):
+            return
+
+        # check ocp versions range of bundle images
+        if self._is_bundle_artifact_build(build):
+            with koji_service(
+                    profile=conf.koji_profile, logger=log,
+                    dry_run=self.dry_run, login=False
+            ) as service:
+                fail_reason = self._check_ocp_versions_range(service, build.original_nvr)
+            if fail_reason:
+                build.transition(ArtifactBuildState.FAILED.value, fail_reason)
+                return
+
+        submission = self._prepare_image_artifact_build(build, repo_urls)
+
+        try:
+            self._check_odcs_composes(submission["compose_ids"])
+        except ODCSComposeNotReady as e:
+            self.log_info(str(e))
+            raise
+
+        rebuilt_nvr = submission["rebuilt_nvr"]
         if build.rebuilt_nvr is not None:
             self.log_debug(
                 "Artifact build %s has rebuilt_nvr %s already. "
@@ -585,16 +770,7 @@ class ContainerBuildHandler(BaseHandler):
         db.session.commit()
 
         return self.build_container(
-            scm_url, branch, target,
-            repo_urls=repo_urls,
-            flatpak=flatpak,
-            isolated=isolated,
-            release=parse_NVR(build.rebuilt_nvr)["release"],
-            koji_parent_build=parent,
-            arch_override=arches,
-            compose_ids=compose_ids,
-            operator_csv_modifications_url=args.get("operator_csv_modifications_url"),
-        )
+            *submission["container_args"], **submission["container_kwargs"])
 
     def odcs_get_compose(self, compose_id):
         """
@@ -631,23 +807,229 @@ class ContainerBuildHandler(BaseHandler):
                 repo_urls.append(conf.image_extra_repo[name_version])
         return repo_urls
 
+    def _login_koji_service(self, service):
+        """
+        Logs in the KojiService used by ``_submit_image_artifact_build``
+        unless it is logged in already.
+        """
+        if self.dry_run or service.logged_in:
+            return
+        if not conf.krb_auth_principal:
+            log.error("Cannot login to Koji, krb_auth_principal not set")
+            return
+        log.debug('Logging into %s with Kerberos authentication.', service.server)
+        service.krb_login()
+
+    def _submit_image_artifact_build(self, services, build_info):
+        """
+        Submits single build prepared by ``_start_to_build_images_concurrently``
+        to Koji. This is called from the thread pool, so it must not touch
+        the database.
+
+        :param queue.Queue services: Queue of KojiService instances. Every
+            call takes one of them for its whole duration, so single Koji
+            session is never used by two threads at once.
+        :param dict build_info: The build to submit.
+        :return: tuple (result, value). The result is "submitted" with Koji
+            task id as value, "failed" with the reason of failure, "not_ready"
+            with the message about not generated ODCS compose or "error" with
+            the exception raised while submitting the build.
+        :rtype: tuple
+        """
+        service = services.get()
+        try:
+            self._login_koji_service(service)
+            if build_info["is_bundle"]:
+                fail_reason = self._check_ocp_versions_range(
+                    service, build_info["original_nvr"])
+                if fail_reason:
+                    return "failed", fail_reason
+            if build_info["error"] is not None:
+                return "error", build_info["error"]
+
+            submission = build_info["submission"]
+            self._check_odcs_composes(submission["compose_ids"])
+            task_id = self.build_container(
+                *submission["container_args"], service=service,
+                **submission["container_kwargs"])
+            return "submitted", task_id
+        except ODCSComposeNotReady as e:
+            return "not_ready", str(e)
+        except Exception as e:
+            log.exception("%sCannot submit the build.", build_info["log_prefix"])
+            return "error", e
+        finally:
+            services.put(service)
+
+    def _start_to_build_images_concurrently(self, builds, workers):
+        """
+        Submits the `builds` to Koji using the pool of `workers` threads.
+
+        The builds are processed in chunks of
+        ``conf.container_build_submission_chunk_size``. The database is read
+        and updated only from the current thread: each chunk is at first
+        prepared for the submission, then submitted by the thread pool and
+        then all the changes of the chunk are committed at once. Every thread
+        uses its own Koji session, so the Kerberos login is done once per
+        thread and not once per build.
+
+        :param builds: list of ArtifactBuild, each of them represents a
+            container image to be rebuilt.
+        :param int workers: Number of threads.
+        """
+        services = queue.Queue()
+        for i in range(workers):
+            services.put(KojiService(profile=conf.koji_profile, dry_run=self.dry_run))
+
+        chunk_size = max(1, conf.container_build_submission_chunk_size)
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for i in range(0, len(builds), chunk_size):
+                    chunk = builds[i:i + chunk_size]
+                    # Claim the builds in the order of their ids, so the
+                    # handlers claiming the same builds cannot deadlock.
+                    # The builds which are not PLANNED are not claimed and
+                    # are moved to the FAILED state by
+                    # _prepare_concurrent_image_build.
+                    lost_claims = set()
+                    for build in sorted(chunk, key=lambda build: build.id):
+                        if (build.state == ArtifactBuildState.PLANNED.value and
+                                not build.claim()):
+                            lost_claims.add(build.id)
+                    db.session.commit()
+
+                    build_infos = []
+                    for build in chunk:
+                        if build.id in lost_claims:
+                            continue
+                        build_info = self._prepare_concurrent_image_build(build)
+                        if build_info is not None:
+                            build_infos.append(build_info)
+
+                    results = executor.map(
+                        lambda build_info: self._submit_image_artifact_build(
+                            services, build_info),
+                        build_infos)
+
+                    for build_info, (result, value) in zip(build_infos, results):
+                        self._finish_concurrent_image_build(build_info, result, value)
+                    db.session.commit()
+        finally:
+            while not services.empty():
+                service = services.get()
+                if not self.dry_run and service.logged_in:
+                    log.debug('Logout Koji session')
+                    service.logout()
+
+    def _prepare_concurrent_image_build(self, build):
+        """
+        Prepares the `build` for ``_submit_image_artifact_build``.
+
+        :return: dict describing the build or None if the build cannot
+            be submitted and has been moved to FAILED state.
+        :rtype: dict
+        """
+        self.set_context(build)
+        if not self._check_image_artifact_build_state(build):
+            return None
+
+        build_info = {
+            "build": build,
+            "log_prefix": self._log_prefix,
+            "original_nvr": build.original_nvr,
+            "is_bundle": self._is_bundle_artifact_build(build),
+            "submission": None,
+            "error": None,
+        }
+        try:
+            repo_urls = self.get_repo_urls(build)
+            build_info["submission"] = self._prepare_image_artifact_build(build, repo_urls)
+        except Exception as e:
+            self.log_except("Cannot prepare the build for the submission.")
+            build_info["error"] = e
+        return build_info
+
+    def _finish_concurrent_image_build(self, build_info, result, value):
+        """
+        Updates the build according to the result of
+        ``_submit_image_artifact_build``. The changes are not committed.
+        """
+        build = build_info["build"]
+        self.set_context(build)
+        if result == "not_ready":
+            # We skip this image for now. It will be built once the ODCS
+            # compose is finished.
+            self.log_info(value)
+            build.release_claim()
+            return
+        elif result == "error":
+            build.transition(
+                ArtifactBuildState.FAILED.value,
+                "Handling of build failed with traceback: %s" % str(value))
+            return
+        elif result == "failed":
+            build.transition(ArtifactBuildState.FAILED.value, value)
+            return
+
+        rebuilt_nvr = build_info["submission"]["rebuilt_nvr"]
+        if build.rebuilt_nvr is not None:
+            self.log_debug(
+                "Artifact build %s has rebuilt_nvr %s already. "
+                "It will be replaced with a new one %s to be rebuilt.",
+                build, build.rebuilt_nvr, rebuilt_nvr)
+        build.rebuilt_nvr = rebuilt_nvr
+        build.build_id = value
+        if not build.build_id:
+            build.transition(
+                ArtifactBuildState.FAILED.value,
+                "Error while building container image in Koji.")
+        else:
+            build.transition(
+                ArtifactBuildState.BUILD.value,
+                "Building container image in Koji.")
+
     def start_to_build_images(self, builds):
         """Start to build images
 
+        Every PLANNED build is claimed by ``ArtifactBuild.claim`` before it
+        is submitted, so the builds submitted by the handler of another event
+        processed concurrently are skipped. The builds which are not PLANNED
+        are moved to the FAILED state.
+
+        When ``conf.container_build_submission_workers`` is higher than 1,
+        the builds are submitted concurrently, see
+        ``_start_to_build_images_concurrently``.
+
         :param builds: list of ArtifactBuild, each of them represents a
             container image to be rebuilt.
         :type builds: list or tuple
         """
+        workers = min(conf.container_build_submission_workers, len(builds))
+        if workers > 1:
+            self._start_to_build_images_concurrently(list(builds), workers)
+            return
 
         def build_image(build):
             self.set_context(build)
-            repo_urls = self.get_repo_urls(build)
+            # The build might be submitted by the handler of another event
+            # processed concurrently already. The builds which are not
+            # PLANNED are moved to the FAILED state by
+            # build_image_artifact_build.
+            if build.state == ArtifactBuildState.PLANNED.value:
+                claimed = build.claim()
+                db.session.commit()
+                if not claimed:
+                    return
+
             unknown_exception_occurred = False
             try:
+                repo_urls = self.get_repo_urls(build)
                 build.build_id = self.build_image_artifact_build(build, repo_urls)
             except ODCSComposeNotReady:
                 # We skip this image for now. It will be built once the ODCS
                 # compose is finished.
+                build.release_claim()
+                db.session.commit()
                 return
             except Exception:
                 self.log_except(
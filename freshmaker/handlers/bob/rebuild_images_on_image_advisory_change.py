@@ -35,6 +35,7 @@ from freshmaker.types import EventState, ArtifactType, ArtifactBuildState
 
 class RebuildImagesOnImageAdvisoryChange(ContainerBuildHandler):
     name = 'RebuildImagesOnImageAdvisoryChange'
+    event_types = (ErrataAdvisoryStateChangedEvent, ManualRebuildWithAdvisoryEvent)
 
     def can_handle(self, event):
         if (not isinstance(event, ErrataAdvisoryStateChangedEvent) and
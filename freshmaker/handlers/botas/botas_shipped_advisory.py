@@ -44,6 +44,7 @@ class HandleBotasAdvisory(ContainerBuildHandler):
     BOTAS to SHIPPED_LIVE state
     """
     name = "HandleBotasAdvisory"
+    event_types = (BotasErrataShippedEvent, ManualBundleRebuild)
     # This prefix should be added to event reason, when skipping the event.
     # Because Release Driver checks event's reason for certain prefixes,
     # to determine if there is an error in bundles processing.
@@ -186,6 +187,8 @@ class HandleBotasAdvisory(ContainerBuildHandler):
             len(all_bundles),
         )
 
+        bundles_by_related_digest = self._pyxis.get_related_image_digest_index(all_bundles)
+
         # A mapping of digests to bundle metadata. This metadata is used to
         # for the CSV metadata updates.
         bundle_mds_by_digest = {}
@@ -194,7 +197,7 @@ class HandleBotasAdvisory(ContainerBuildHandler):
         bundle_digests_by_related_nvr = {}
         for image_nvr, image_digest in original_digests_by_nvr.items():
             bundles = self._pyxis.get_bundles_by_related_image_digest(
-                image_digest, all_bundles
+                image_digest, bundles_by_related_digest
             )
             if not bundles:
                 log.info(f"No latest bundle image with the related image of {image_nvr}")
@@ -31,6 +31,7 @@ from freshmaker.kojiservice import koji_service
 class CancelEventOnFreshmakerManageRequest(BaseHandler):
     name = "CancelEventOnFreshmakerManageRequest"
     order = 0
+    event_types = (FreshmakerManageEvent, )
 
     def can_handle(self, event):
         if isinstance(event, FreshmakerManageEvent) and event.action == 'eventcancel':
@@ -37,6 +37,7 @@ class GenerateAdvisorySignedEventOnRPMSign(BaseHandler):
     """
 
     name = 'GenerateAdvisorySignedEventOnRPMSign'
+    event_types = (BrewSignRPMEvent, )
 
     def can_handle(self, event):
         return isinstance(event, BrewSignRPMEvent)
@@ -41,6 +41,7 @@ class UpdateDBOnAdvisoryChange(BaseHandler):
 
     name = 'UpdateDBOnAdvisoryChange'
     order = 0
+    event_types = (ErrataAdvisoryStateChangedEvent, )
 
     def can_handle(self, event):
         if not isinstance(event, ErrataAdvisoryStateChangedEvent):
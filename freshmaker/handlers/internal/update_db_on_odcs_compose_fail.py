@@ -35,6 +35,7 @@ class UpdateDBOnODCSComposeFail(BaseHandler):
 
     name = "UpdateDBOnODCSComposeFail"
     order = 0
+    event_types = (ODCSComposeStateChangeEvent, )
 
     def can_handle(self, event):
         if not isinstance(event, ODCSComposeStateChangeEvent):
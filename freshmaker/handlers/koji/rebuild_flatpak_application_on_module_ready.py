@@ -27,6 +27,7 @@ from freshmaker.events import FlatpakModuleAdvisoryReadyEvent
 
 class RebuildFlatpakApplicationOnModuleReady(ContainerBuildHandler):
     name = 'RebuildFlatpakApplicationOnModuleReady'
+    event_types = (FlatpakModuleAdvisoryReadyEvent, )
 
     def can_handle(self, event):
         return isinstance(event, FlatpakModuleAdvisoryReadyEvent)
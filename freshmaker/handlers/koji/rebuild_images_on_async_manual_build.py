@@ -27,7 +27,7 @@ from freshmaker.lightblue import LightBlue
 from freshmaker.handlers import ContainerBuildHandler, fail_event_on_handler_exception
 from freshmaker.events import FreshmakerAsyncManualBuildEvent
 from freshmaker.types import EventState
-from freshmaker.models import Event
+from freshmaker.models import ArtifactBuild, Event
 from freshmaker.kojiservice import koji_service
 from freshmaker.types import ArtifactBuildState, ArtifactType
 from freshmaker.utils import sorted_by_nvr
@@ -37,6 +37,7 @@ class RebuildImagesOnAsyncManualBuild(ContainerBuildHandler):
     """Rebuild images on async.manual.build"""
 
     name = 'RebuildImagesOnAsyncManualBuild'
+    event_types = (FreshmakerAsyncManualBuildEvent, )
 
     def can_handle(self, event):
         return isinstance(event, FreshmakerAsyncManualBuildEvent)
@@ -320,15 +321,12 @@ class RebuildImagesOnAsyncManualBuild(ContainerBuildHandler):
             those images stored into database.
         :rtype: dict
         """
-        # builds tracks all the builds we register in db
-        builds = {}
+        # Plan of the builds to record, {brew_build_nvr: plan item, ...}.
+        # All of them are recorded at once by ArtifactBuild.record_plan.
+        plan = {}
 
         for batch in batches:
             for image in batch:
-                # Reset context to db_event for each iteration before
-                # the ArtifactBuild is created.
-                self.set_context(db_event)
-
                 nvr = image["brew"]["build"]
 
                 self.log_debug("Recording %s", nvr)
@@ -351,37 +349,33 @@ class RebuildImagesOnAsyncManualBuild(ContainerBuildHandler):
                 else:
                     parent_nvr = lb.find_parent_brew_build_nvr_from_child(image)
 
-                dep_on = builds[parent_nvr] if parent_nvr in builds else None
-
-                # We don't need to rebuild the nvr this time. The release value
-                # will be automatically generated by OSBS.
-                build = self.record_build(
-                    self.event, image_name, ArtifactType.IMAGE,
-                    dep_on=dep_on,
-                    state=ArtifactBuildState.PLANNED.value,
-                    original_nvr=nvr)
-
-                # Set context to particular build so logging shows this build
-                # in case of error.
-                self.set_context(build)
+                dep_on = parent_nvr if parent_nvr in plan else None
 
                 image.resolve(lb)
-                build.transition(state, state_reason)
                 build_target = (
                     self.event.brew_target if self.event.brew_target else image["target"])
-                build.build_args = json.dumps({
-                    "repository": image["repository"],
-                    "commit": image["commit"],
-                    "original_parent": parent_nvr,
-                    "target": build_target,
-                    "branch": image["git_branch"],
-                    "arches": image["arches"],
-                    "flatpak": image.get("flatpak", False),
-                    "isolated": image.get("isolated", True),
-                })
-                db.session.commit()
-
-                builds[nvr] = build
+                # We don't need to rebuild the nvr this time. The release value
+                # will be automatically generated by OSBS.
+                plan[nvr] = {
+                    "name": image_name,
+                    "type": ArtifactType.IMAGE.value,
+                    "original_nvr": nvr,
+                    "dep_on": dep_on,
+                    "state": state,
+                    "state_reason": state_reason,
+                    "build_args": json.dumps({
+                        "repository": image["repository"],
+                        "commit": image["commit"],
+                        "original_parent": parent_nvr,
+                        "target": build_target,
+                        "branch": image["git_branch"],
+                        "arches": image["arches"],
+                        "flatpak": image.get("flatpak", False),
+                        "isolated": image.get("isolated", True),
+                    }),
+                }
+
+        builds = ArtifactBuild.record_plan(db.session, db_event, list(plan.values()))
 
         # Reset context to db_event.
         self.set_context(db_event)
@@ -36,6 +36,8 @@ __all__ = ('RebuildImagesOnODCSComposeDone',)
 class RebuildImagesOnODCSComposeDone(ContainerBuildHandler):
     """Start image rebuild with this compose containing included packages"""
 
+    event_types = (ODCSComposeStateChangeEvent, )
+
     def can_handle(self, event):
         if not isinstance(event, ODCSComposeStateChangeEvent):
             return False
@@ -41,6 +41,7 @@ class RebuildImagesOnParentImageBuild(ContainerBuildHandler):
     """Rebuild container when a dependecy container is built in Brew"""
 
     name = 'RebuildImagesOnParentImageBuild'
+    event_types = (BrewContainerTaskStateChangeEvent, )
 
     def can_handle(self, event):
         if not isinstance(event, BrewContainerTaskStateChangeEvent):
@@ -44,6 +44,7 @@ class RebuildImagesOnRPMAdvisoryChange(ContainerBuildHandler):
     """
 
     name = 'RebuildImagesOnRPMAdvisoryChange'
+    event_types = (ErrataAdvisoryRPMsSignedEvent, )
 
     def can_handle(self, event):
         if not isinstance(event, ErrataAdvisoryRPMsSignedEvent):
@@ -223,18 +224,15 @@ class RebuildImagesOnRPMAdvisoryChange(ContainerBuildHandler):
         # Used as tmp dict with {brew_build_nvr: ArtifactBuild, ...} mapping.
         builds = builds or {}
 
-        # Cache for ODCS pulp composes. Key is white-spaced, sorted, list
-        # of content_sets. Value is Compose database object.
-        odcs_cache = {}
+        # Plan of the builds to record, {brew_build_nvr: plan item, ...}.
+        # All of them are recorded at once by ArtifactBuild.record_plan.
+        plan = {}
+        images = {}
 
         for batch in batches:
             for image in batch:
-                # Reset context to db_event for each iteration before
-                # the ArtifactBuild is created.
-                self.set_context(db_event)
-
                 nvr = image.nvr
-                if nvr in builds:
+                if nvr in builds or nvr in plan:
                     self.log_debug("Skipping recording build %s, "
                                    "it is already in db", nvr)
                     continue
@@ -249,7 +247,14 @@ class RebuildImagesOnRPMAdvisoryChange(ContainerBuildHandler):
                 self.log_debug("Recording %s", nvr)
                 parent_nvr = image["parent"].nvr \
                     if "parent" in image and image["parent"] else None
-                dep_on = builds[parent_nvr] if parent_nvr in builds else None
+                if parent_nvr in plan:
+                    dep_on = parent_nvr
+                    dep_on_state = plan[parent_nvr]["state"]
+                elif parent_nvr in builds:
+                    dep_on = builds[parent_nvr]
+                    dep_on_state = dep_on.state
+                else:
+                    dep_on = None
 
                 if parent_nvr:
                     build = db_event.get_artifact_build_from_event_dependencies(parent_nvr)
@@ -260,7 +265,7 @@ class RebuildImagesOnRPMAdvisoryChange(ContainerBuildHandler):
                 if "error" in image and image["error"]:
                     state_reason = image["error"]
                     state = ArtifactBuildState.FAILED.value
-                elif dep_on and dep_on.state == ArtifactBuildState.FAILED.value:
+                elif dep_on and dep_on_state == ArtifactBuildState.FAILED.value:
                     # If this artifact build depends on a build which cannot
                     # be built by Freshmaker, mark this one as failed too.
                     state_reason = "Cannot build artifact, because its " \
@@ -281,94 +286,102 @@ class RebuildImagesOnRPMAdvisoryChange(ContainerBuildHandler):
                 else:
                     rebuild_reason = RebuildReason.DEPENDENCY.value
 
-                build = self.record_build(
-                    event, image_name, ArtifactType.IMAGE,
-                    dep_on=dep_on,
-                    state=ArtifactBuildState.PLANNED.value,
-                    original_nvr=nvr,
-                    rebuild_reason=rebuild_reason)
-
-                # Set context to particular build so logging shows this build
-                # in case of error.
-                self.set_context(build)
-
-                build.transition(state, state_reason)
-
-                build.build_args = json.dumps({
-                    "repository": image["repository"],
-                    "commit": image["commit"],
-                    "original_parent": parent_nvr,
-                    "target": image["target"],
-                    "branch": image["git_branch"],
-                    "arches": image["arches"],
-                    "renewed_odcs_compose_ids": image["original_odcs_compose_ids"],
-                    "flatpak": image.get("flatpak", False),
-                    "isolated": image.get("isolated", True),
-                })
-
-                db.session.commit()
-
-                if state != ArtifactBuildState.FAILED.value:
-                    # Store odcs pulp compose to build.
-                    # Also generate pulp repos in case the image is unpublished,
-                    # because in this case, we have to generate extra ODCS compose
-                    # with all the RPMs in the image anyway later. And OSBS works
-                    # in a way that we have to pass all the ODCS composes to it or
-                    # no ODCS compose at all.
-                    if image["generate_pulp_repos"] or not image["published"]:
-                        original_pulp_compose_sources = set()
-                        for compose_id in image["original_odcs_compose_ids"]:
-                            compose = self.odcs.get_compose(compose_id)
-                            source_type = compose.get("source_type")
-                            # source_type of pulp composes is 4
-                            if source_type != 4:
-                                continue
-                            source_value = compose.get("source", "")
-                            for source in source_value.split():
-                                original_pulp_compose_sources.add(source.strip())
-
-                        # Add content set to new_pulp_sources if it's not found
-                        # in original_pulp_compose_sources
-                        new_pulp_sources = set()
-                        for content_set in image["content_sets"]:
-                            if content_set not in original_pulp_compose_sources:
-                                new_pulp_sources.add(content_set)
-
-                        if new_pulp_sources:
-                            # Check if the compose for these new pulp sources is
-                            # already cached and use it in this case.
-                            cache_key = " ".join(sorted(new_pulp_sources))
-                            if cache_key in odcs_cache:
-                                db_compose = odcs_cache[cache_key]
+                plan[nvr] = {
+                    "name": image_name,
+                    "type": ArtifactType.IMAGE.value,
+                    "original_nvr": nvr,
+                    "dep_on": dep_on,
+                    "state": state,
+                    "state_reason": state_reason,
+                    "rebuild_reason": rebuild_reason,
+                    "build_args": json.dumps({
+                        "repository": image["repository"],
+                        "commit": image["commit"],
+                        "original_parent": parent_nvr,
+                        "target": image["target"],
+                        "branch": image["git_branch"],
+                        "arches": image["arches"],
+                        "renewed_odcs_compose_ids": image["original_odcs_compose_ids"],
+                        "flatpak": image.get("flatpak", False),
+                        "isolated": image.get("isolated", True),
+                    }),
+                }
+                images[nvr] = image
+
+        recorded_builds = ArtifactBuild.record_plan(
+            db.session, db_event, list(plan.values()))
+
+        # Cache for ODCS pulp composes. Key is white-spaced, sorted, list
+        # of content_sets. Value is Compose database object.
+        odcs_cache = {}
+
+        for nvr, build in recorded_builds.items():
+            image = images[nvr]
+
+            # Set context to particular build so logging shows this build
+            # in case of error.
+            self.set_context(build)
+
+            if build.state != ArtifactBuildState.FAILED.value:
+                # Store odcs pulp compose to build.
+                # Also generate pulp repos in case the image is unpublished,
+                # because in this case, we have to generate extra ODCS compose
+                # with all the RPMs in the image anyway later. And OSBS works
+                # in a way that we have to pass all the ODCS composes to it or
+                # no ODCS compose at all.
+                if image["generate_pulp_repos"] or not image["published"]:
+                    original_pulp_compose_sources = set()
+                    for compose_id in image["original_odcs_compose_ids"]:
+                        compose = self.odcs.get_compose(compose_id)
+                        source_type = compose.get("source_type")
+                        # source_type of pulp composes is 4
+                        if source_type != 4:
+                            continue
+                        source_value = compose.get("source", "")
+                        for source in source_value.split():
+                            original_pulp_compose_sources.add(source.strip())
+
+                    # Add content set to new_pulp_sources if it's not found
+                    # in original_pulp_compose_sources
+                    new_pulp_sources = set()
+                    for content_set in image["content_sets"]:
+                        if content_set not in original_pulp_compose_sources:
+                            new_pulp_sources.add(content_set)
+
+                    if new_pulp_sources:
+                        # Check if the compose for these new pulp sources is
+                        # already cached and use it in this case.
+                        cache_key = " ".join(sorted(new_pulp_sources))
+                        if cache_key in odcs_cache:
+                            db_compose = odcs_cache[cache_key]
+                        else:
+                            compose = self.odcs.prepare_pulp_repo(
+                                build, list(new_pulp_sources))
+
+                            if build.state != ArtifactBuildState.FAILED.value:
+                                db_compose = Compose(odcs_compose_id=compose['id'])
+                                db.session.add(db_compose)
+                                db.session.flush()
+                                odcs_cache[cache_key] = db_compose
                             else:
-                                compose = self.odcs.prepare_pulp_repo(
-                                    build, list(new_pulp_sources))
-
-                                if build.state != ArtifactBuildState.FAILED.value:
-                                    db_compose = Compose(odcs_compose_id=compose['id'])
-                                    db.session.add(db_compose)
-                                    db.session.commit()
-                                    odcs_cache[cache_key] = db_compose
-                                else:
-                                    db_compose = None
-                                    db.session.commit()
-                            if db_compose:
-                                build.add_composes(db.session, [db_compose])
-                                db.session.commit()
-
-                    # Unpublished images can contain unreleased RPMs, so generate
-                    # the ODCS compose with all the RPMs in the image to allow
-                    # installation of possibly unreleased RPMs.
-                    if not image["published"]:
-                        compose = self.odcs.prepare_odcs_compose_with_image_rpms(image)
-                        if compose:
-                            db_compose = Compose(odcs_compose_id=compose['id'])
-                            db.session.add(db_compose)
-                            db.session.commit()
+                                db_compose = None
+                        if db_compose:
                             build.add_composes(db.session, [db_compose])
-                            db.session.commit()
 
-                builds[nvr] = build
+                # Unpublished images can contain unreleased RPMs, so generate
+                # the ODCS compose with all the RPMs in the image to allow
+                # installation of possibly unreleased RPMs.
+                if not image["published"]:
+                    compose = self.odcs.prepare_odcs_compose_with_image_rpms(image)
+                    if compose:
+                        db_compose = Compose(odcs_compose_id=compose['id'])
+                        db.session.add(db_compose)
+                        db.session.flush()
+                        build.add_composes(db.session, [db_compose])
+
+            builds[nvr] = build
+
+        db.session.commit()
 
         # Reset context to db_event.
         self.set_context(db_event)
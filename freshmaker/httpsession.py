@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026  Red Hat, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Shared HTTP sessions for the external services Freshmaker talks to.
+
+Every service (LightBlue, Pyxis, Errata, Pulp, ...) gets a single
+`requests.Session` shared by all threads. The session keeps the TCP/TLS
+connections alive in a connection pool and keeps the cookies. The
+authentication object is kept separately for every thread, because the
+Kerberos authentication keeps the state of the negotiation with every
+host and therefore cannot be used by several threads at once.
+"""
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import AuthBase
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from freshmaker import conf
+from freshmaker.monitor import (
+    http_requests_counter, http_new_connections_counter)
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def _counting_pool_class(pool_class, service):
+    """
+    Returns subclass of urllib3 `pool_class` counting newly opened
+    connections to `service`.
+    """
+    class CountingConnectionPool(pool_class):
+        def _new_conn(self):
+            http_new_connections_counter.labels(service=service).inc()
+            return super(CountingConnectionPool, self)._new_conn()
+
+    return CountingConnectionPool
+
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter counting requests and new connections for `service`.
+
+    Number of reused connections is the difference between the
+    `http_requests` and `http_new_connections` metrics of the service.
+    """
+
+    def __init__(self, service, pool_size):
+        self.service = service
+        super(PooledHTTPAdapter, self).__init__(
+            pool_connections=pool_size, pool_maxsize=pool_size)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super(PooledHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool_class(HTTPConnectionPool, self.service),
+            "https": _counting_pool_class(HTTPSConnectionPool, self.service),
+        }
+
+    def send(self, request, *args, **kwargs):
+        http_requests_counter.labels(service=self.service).inc()
+        return super(PooledHTTPAdapter, self).send(request, *args, **kwargs)
+
+
+class ThreadLocalAuth(AuthBase):
+    """
+    Authentication delegating every request to the authentication object
+    of the current thread, created by `auth` when the thread sends its
+    first request.
+    """
+
+    def __init__(self, auth):
+        """
+        :param callable auth: Function returning new authentication object.
+        """
+        self.auth = auth
+        self._local = threading.local()
+
+    def get_auth(self):
+        """
+        Returns the authentication object of the current thread.
+        """
+        auth = getattr(self._local, "auth", None)
+        if auth is None:
+            auth = self._local.auth = self.auth()
+        return auth
+
+    def __call__(self, request):
+        return self.get_auth()(request)
+
+
+def get_pool_size(service):
+    """
+    Returns the maximum number of connections kept open to `service`.
+    """
+    return conf.http_pool_sizes.get(service, conf.max_thread_workers)
+
+
+def get_session(service, auth=None):
+    """
+    Returns the `requests.Session` shared by all threads for `service`.
+
+    :param str service: Name of the service, for example "pyxis".
+    :param callable auth: Function returning the authentication object
+        (for example ``HTTPKerberosAuth``) to use for every request sent by
+        the session. It is called once for every thread using the session,
+        see `ThreadLocalAuth`.
+    :return: Shared session.
+    :rtype: requests.Session
+    """
+    session = _sessions.get(service)
+    if session is not None:
+        return session
+
+    with _sessions_lock:
+        session = _sessions.get(service)
+        if session is not None:
+            return session
+
+        session = requests.Session()
+        adapter = PooledHTTPAdapter(service, get_pool_size(service))
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        if auth is not None:
+            session.auth = ThreadLocalAuth(auth)
+        _sessions[service] = session
+        return session
+
+
+def close_session(service):
+    """
+    Closes the shared session of `service` including all its connections.
+    The next call of `get_session` creates new session.
+
+    This is useful when the authentication context stored in the session
+    is no longer valid.
+    """
+    with _sessions_lock:
+        session = _sessions.pop(service, None)
+    if session is not None:
+        session.close()
@@ -34,11 +34,12 @@ import contextlib
 import dogpile.cache
 import re
 import requests
+import threading
 import freshmaker.utils
 from freshmaker import log, conf, db
 from freshmaker.consumer import work_queue_put
 from freshmaker.events import BrewContainerTaskStateChangeEvent
-from freshmaker.models import ArtifactBuild
+from freshmaker.models import ArtifactBuild, KojiBuildMetadata
 
 
 class KojiService(object):
@@ -54,6 +55,7 @@ class KojiService(object):
 
     # Used to generate incremental task id in dry run mode.
     _FAKE_TASK_ID = 0
+    _FAKE_TASK_ID_LOCK = threading.Lock()
 
     def __init__(self, profile=None, dry_run=False):
         self._config = koji.read_config(profile or 'koji')
@@ -123,8 +125,9 @@ class KojiService(object):
                  (source_url, build_target, build_opts))
 
         # Get the task_id
-        KojiService._FAKE_TASK_ID -= 1
-        task_id = KojiService._FAKE_TASK_ID
+        with KojiService._FAKE_TASK_ID_LOCK:
+            KojiService._FAKE_TASK_ID -= 1
+            task_id = KojiService._FAKE_TASK_ID
 
         # Parse the source_url to get the name of container and generate
         # fake event.
@@ -234,6 +237,77 @@ class KojiService(object):
     def get_task_request(self, task_id):
         return self.session.getTaskRequest(task_id)
 
+    def multicall(self, calls):
+        """
+        Calls multiple Koji API methods at once using the Koji multicall,
+        so they are sent to Koji in single round-trip (or few of them in
+        case there are more than ``conf.koji_multicall_batch_size`` calls).
+
+        :param list calls: List of (method, args) or (method, args, kwargs)
+            tuples describing the calls, for example
+            ``[("getBuild", ("foo-1-1", )), ("listArchives", (), {"buildID": 1})]``.
+        :return: List with the result of every call in the same order as
+            the `calls`. If the call fails, the exception raised by Koji is
+            returned as its result instead of being raised, so the failure
+            does not affect the other calls.
+        :rtype: list
+        """
+        if not calls:
+            return []
+
+        with self.session.multicall(
+                strict=False, batch=conf.koji_multicall_batch_size) as m:
+            virtual_calls = []
+            for call in calls:
+                method, args = call[0], call[1]
+                kwargs = call[2] if len(call) > 2 else {}
+                virtual_calls.append(getattr(m, method)(*args, **kwargs))
+
+        results = []
+        for virtual_call in virtual_calls:
+            try:
+                results.append(virtual_call.result)
+            except (koji.GenericError, koji.Fault) as e:
+                results.append(e)
+        return results
+
+    def get_builds(self, buildinfos):
+        """
+        Returns information about multiple builds in single Koji multicall.
+        See ``get_build`` and ``multicall``.
+
+        :param list buildinfos: List of build IDs, NVRs or maps.
+        :return: List of builds in the same order as `buildinfos`.
+        :rtype: list
+        """
+        return self.multicall([("getBuild", (buildinfo, )) for buildinfo in buildinfos])
+
+    def get_task_infos(self, task_ids):
+        """
+        Returns information about multiple tasks in single Koji multicall.
+        See ``get_task_info`` and ``multicall``.
+
+        :param list task_ids: List of task IDs.
+        :return: List of tasks in the same order as `task_ids`.
+        :rtype: list
+        """
+        return self.multicall([("getTaskInfo", (task_id, )) for task_id in task_ids])
+
+    def list_builds_archives(self, build_ids, archive_type=None):
+        """
+        Returns archives of multiple builds in single Koji multicall.
+        See ``list_archives`` and ``multicall``.
+
+        :param list build_ids: List of build IDs.
+        :param str archive_type: Type of the archives to return.
+        :return: List with the list of archives of every build in the same
+            order as `build_ids`.
+        :rtype: list
+        """
+        return self.multicall([
+            ("listArchives", (build_id, ), {"type": archive_type})
+            for build_id in build_ids])
+
     def get_build_target(self, target_name):
         return self.session.getBuildTarget(target_name)
 
@@ -332,12 +406,17 @@ class KojiService(object):
 
         Return a list of compose ids
         """
+        cached = KojiBuildMetadata.get_cached(build_nvr, "odcs_compose_ids")
+        if cached is not None and cached[1] is None:
+            return cached[0]
+
         build = self.get_build(build_nvr)
         # Get the list of ODCS composes used to build the image.
         extra_image = build.get("extra", {}).get("image", {})
         compose_ids = extra_image.get("odcs", {}).get("compose_ids")
         if not compose_ids:
             compose_ids = []
+        KojiBuildMetadata.set_cached(build_nvr, "odcs_compose_ids", compose_ids)
         return compose_ids
 
     @region.cache_on_arguments()
@@ -349,6 +428,10 @@ class KojiService(object):
         :return: OpenShift versions range of image.
         :rtype: str
         """
+        cached = KojiBuildMetadata.get_cached(build_nvr, "ocp_versions_range")
+        if cached is not None and cached[1] is None:
+            return cached[0]
+
         ocp_versions_range = None
 
         build = self.get_build(build_nvr)
@@ -365,6 +448,7 @@ class KojiService(object):
             if ocp_versions_range is not None:
                 break
 
+        KojiBuildMetadata.set_cached(build_nvr, "ocp_versions_range", ocp_versions_range)
         return ocp_versions_range
 
 
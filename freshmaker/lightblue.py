@@ -35,9 +35,10 @@ from http import HTTPStatus
 from itertools import groupby
 
 from freshmaker import log, conf
+from freshmaker.httpsession import get_session
 from freshmaker.kojiservice import koji_service
-from freshmaker.models import ArtifactBuild
-from freshmaker.utils import sorted_by_nvr, is_pkg_modular
+from freshmaker.models import ArtifactBuild, KojiBuildMetadata
+from freshmaker.utils import sorted_by_nvr, is_pkg_modular, NVR
 from freshmaker.utils import retry
 import koji
 
@@ -211,110 +212,245 @@ class ContainerImage(dict):
         "commit", "target" and "git_branch".
 
         In case of lookup error, the "error" will be set to error string.
+
+        The result is cached in the database, because it never changes for
+        the already finished build.
+        """
+        data = cls._get_cached_additional_data(nvr)
+        if data is not None:
+            return data
+
+        try:
+            data = cls._query_additional_data_from_koji(nvr)
+        except KojiLookupError as e:
+            KojiBuildMetadata.set_cached(nvr, "additional_data", error=str(e))
+            raise
+        KojiBuildMetadata.set_cached(nvr, "additional_data", data)
+        return data
+
+    @classmethod
+    def get_additional_data_from_koji_multi(cls, nvrs):
+        """
+        Batch variant of `get_additional_data_from_koji`. The builds which are
+        not cached in the database are queried using two Koji multicalls, no
+        matter how many of them there are.
+
+        :param list nvrs: NVRs of the builds.
+        :return: Dict with NVR as a key and the additional data as a value.
+            When the lookup of some build fails, the value is the exception
+            which would be raised by `get_additional_data_from_koji`.
+        :rtype: dict
+        """
+        ret = {}
+        to_query = []
+        for nvr in nvrs:
+            if nvr in ret:
+                continue
+            try:
+                data = cls._get_cached_additional_data(nvr)
+            except KojiLookupError as e:
+                data = e
+            if data is None:
+                to_query.append(nvr)
+                data = cls._get_default_additional_data()
+            ret[nvr] = data
+        if not to_query:
+            return ret
+
+        with koji_service(
+                conf.koji_profile, log, dry_run=conf.dry_run,
+                login=False) as session:
+            queried = []
+            calls = []
+            for nvr, build in zip(to_query, session.get_builds(to_query)):
+                try:
+                    if isinstance(build, Exception):
+                        raise build
+                    cls._parse_koji_build(nvr, build, ret[nvr])
+                except Exception as e:
+                    ret[nvr] = e
+                    continue
+                queried.append((nvr, build))
+                calls.append(("getTaskRequest", (build["task_id"], )))
+                if conf.supply_arch_overrides:
+                    calls.append(("listArchives", (build["build_id"], ), {"type": None}))
+
+            results = iter(session.multicall(calls))
+
+        for nvr, build in queried:
+            brew_task = next(results)
+            archives = next(results) if conf.supply_arch_overrides else None
+            try:
+                for result in (brew_task, archives):
+                    if isinstance(result, Exception):
+                        raise result
+                cls._parse_koji_task_request(build, brew_task, archives, ret[nvr])
+            except Exception as e:
+                ret[nvr] = e
+
+        for nvr in to_query:
+            if isinstance(ret[nvr], KojiLookupError):
+                KojiBuildMetadata.set_cached(nvr, "additional_data", error=str(ret[nvr]))
+            elif not isinstance(ret[nvr], Exception):
+                KojiBuildMetadata.set_cached(nvr, "additional_data", ret[nvr])
+        return ret
+
+    @classmethod
+    def _get_cached_additional_data(cls, nvr):
         """
+        Returns the additional data of `nvr` cached in the database or None
+        if they are not cached.
+
+        :raises KojiLookupError: If the cached lookup failed.
+        """
+        cached = KojiBuildMetadata.get_cached(nvr, "additional_data")
+        if cached is None:
+            return None
+
+        data, error = cached
+        if error is not None:
+            raise KojiLookupError(error)
+        # The arches are only cached when `supply_arch_overrides` has been
+        # enabled at the time of caching.
+        if not conf.supply_arch_overrides:
+            data["arches"] = None
+            return data
+        if data["arches"] is not None:
+            return data
+        return None
+
+    @classmethod
+    def _query_additional_data_from_koji(cls, nvr):
         data = cls._get_default_additional_data()
 
         with koji_service(
                 conf.koji_profile, log, dry_run=conf.dry_run,
                 login=False) as session:
             build = session.get_build(nvr)
-            if not build:
-                raise KojiLookupError(
-                    "Cannot find Koji build with nvr %s in Koji" % nvr)
-
-            if 'task_id' not in build or not build['task_id']:
-                if ("extra" in build and
-                        "container_koji_task_id" in build["extra"] and
-                        build["extra"]["container_koji_task_id"]):
-                    build['task_id'] = build["extra"]['container_koji_task_id']
-                else:
-                    raise KojiLookupError(
-                        "Cannot find task_id or container_koji_task_id "
-                        "in the Koji build %r" % build)
-
-            fs_koji_task_id = build.get('extra', {}).get('filesystem_koji_task_id')
-            if fs_koji_task_id:
-                parsed_nvr = koji.parse_NVR(nvr)
-                name_version = f'{parsed_nvr["name"]}-{parsed_nvr["version"]}'
-                if name_version not in conf.image_extra_repo:
-                    msg = (f'{name_version} is a base image, but extra image repo for it '
-                           f'is not specified in the Freshmaker configuration.')
-                    raise ExtraRepoNotConfiguredError(msg)
-
-            extra_image = build.get("extra", {}).get("image", {})
-            data["parent_build_id"] = extra_image.get("parent_build_id")
-            data["parent_image_builds"] = extra_image.get("parent_image_builds")
-
-            flatpak = extra_image.get("flatpak", False)
-            if flatpak:
-                data["flatpak"] = flatpak
-                isolated = extra_image.get("isolated")
-                if isolated is not None:
-                    data["isolated"] = isolated
+            cls._parse_koji_build(nvr, build, data)
 
             brew_task = session.get_task_request(
                 build['task_id'])
-            source = brew_task[0]
-            data["target"] = brew_task[1]
-            extra_data = brew_task[2]
-            if "git_branch" in extra_data:
-                data["git_branch"] = extra_data["git_branch"]
-            else:
-                data["git_branch"] = "unknown"
-
-            # Some builds do not have "source" attribute filled in, so try
-            # both build["source"] and task_request[0] sources.
-            sources = [source]
-            if "source" in build:
-                sources.insert(0, build["source"])
-            for src in sources:
-                m = re.match(r".*/(?P<namespace>.*)/(?P<container>.*)#(?P<commit>.*)", src)
-                if m:
-                    namespace = m.group("namespace")
-                    # For some Koji tasks, the container part ends with "?" in
-                    # source URL. This is just because some custom scripts for
-                    # submitting those builds include this character in source URL
-                    # to mark the query part of URL. We need to handle that by
-                    # stripping that character.
-                    container = m.group("container").rstrip("?")
-                    data["repository"] = namespace + "/" + container
-
-                    # There might be tasks which have branch name in
-                    # "origin/branch_name" format, so detect it set commit
-                    # hash only if this is not true.
-                    if "/" not in m.group("commit"):
-                        data["commit"] = m.group("commit")
-                        break
 
-            if not data['commit']:
-                raise KojiLookupError(
-                    "Cannot find valid source of Koji build %r" % build)
+            archives = None
+            if conf.supply_arch_overrides:
+                archives = session.list_archives(build_id=build['build_id'])
 
-            if not conf.supply_arch_overrides:
-                data['arches'] = None
-            else:
-                data['arches'] = cls._get_arches_from_koji(session, build['build_id'])
+            cls._parse_koji_task_request(build, brew_task, archives, data)
 
         return data
 
+    @classmethod
+    def _parse_koji_build(cls, nvr, build, data):
+        """
+        Fills in the additional `data` from the Koji `build`.
+        """
+        if not build:
+            raise KojiLookupError(
+                "Cannot find Koji build with nvr %s in Koji" % nvr)
+
+        if 'task_id' not in build or not build['task_id']:
+            if ("extra" in build and
+                    "container_koji_task_id" in build["extra"] and
+                    build["extra"]["container_koji_task_id"]):
+                build['task_id'] = build["extra"]['container_koji_task_id']
+            else:
+                raise KojiLookupError(
+                    "Cannot find task_id or container_koji_task_id "
+                    "in the Koji build %r" % build)
+
+        fs_koji_task_id = build.get('extra', {}).get('filesystem_koji_task_id')
+        if fs_koji_task_id:
+            parsed_nvr = koji.parse_NVR(nvr)
+            name_version = f'{parsed_nvr["name"]}-{parsed_nvr["version"]}'
+            if name_version not in conf.image_extra_repo:
+                msg = (f'{name_version} is a base image, but extra image repo for it '
+                       f'is not specified in the Freshmaker configuration.')
+                raise ExtraRepoNotConfiguredError(msg)
+
+        extra_image = build.get("extra", {}).get("image", {})
+        data["parent_build_id"] = extra_image.get("parent_build_id")
+        data["parent_image_builds"] = extra_image.get("parent_image_builds")
+
+        flatpak = extra_image.get("flatpak", False)
+        if flatpak:
+            data["flatpak"] = flatpak
+            isolated = extra_image.get("isolated")
+            if isolated is not None:
+                data["isolated"] = isolated
+
+    @classmethod
+    def _parse_koji_task_request(cls, build, brew_task, archives, data):
+        """
+        Fills in the additional `data` from the request of the Koji task
+        which built the `build` and from the `archives` of the build.
+        """
+        source = brew_task[0]
+        data["target"] = brew_task[1]
+        extra_data = brew_task[2]
+        if "git_branch" in extra_data:
+            data["git_branch"] = extra_data["git_branch"]
+        else:
+            data["git_branch"] = "unknown"
+
+        # Some builds do not have "source" attribute filled in, so try
+        # both build["source"] and task_request[0] sources.
+        sources = [source]
+        if "source" in build:
+            sources.insert(0, build["source"])
+        for src in sources:
+            m = re.match(r".*/(?P<namespace>.*)/(?P<container>.*)#(?P<commit>.*)", src)
+            if m:
+                namespace = m.group("namespace")
+                # For some Koji tasks, the container part ends with "?" in
+                # source URL. This is just because some custom scripts for
+                # submitting those builds include this character in source URL
+                # to mark the query part of URL. We need to handle that by
+                # stripping that character.
+                container = m.group("container").rstrip("?")
+                data["repository"] = namespace + "/" + container
+
+                # There might be tasks which have branch name in
+                # "origin/branch_name" format, so detect it set commit
+                # hash only if this is not true.
+                if "/" not in m.group("commit"):
+                    data["commit"] = m.group("commit")
+                    break
+
+        if not data['commit']:
+            raise KojiLookupError(
+                "Cannot find valid source of Koji build %r" % build)
+
+        if archives is None:
+            data['arches'] = None
+        else:
+            data['arches'] = cls._get_arches_from_archives(archives)
+
     @staticmethod
-    def _get_arches_from_koji(koji_session, build_id):
-        archives = koji_session.list_archives(build_id=build_id)
+    def _get_arches_from_archives(archives):
         arches = [
             archive['extra']['image']['arch']
             for archive in archives if archive['btype'] == 'image']
         return ' '.join(sorted(arches))
 
-    def resolve_commit(self):
+    def resolve_commit(self, additional_data=None):
         """
         Uses the ContainerImage data to resolve the information about
         commit from which the Docker image has been built.
 
         Sets the "repository and "commit" keys/values if available.
+
+        :param additional_data: Result of `get_additional_data_from_koji_multi`
+            for this image. If not set, Koji is queried.
         """
         # Find the additional data for Container build in Koji.
         try:
-            data = self.get_additional_data_from_koji(self.nvr)
+            if additional_data is None:
+                data = self.get_additional_data_from_koji(self.nvr)
+            elif isinstance(additional_data, Exception):
+                raise additional_data
+            else:
+                data = additional_data
         except KojiLookupError as e:
             err = "Cannot get data from Koji for build %s: %s." % (self.nvr, e)
             log.error(err)
@@ -327,12 +463,16 @@ class ContainerImage(dict):
 
         self.update(data)
 
-    def resolve_original_odcs_compose_ids(self):
+    def resolve_original_odcs_compose_ids(self, most_original_nvrs=None):
         """
         Resolve the ODCS compose ids used in most original image
 
         Gets the ODCS compose ids by excluding the composes added by
         freshmaker, and sets the "original_odcs_compose_ids" of this image
+
+        :param dict most_original_nvrs: Result of
+            `ArtifactBuild.get_most_original_nvrs` including this image.
+            If not set, the database is queried.
         """
         # This has been populated, skip.
         if self.get("original_odcs_compose_ids") is not None:
@@ -342,7 +482,10 @@ class ContainerImage(dict):
         self["original_odcs_compose_ids"] = []
         # If this image was built by freshmaker, query database recursively to
         # get the NVR of most original image which was not built by freshmaker
-        most_original_nvr = ArtifactBuild.get_most_original_nvr(self.nvr)
+        if most_original_nvrs is None:
+            most_original_nvr = ArtifactBuild.get_most_original_nvr(self.nvr)
+        else:
+            most_original_nvr = most_original_nvrs.get(self.nvr)
         if most_original_nvr is None:
             most_original_nvr = self.nvr
 
@@ -409,7 +552,23 @@ class ContainerImage(dict):
                     "is suspicious.", self.nvr)
         self.update({"content_sets": []})
 
-    def resolve_published(self, lb_instance):
+    def resolve_published(self, lb_instance, published_data=None):
+        """
+        Sets the "published" flag of this image and the complete
+        "rpm_manifest" of the unpublished image.
+
+        :param dict published_data: Value returned by
+            `LightBlue._get_published_data` for this image. If not set,
+            Lightblue is queried.
+        """
+        if published_data is not None:
+            self["published"] = published_data["published"]
+            if "rpm_manifest" in published_data:
+                self["rpm_manifest"] = published_data["rpm_manifest"]
+            elif not self["published"]:
+                log.warning("No image %s found in Lightblue.", self.nvr)
+            return
+
         # Get the published version of this image to find out if the image
         # was actually published.
         images = lb_instance.get_images_by_nvrs(
@@ -430,20 +589,46 @@ class ContainerImage(dict):
             else:
                 log.warning("No image %s found in Lightblue.", self.nvr)
 
-    def resolve(self, lb_instance, children=None):
+    def resolve(self, lb_instance, children=None, additional_data=None,
+                most_original_nvrs=None, published_data=None):
         """
         Resolves the Container image - populates additional metadata by
         querying Koji and lightblue.
+
+        :param additional_data: Result of `get_additional_data_from_koji_multi`
+            for this image. If not set, Koji is queried.
+        :param dict most_original_nvrs: Result of
+            `ArtifactBuild.get_most_original_nvrs` including this image.
+            If not set, the database is queried.
+        :param dict published_data: Result of `LightBlue._get_published_data`
+            for this image. If not set, Lightblue is queried.
         """
         try:
-            self.resolve_commit()
-            self.resolve_original_odcs_compose_ids()
+            self.resolve_commit(additional_data)
+            self.resolve_original_odcs_compose_ids(most_original_nvrs)
             self.resolve_content_sets(lb_instance, children)
-            self.resolve_published(lb_instance)
+            self.resolve_published(lb_instance, published_data)
         except Exception as e:
             err = "Cannot resolve the container image: %s" % e
             self.log_error(err)
 
+    def has_rpm(self, rpm_name):
+        """
+        Returns True if the RPM manifest of any arch of this image contains
+        the binary RPM `rpm_name`.
+
+        :param str rpm_name: name of the binary RPM to look for.
+        :rtype: bool
+        """
+        rpm_manifests = list(self.get("multi_arch_rpm_manifest", {}).values())
+        if self.get("rpm_manifest"):
+            rpm_manifests.append(self["rpm_manifest"])
+        for rpm_manifest in rpm_manifests:
+            for manifest in rpm_manifest:
+                if any(rpm.get("name") == rpm_name for rpm in manifest.get("rpms", [])):
+                    return True
+        return False
+
     def get_rpms(self):
         """
         Extracts the RPMs from the Container image.
@@ -488,6 +673,230 @@ class ContainerImage(dict):
         return previous_images[0].get_registry_repositories(lb_instance)
 
 
+class ImagesToRebuildDeduplicator(object):
+    """
+    Incrementally deduplicates the lists of images to rebuild.
+
+    The `to_rebuild` list is a list in following format:
+        [
+            [child_image, parent_of_child_image, parent_of_parent, ...],
+            ...
+        ]
+
+    New lists are added by `add` as they are found and the indexes needed
+    for the deduplication are kept up to date on every change of the
+    `to_rebuild` list. Therefore `deduplicate` does not have to go through
+    the whole `to_rebuild` list again, but only through the image groups
+    which changed since its previous call.
+
+    See `LightBlue._deduplicate_images_to_rebuild` for the description of
+    the deduplication itself.
+    """
+
+    def __init__(self, lb, to_rebuild=None):
+        """
+        Creates new deduplicator.
+
+        :param LightBlue lb: LightBlue instance used to describe the image
+            groups.
+        :param list to_rebuild: List to deduplicate in-place. If not set,
+            new empty list is used.
+        """
+        self.lb = lb
+        self.to_rebuild = to_rebuild if to_rebuild is not None else []
+        # Dict mapping the NVR of image to set of coordinates in the
+        # `to_rebuild` list. For example
+        # nvr_to_coordinates["nvr"] = {(0, 3), ...} means that the image with
+        # nvr "nvr" is 4th image in the to_rebuild[0] list, ...
+        self.nvr_to_coordinates = {}
+        # Dict mapping the NVR to image.
+        self.nvr_to_image = {}
+        # Dict mapping the NVR to its image group.
+        self.nvr_to_image_group = {}
+        # Dict mapping the image group to NVRs in the group. The values are
+        # dicts used as ordered sets.
+        self.image_group_to_nvrs = {}
+        # Image groups changed since the last call of `deduplicate`.
+        self.dirty_image_groups = set()
+
+        for image_id in range(len(self.to_rebuild)):
+            self._register_images(image_id, 0)
+
+    def add(self, rebuild_lists):
+        """
+        Adds new lists of images to rebuild to `to_rebuild` list.
+
+        :param list rebuild_lists: Lists of images to add.
+        """
+        for rebuild_list in rebuild_lists:
+            self.to_rebuild.append(rebuild_list)
+            self._register_images(len(self.to_rebuild) - 1, 0)
+
+    def _get_image_group(self, image):
+        image_group = self.nvr_to_image_group.get(image.nvr)
+        if image_group is None:
+            image_group = self.lb.describe_image_group(image)
+            self.nvr_to_image_group[image.nvr] = image_group
+        return image_group
+
+    def _register_images(self, image_id, start, end=None):
+        """
+        Adds the images from `to_rebuild[image_id][start:end]` to indexes.
+        """
+        for parent_id, image in enumerate(self.to_rebuild[image_id][start:end], start):
+            image_group = self._get_image_group(image)
+            self.nvr_to_coordinates.setdefault(image.nvr, set()).add((image_id, parent_id))
+            self.nvr_to_image[image.nvr] = image
+            self.image_group_to_nvrs.setdefault(image_group, {})[image.nvr] = None
+            self.dirty_image_groups.add(image_group)
+
+    def _unregister_images(self, image_id, start, end=None):
+        """
+        Removes the images from `to_rebuild[image_id][start:end]` from indexes.
+        """
+        for parent_id, image in enumerate(self.to_rebuild[image_id][start:end], start):
+            image_group = self.nvr_to_image_group[image.nvr]
+            coordinates = self.nvr_to_coordinates[image.nvr]
+            coordinates.discard((image_id, parent_id))
+            if not coordinates:
+                del self.nvr_to_coordinates[image.nvr]
+                del self.image_group_to_nvrs[image_group][image.nvr]
+            self.dirty_image_groups.add(image_group)
+
+    def _replace_images(self, image_id, parent_id, images):
+        """
+        Replaces the `to_rebuild[image_id][parent_id:]` with `images`.
+        """
+        self._unregister_images(image_id, parent_id)
+        self.to_rebuild[image_id][parent_id:] = images
+        self._register_images(image_id, parent_id)
+
+    def _replace_image(self, image_id, parent_id, image):
+        """
+        Replaces the `to_rebuild[image_id][parent_id]` with `image`.
+        """
+        self._unregister_images(image_id, parent_id, parent_id + 1)
+        self.to_rebuild[image_id][parent_id] = image
+        self._register_images(image_id, parent_id, parent_id + 1)
+
+    def deduplicate(self):
+        """
+        Deduplicates the image groups changed since the last call.
+
+        :return: Deduplicated `to_rebuild` list.
+        :rtype: list
+        """
+        image_groups = self._pop_dirty_image_groups()
+        for phase in ["handle_parent_change", "update_to_latest"]:
+            for image_group in image_groups:
+                self._deduplicate_image_group(image_group, phase)
+            # Replacing the parent images in the first phase can change
+            # also the image groups of the parent images.
+            image_groups += [
+                image_group for image_group in self._pop_dirty_image_groups()
+                if image_group not in image_groups]
+        # The second phase changes only the image groups it just deduplicated.
+        self.dirty_image_groups.clear()
+        return self.to_rebuild
+
+    def _pop_dirty_image_groups(self):
+        # Keep the order in which the image groups were added, so the
+        # result does not depend on the hash seed.
+        image_groups = [
+            image_group for image_group in self.image_group_to_nvrs
+            if image_group in self.dirty_image_groups]
+        self.dirty_image_groups.clear()
+        return image_groups
+
+    def _deduplicate_image_group(self, image_group, phase):
+        nvrs = sorted_by_nvr(list(self.image_group_to_nvrs[image_group]), reverse=True)
+        if not nvrs:
+            return
+
+        # There might be container image NVRs which are not released yet,
+        # but some released image is already built on top of them.
+        # The issue is that such unreleased container image won't be in
+        # its containerRepository and therefore won't have proper
+        # content_sets set.
+        # In this case, we copy the content_sets from the released image.
+        # This might bring issue in case the content_sets changed
+        # dramatically between released and unreleased release of such
+        # image, but it's still the best guess we can do.
+        # This is also used only as fallback in case "content_sets.yml"
+        # does not exists in the dist-git repo, which should be rare
+        # situation.
+        latest_content_sets = []
+        for nvr in reversed(nvrs):
+            image = self.nvr_to_image[nvr]
+            if not image.get("content_sets") or "content_sets_source" not in image:
+                image["content_sets"] = latest_content_sets
+            elif image["content_sets_source"] == "child_image":
+                if latest_content_sets:
+                    image["content_sets"] = latest_content_sets
+            else:
+                latest_content_sets = image["content_sets"]
+
+        # We want to replace NVRs which are lower than the latest released
+        # NVR with latest released NVR. If there are some higher NVRs, we
+        # want to keep them, because we don't want to rebuild the image
+        # against older NVR than the one it is currently built against.
+        latest_released_nvr = nvrs[0]
+        for nvr in nvrs:
+            if self.nvr_to_image[nvr].get("latest_released"):
+                latest_released_nvr = nvr
+                break
+
+        # The latest_released_nvr_index points to the latest released NVR
+        # in the `nvrs` list. Because `nvrs` list is desc sorted, every NVR
+        # with higher index is lower and therefore we need to replace it.
+        if not conf.lightblue_released_dependencies_only:
+            latest_released_nvr_index = nvrs.index(latest_released_nvr)
+        else:
+            # In case we want to use only released versions of images,
+            # replace all the images with the latest released one.
+            latest_released_nvr_index = -1
+
+        latest_image = self.nvr_to_image[latest_released_nvr]
+        if phase == "handle_parent_change":
+            # Find out the name of parent image of latest release image.
+            if not latest_image.get("parent"):
+                return
+            latest_parent_nvr_dict = koji.parse_NVR(latest_image["parent"].nvr)
+            latest_parent_name = latest_parent_nvr_dict["name"]
+            latest_parent_version = latest_parent_nvr_dict["version"]
+
+            # Go through the older images and in case the parent image differs,
+            # update its parents according to latest image parents.
+            for nvr in nvrs[latest_released_nvr_index + 1:]:
+                image = self.nvr_to_image[nvr]
+                if not image.get("parent"):
+                    continue
+                parent_nvr_dict = koji.parse_NVR(image["parent"].nvr)
+                parent_name = parent_nvr_dict["name"]
+                parent_version = parent_nvr_dict["version"]
+                if (parent_name, parent_version) == (latest_parent_name, latest_parent_version):
+                    continue
+                for image_id, parent_id in sorted(self.nvr_to_coordinates.get(nvr, ())):
+                    if latest_released_nvr not in self.nvr_to_coordinates:
+                        return
+                    latest_image_id, latest_parent_id = min(
+                        self.nvr_to_coordinates[latest_released_nvr])
+                    self._replace_images(
+                        image_id, parent_id,
+                        self.to_rebuild[latest_image_id][latest_parent_id:])
+        elif phase == "update_to_latest":
+            for nvr in nvrs[latest_released_nvr_index + 1:]:
+                for image_id, parent_id in sorted(self.nvr_to_coordinates.get(nvr, ())):
+                    # At first replace the image in to_rebuild based
+                    # on the coordinates from the index.
+                    self._replace_image(image_id, parent_id, latest_image)
+                    # And in case this image is not the the leaf image, also replace
+                    # the ["parent"] record for the child image to point to the image
+                    # with highest NVR.
+                    if parent_id != 0:
+                        self.to_rebuild[image_id][parent_id - 1]["parent"] = latest_image
+
+
 class LightBlue(object):
     """Interface to query lightblue"""
 
@@ -574,10 +983,13 @@ class LightBlue(object):
                 cassette_library_dir=conf.vcrpy_path,
                 record_mode=conf.vcrpy_mode,
             )
+            # Pooled connections opened before the cassette is used would
+            # bypass vcrpy, so do not use the shared session here.
             with my_vcr.use_cassette(f'{self.event_id}.yml'):
                 response = requests.post(entity_url, **request_kwargs, timeout=conf.requests_timeout)
         else:
-            response = requests.post(entity_url, **request_kwargs, timeout=max(600, conf.requests_timeout * 5))
+            session = get_session("lightblue")
+            response = session.post(entity_url, **request_kwargs, timeout=max(600, conf.requests_timeout * 5))
 
         status_code = response.status_code
 
@@ -849,17 +1261,16 @@ class LightBlue(object):
                 ret.append(image)
             image_included = False
             for rpm in rpms or []:
-                image_rpm_nvra = kobo.rpmlib.parse_nvra(rpm["nvra"])
+                image_rpm_nvra = NVR.parse_nvra(rpm["nvra"])
                 for rpm_nvr in rpm_name_to_nvrs.get(rpm.get("name"), []):
-                    input_rpm_nvr = kobo.rpmlib.parse_nvr(rpm_nvr)
-                    # compare_nvr return values:
+                    input_rpm_nvr = NVR.parse(rpm_nvr)
+                    # compare return values:
                     #   - nvr1 newer than nvr2: 1
                     #   - same nvrs: 0
                     #   - nvr1 older: -1
                     # We want to rebuild only images with RPM NVR lower than
                     # input RPM NVR, therefore we check for -1.
-                    if kobo.rpmlib.compare_nvr(
-                            image_rpm_nvra, input_rpm_nvr, ignore_epoch=True) == -1:
+                    if image_rpm_nvra.compare(input_rpm_nvr, ignore_epoch=True) == -1:
                         ret.append(image)
                         image_included = True
                         break
@@ -1212,7 +1623,206 @@ class LightBlue(object):
 
         return parent_brew_build
 
-    def find_parent_images_with_package(self, child_image, rpm_name, images=None):
+    def find_parent_images(self, images):
+        """
+        Finds and resolves all the parent images of `images` breadth-first.
+
+        On each level of the image trees, the NVRs of all the parent images
+        which have not been seen yet are collected across all the `images`
+        and fetched from Lightblue using a single query. The parent images
+        shared by multiple images are therefore queried and resolved just
+        once.
+
+        The returned dict is meant to be passed to
+        `find_parent_images_with_package` as `parent_images`.
+
+        :param list images: List of ContainerImage instances to find the
+            parent images for.
+        :return: Dict with the parent image NVR as a key and the resolved
+            ContainerImage as a value. The value is None in case the parent
+            image has not been found in Lightblue.
+        :rtype: dict
+        """
+        parent_images = {}
+        children = list(images)
+        with ThreadPoolExecutor(max_workers=conf.max_thread_workers) as executor:
+            while children:
+                parent_nvrs = executor.map(
+                    self.find_parent_brew_build_nvr_from_child, children)
+
+                # Mapping of parent NVR to the list of its children. The children
+                # are used as a fallback source of the content_sets of parent image.
+                nvr_to_children = {}
+                for child, parent_nvr in zip(children, parent_nvrs):
+                    if parent_nvr and parent_nvr not in parent_images:
+                        nvr_to_children.setdefault(parent_nvr, []).append(child)
+                if not nvr_to_children:
+                    break
+
+                log.info("Querying Lightblue for %d parent images.", len(nvr_to_children))
+                image_request = self._get_images_by_nvrs_request(
+                    list(nvr_to_children.keys()))
+                found_images = [
+                    image for image in self.find_container_images(image_request)
+                    if image.nvr in nvr_to_children
+                ]
+
+                additional_data = self._get_additional_data_from_koji(found_images)
+                most_original_nvrs = self._get_most_original_nvrs(found_images)
+                published_data = self._get_published_data(found_images)
+
+                def _resolve_image(image):
+                    image.resolve(
+                        self, nvr_to_children[image.nvr],
+                        additional_data=additional_data.get(image.nvr),
+                        most_original_nvrs=most_original_nvrs,
+                        published_data=published_data.get(image.nvr))
+                    return image
+
+                children = list(executor.map(_resolve_image, found_images))
+
+                for parent_nvr in nvr_to_children:
+                    parent_images[parent_nvr] = None
+                for image in children:
+                    parent_images[image.nvr] = image
+
+        return parent_images
+
+    def _get_images_by_nvrs_request(self, nvrs, published=None,
+                                    include_rpm_manifest=True):
+        """
+        Returns the request for `find_container_images` querying all the
+        containerImages with the `nvrs` using single "$in" query.
+
+        :param list nvrs: NVRs of the containerImages.
+        :param bool published: When not None, only the images with this
+            value of the "published" flag are returned.
+        :param bool include_rpm_manifest: When True, the rpm_manifest is
+            included in the returned ContainerImages.
+        """
+        query = [{"field": "brew.build", "op": "$in", "values": nvrs}]
+        if published is not None:
+            query.append({
+                "field": "repositories.*.published",
+                "op": "=",
+                "rvalue": published
+            })
+        return {
+            "objectType": "containerImage",
+            "query": {"$and": query},
+            "projection": self._get_default_projection(
+                include_rpm_manifest=include_rpm_manifest),
+        }
+
+    def _get_published_data(self, images):
+        """
+        Finds out which of the `images` are published and gets the complete
+        RPM manifest of the unpublished ones, see
+        `ContainerImage.resolve_published`, using at most two queries.
+
+        In case of error, empty dict is returned, so the images are resolved
+        one by one as a fallback.
+
+        :param list images: List of ContainerImage instances.
+        :return: Dict with the NVR as a key and the dict with "published"
+            flag and, for the unpublished images found in Lightblue, the
+            "rpm_manifest" as a value.
+        :rtype: dict
+        """
+        nvrs = list(dict.fromkeys(image.nvr for image in images))
+        if not nvrs:
+            return {}
+        try:
+            published_images = self.find_container_images(
+                self._get_images_by_nvrs_request(
+                    nvrs, published=True, include_rpm_manifest=False))
+            ret = {image.nvr: {"published": True} for image in published_images}
+            unpublished_nvrs = [nvr for nvr in nvrs if nvr not in ret]
+            if unpublished_nvrs:
+                # Usually we do not store complete RPM manifest, but when
+                # image is unpublished, we need complete RPM manifest in order
+                # to check for possible unpublished RPMs.
+                unpublished_images = self.find_container_images(
+                    self._get_images_by_nvrs_request(unpublished_nvrs))
+                for image in unpublished_images:
+                    ret.setdefault(image.nvr, {
+                        "published": False, "rpm_manifest": image["rpm_manifest"]})
+                for nvr in unpublished_nvrs:
+                    ret.setdefault(nvr, {"published": False})
+        except Exception:
+            log.exception("Cannot find out if %d images are published at once.", len(nvrs))
+            return {}
+        return ret
+
+    def _get_additional_data_from_koji(self, images):
+        """
+        Returns the additional data from Koji for all the `images` at once,
+        see `ContainerImage.get_additional_data_from_koji_multi`.
+
+        In case of error, empty dict is returned, so the images are resolved
+        one by one as a fallback.
+        """
+        if not images:
+            return {}
+        try:
+            return ContainerImage.get_additional_data_from_koji_multi(
+                [image.nvr for image in images])
+        except Exception:
+            log.exception("Cannot get data from Koji for %d images at once.", len(images))
+            return {}
+
+    def _get_most_original_nvrs(self, images):
+        """
+        Returns the most original NVRs of all the `images` at once, see
+        `ArtifactBuild.get_most_original_nvrs`.
+
+        In case of error, None is returned, so the images are resolved
+        one by one as a fallback.
+        """
+        if not images:
+            return {}
+        try:
+            return ArtifactBuild.get_most_original_nvrs([image.nvr for image in images])
+        except Exception:
+            log.exception("Cannot get most original NVRs of %d images at once.",
+                          len(images))
+            return None
+
+    def _get_parent_image(self, parent_nvr, children, rpm_name=None,
+                          parent_images=None):
+        """
+        Returns the resolved parent image with `parent_nvr` NVR.
+
+        :param str parent_nvr: NVR of the parent image.
+        :param list children: List of ContainerImage instances used when
+            resolving the parent image without content_sets.
+        :param str rpm_name: When set, the parent image is returned only if
+            it contains the binary RPM with this name.
+        :param dict parent_images: Parent images as returned by
+            `find_parent_images`. When the `parent_nvr` is included in it,
+            Lightblue is not queried at all.
+        :return: Resolved parent image or None if not found.
+        :rtype: ContainerImage
+        """
+        if parent_images is not None and parent_nvr in parent_images:
+            parent_image = parent_images[parent_nvr]
+            if parent_image and rpm_name and not parent_image.has_rpm(rpm_name):
+                return None
+            return parent_image
+
+        if rpm_name:
+            parent_image = self.get_images_by_nvrs(
+                [parent_nvr], rpm_names=[rpm_name], published=None)
+        else:
+            parent_image = self.get_images_by_nvrs([parent_nvr], published=None)
+        if not parent_image:
+            return None
+        parent_image = parent_image[0]
+        parent_image.resolve(self, children)
+        return parent_image
+
+    def find_parent_images_with_package(self, child_image, rpm_name, images=None,
+                                        parent_images=None):
         """
         Returns the chain of all parent images of the image which contain the
         package `rpm_name` in their RPM manifest.
@@ -1222,6 +1832,10 @@ class LightBlue(object):
         question.
 
         This method is recursive.
+
+        :param dict parent_images: Parent images as returned by
+            `find_parent_images`. When set, the parent images included in it
+            are not queried in Lightblue again.
         """
         if not images:
             images = []
@@ -1232,15 +1846,13 @@ class LightBlue(object):
         # We've reached the base image, stop recursion
         if not parent_brew_build:
             return images
-        parent_image = self.get_images_by_nvrs([parent_brew_build], rpm_names=[rpm_name], published=None)
 
-        if parent_image:
-            # In some cases, an image may not have its content sets defined. To
-            # circumvent this gap, we use the list of child images when calling
-            # resolve so their content sets can be used.
-            children = images if images else [child_image]
-            parent_image = parent_image[0]
-            parent_image.resolve(self, children)
+        # In some cases, an image may not have its content sets defined. To
+        # circumvent this gap, we use the list of child images when calling
+        # resolve so their content sets can be used.
+        children = images if images else [child_image]
+        parent_image = self._get_parent_image(
+            parent_brew_build, children, rpm_name, parent_images)
 
         if images:
             if parent_image:
@@ -1251,11 +1863,9 @@ class LightBlue(object):
                 # the package so we know against which image it has been
                 # built.
                 # Let's try first with the "parent_brew_build" field.
-                parent = self.get_images_by_nvrs([parent_brew_build], published=None)
-                if parent:
-                    parent = parent[0]
-                    parent.resolve(self, images)
-                else:
+                parent = self._get_parent_image(
+                    parent_brew_build, images, parent_images=parent_images)
+                if not parent:
                     err = "Couldn't find parent image %s. Lightblue data is probably incomplete" % (
                         parent_brew_build)
                     log.error(err)
@@ -1266,7 +1876,8 @@ class LightBlue(object):
         if not parent_image:
             return images
         images.append(parent_image)
-        return self.find_parent_images_with_package(parent_image, rpm_name, images)
+        return self.find_parent_images_with_package(
+            parent_image, rpm_name, images, parent_images)
 
     def find_images_with_packages_from_content_set(
             self, rpm_nvrs, content_sets, filter_fnc=None, published=True,
@@ -1329,10 +1940,17 @@ class LightBlue(object):
         if filter_fnc:
             images = [image for image in images if not filter_fnc(image)]
 
+        additional_data = self._get_additional_data_from_koji(images)
+        most_original_nvrs = self._get_most_original_nvrs(images)
+        published_data = self._get_published_data(images)
+
         def _resolve_image(image):
             # We do not set "children" here in resolve_content_sets call, because
             # published images should have the content_set set.
-            image.resolve(self, None)
+            image.resolve(
+                self, None, additional_data=additional_data.get(image.nvr),
+                most_original_nvrs=most_original_nvrs,
+                published_data=published_data.get(image.nvr))
 
             # Mark as latest_released only images which are not Beta or Tech Preview.
             # This is important, because "latest_released" is used in deduplication
@@ -1383,119 +2001,7 @@ class LightBlue(object):
         #
         # 2) "update_to_latest". During this phase, we simply find out old releases
         #    of images in `to_rebuild` and update them to latest released NVR.
-        for phase in ["handle_parent_change", "update_to_latest"]:
-            # Temporary dict mapping the NVR of image to coordinates in the
-            # `to_rebuild` list. For example
-            # nvr_to_coordinates["nvr"] = [[0, 3], ...] means that the image with
-            # nvr "nvr" is 4th image in the to_rebuild[0] list, ...
-            nvr_to_coordinates = {}
-            # Temporary dict mapping the NV-repository_key to list of NVRs.
-            # The List of NVRs is always sorted descending.
-            image_group_to_nvrs = {}
-            # Temporary dict mapping the NVR to image.
-            nvr_to_image = {}
-            # Temporary dict mapping image_group to latest released NVR for that image_group.
-            image_group_to_latest_released_nvr = {}
-
-            # Constructs the temporary dicts as described above.
-            for image_id, images in enumerate(to_rebuild):
-                for parent_id, image in enumerate(images):
-                    image_group = self.describe_image_group(image)
-
-                    image_group_to_nvrs.setdefault(image_group, [])
-                    if image.nvr not in image_group_to_nvrs[image_group]:
-                        image_group_to_nvrs[image_group].append(image.nvr)
-
-                    nvr_to_coordinates.setdefault(image.nvr, []).append([image_id, parent_id])
-                    nvr_to_image[image.nvr] = image
-
-                    if image.get("latest_released"):
-                        image_group_to_latest_released_nvr[image_group] = image.nvr
-
-            # Sort the lists in image_group_to_nvrs dict.
-            for image_group in image_group_to_nvrs.keys():
-                image_group_to_nvrs[image_group] = sorted_by_nvr(image_group_to_nvrs[image_group], reverse=True)
-
-                # There might be container image NVRs which are not released yet,
-                # but some released image is already built on top of them.
-                # The issue is that such unreleased container image won't be in
-                # its containerRepository and therefore won't have proper
-                # content_sets set.
-                # In this case, we copy the content_sets from the released image.
-                # This might bring issue in case the content_sets changed
-                # dramatically between released and unreleased release of such
-                # image, but it's still the best guess we can do.
-                # This is also used only as fallback in case "content_sets.yml"
-                # does not exists in the dist-git repo, which should be rare
-                # situation.
-                latest_content_sets = []
-                for nvr in reversed(image_group_to_nvrs[image_group]):
-                    image = nvr_to_image[nvr]
-                    if not image.get("content_sets") or "content_sets_source" not in image:
-                        image["content_sets"] = latest_content_sets
-                    elif image["content_sets_source"] == "child_image":
-                        if latest_content_sets:
-                            image["content_sets"] = latest_content_sets
-                    else:
-                        latest_content_sets = image["content_sets"]
-
-            # Iterate through list of NVs.
-            for image_group, nvrs in image_group_to_nvrs.items():
-                # We want to replace NVRs which are lower than the latest released
-                # NVR with latest released NVR. If there are some higher NVRs, we
-                # want to keep them, because we don't want to rebuild the image
-                # against older NVR than the one it is currently built against.
-                if image_group in image_group_to_latest_released_nvr:
-                    latest_released_nvr = image_group_to_latest_released_nvr[image_group]
-                else:
-                    latest_released_nvr = nvrs[0]
-
-                # The latest_released_nvr_index points to the latest released NVR
-                # in the `nvrs` list. Because `nvrs` list is desc sorted, every NVR
-                # with higher index is lower and therefore we need to replace it.
-                if not conf.lightblue_released_dependencies_only:
-                    latest_released_nvr_index = nvrs.index(latest_released_nvr)
-                else:
-                    # In case we want to use only released versions of images,
-                    # replace all the images with the latest released one.
-                    latest_released_nvr_index = -1
-
-                if phase == "handle_parent_change":
-                    # Find out the name of parent image of latest release image.
-                    latest_image = nvr_to_image[latest_released_nvr]
-                    if not latest_image.get("parent"):
-                        continue
-                    latest_parent_nvr_dict = koji.parse_NVR(latest_image["parent"].nvr)
-                    latest_parent_name = latest_parent_nvr_dict["name"]
-                    latest_parent_version = latest_parent_nvr_dict["version"]
-
-                    # Go through the older images and in case the parent image differs,
-                    # update its parents according to latest image parents.
-                    for nvr in nvrs[latest_released_nvr_index + 1:]:
-                        image = nvr_to_image[nvr]
-                        if not image.get("parent"):
-                            continue
-                        parent_nvr_dict = koji.parse_NVR(image["parent"].nvr)
-                        parent_name = parent_nvr_dict["name"]
-                        parent_version = parent_nvr_dict["version"]
-                        if (parent_name, parent_version) != (latest_parent_name, latest_parent_version):
-                            for image_id, parent_id in nvr_to_coordinates[nvr]:
-                                latest_image_id, latest_parent_id = nvr_to_coordinates[latest_released_nvr][0]
-                                to_rebuild[image_id][parent_id:] = to_rebuild[latest_image_id][latest_parent_id:]
-                elif phase == "update_to_latest":
-                    for nvr in nvrs[latest_released_nvr_index + 1:]:
-                        for image_id, parent_id in nvr_to_coordinates[nvr]:
-                            # At first replace the image in to_rebuild based
-                            # on the coordinates from temp dict.
-                            to_rebuild[image_id][parent_id] = nvr_to_image[latest_released_nvr]
-
-                            # And in case this image is not the the leaf image, also replace
-                            # the ["parent"] record for the child image to point to the image
-                            # with highest NVR.
-                            if parent_id != 0:
-                                to_rebuild[image_id][parent_id - 1]["parent"] = nvr_to_image[latest_released_nvr]
-
-        return to_rebuild
+        return ImagesToRebuildDeduplicator(self, to_rebuild).deduplicate()
 
     # Cache to avoid multiple calls. We want one call per nvr, not one per arch
     @region.cache_on_arguments(to_str=lambda image: image.nvr)
@@ -1602,6 +2108,11 @@ class LightBlue(object):
 
         rpm_names = [koji.parse_NVR(rpm_nvr)["name"] for rpm_nvr in rpm_nvrs]
 
+        # Resolve the parent images of all the images level by level at first,
+        # so every parent image is queried just once no matter how many
+        # images share it.
+        parent_images = self.find_parent_images(images)
+
         def _get_images_to_rebuild(image):
             """
             Find out parent images to rebuild, helper called from threadpool.
@@ -1616,39 +2127,39 @@ class LightBlue(object):
                     continue
 
                 rebuild_list[rpm_name] = self.find_parent_images_with_package(
-                    image, rpm_name, [])
+                    image, rpm_name, [], parent_images=parent_images)
                 if rebuild_list[rpm_name]:
                     image['parent'] = rebuild_list[rpm_name][0]
                 else:
                     parent_brew_build = self.find_parent_brew_build_nvr_from_child(image)
                     if parent_brew_build:
-                        parent = self.get_images_by_nvrs([parent_brew_build], published=None)
+                        parent = self._get_parent_image(
+                            parent_brew_build, images, parent_images=parent_images)
                         if parent:
-                            parent = parent[0]
-                            parent.resolve(self, images)
                             image['parent'] = parent
                 rebuild_list[rpm_name].insert(0, image)
             return rebuild_list
 
         # For every image, find out all its parent images which contain the
         # binary rpm package and store these lists to to_rebuild.
-        to_rebuild = []
+        deduplicator = ImagesToRebuildDeduplicator(self)
         optimization_base = 50
         with ThreadPoolExecutor(max_workers=conf.max_thread_workers) as executor:
             for result in executor.map(_get_images_to_rebuild, images):
-                to_rebuild.extend(result.values())
+                deduplicator.add(result.values())
                 # Memory consumption of fully constructed to_rebuild list could
                 # be large. To prevent this we will periodically use
-                # deduplication on the list to reduce it size.
-                if len(to_rebuild) > optimization_base:
-                    self._deduplicate_images_to_rebuild(to_rebuild)
+                # deduplication on the list to reduce it size. Only the image
+                # groups changed by the newly added images are deduplicated.
+                if len(deduplicator.to_rebuild) > optimization_base:
+                    deduplicator.deduplicate()
                     optimization_base += 50
         # The to_rebuild list now contains all the images which need to be
-        # rebuilt, but there are lot of duplicates there.
+        # rebuilt, but there might be still duplicates there.
 
         # At first remove duplicated images which share the same name and
         # version, but different release.
-        to_rebuild = self._deduplicate_images_to_rebuild(to_rebuild)
+        to_rebuild = deduplicator.deduplicate()
         # Get all the directly affected images so that any parents that are not marked as
         # directly affected can be set in _images_to_rebuild_to_batches
         directly_affected_nvrs = {
@@ -1703,7 +2214,7 @@ class LightBlue(object):
             # Try replacing all the not directly affected images starting from the first one
             for i in range(not_directly_affected_index, len(image_group)):
                 parent_image = image_group[i]
-                rpm_name_to_nvrs = {kobo.rpmlib.parse_nvr(nvr)["name"]: nvr for nvr in rpm_nvrs}
+                rpm_name_to_nvrs = {NVR.parse(nvr).name: nvr for nvr in rpm_nvrs}
                 # Get the RPM NVRs that were fixed and apply to the parent image since
                 # get_fixed_published_image will ensure all those RPMs are present
                 parent_applicable_rpm_nvrs = set()
@@ -1717,10 +2228,10 @@ class LightBlue(object):
                     if rpm_name_to_nvrs.get(rpm["name"]):
                         parent_applicable_rpm_nvrs.add(rpm_name_to_nvrs[rpm["name"]])
 
-                parsed_parent_nvr = kobo.rpmlib.parse_nvr(parent_image.nvr)
+                parsed_parent_nvr = NVR.parse(parent_image.nvr)
                 fixed_published_image = self.get_fixed_published_image(
-                    parsed_parent_nvr["name"],
-                    parsed_parent_nvr["version"],
+                    parsed_parent_nvr.name,
+                    parsed_parent_nvr.version,
                     self.describe_image_group(parent_image),
                     parent_applicable_rpm_nvrs,
                     content_sets,
@@ -1766,7 +2277,7 @@ class LightBlue(object):
             ``None``
         :rtype: ContainerImage or None
         """
-        rpm_name_to_nvrs = {kobo.rpmlib.parse_nvr(nvr)["name"]: nvr for nvr in rpm_nvrs}
+        rpm_name_to_nvrs = {NVR.parse(nvr).name: nvr for nvr in rpm_nvrs}
         # It is too slow to also filter by the expected RPMs. This is done outside of the lightblue
         # query instead.
         request = {
@@ -1853,9 +2364,9 @@ class LightBlue(object):
                 continue
 
             for rpm in image.get_rpms():
-                nvr_in_image = kobo.rpmlib.parse_nvra(rpm["nvra"])
-                fixed_nvr = kobo.rpmlib.parse_nvr(rpm_name_to_nvrs[rpm["name"]])
-                if kobo.rpmlib.compare_nvr(nvr_in_image, fixed_nvr, ignore_epoch=True) < 0:
+                nvr_in_image = NVR.parse_nvra(rpm["nvra"])
+                fixed_nvr = NVR.parse(rpm_name_to_nvrs[rpm["name"]])
+                if nvr_in_image.compare(fixed_nvr, ignore_epoch=True) < 0:
                     log.debug("The image %s does not have all the fixed RPMs", image.nvr)
                     break
             else:
@@ -1872,14 +2383,7 @@ class LightBlue(object):
 
         # At this point, there is at least one published image with the fixed RPMs and content sets.
         # The next step is to pick the one with the highest release.
-        fixed_published_image = candidate_images[0]
-        parsed_fixed_published_image_nvr = kobo.rpmlib.parse_nvr(fixed_published_image.nvr)
-        for candidate_image in candidate_images[1:]:
-            parsed_candidate_image_nvr = kobo.rpmlib.parse_nvr(candidate_image.nvr)
-            if (
-                kobo.rpmlib.compare_nvr(parsed_candidate_image_nvr, parsed_fixed_published_image_nvr) > 0
-            ):
-                fixed_published_image = candidate_image
+        fixed_published_image = max(candidate_images, key=lambda image: NVR.parse(image.nvr))
 
         # Now that the best fixed published image is determined, get it from lightblue with all the
         # metadata required by Freshmaker
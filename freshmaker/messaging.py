@@ -25,17 +25,29 @@
 
 """Generic messaging functions."""
 
+import atexit
+import collections
 import json
+import queue
+import threading
+import time
 
 from freshmaker import log, conf
 from freshmaker.events import BaseEvent
 from freshmaker.utils import retry
 
+# Topics of the messages which are coalesced by the MessagePublisher when
+# sent repeatedly for the same event within the coalesce window.
+COALESCED_TOPICS = ("event.state.changed", "event.state.changed.min")
+
 
 def publish(topic, msg):
     """
     Publish a single message to a given backend, and return
 
+    When the "messaging_async_publish" is enabled, the message is only queued
+    to be sent by the background MessagePublisher thread and None is returned.
+
     :param str topic: the topic of the message (e.g. module.state.change)
     :param dict msg: the message contents of the message (typically JSON)
     :return: the value returned from underlying backend "send" method.
@@ -52,6 +64,12 @@ def publish(topic, msg):
         messaging_tx_failed_counter.inc()
         raise KeyError("No messaging backend found for %r" % conf.messaging)
 
+    if conf.messaging_async_publish:
+        if get_publisher().put(topic, msg):
+            return None
+        log.warning("The queue of outgoing messages is full, sending the "
+                    "%s message synchronously.", topic)
+
     try:
         rv = handler(topic, msg)
         messaging_tx_sent_ok_counter.inc()
@@ -61,6 +79,221 @@ def publish(topic, msg):
         raise
 
 
+class BatchSender(object):
+    """
+    Sends the batches of messages using the "publish" function of the
+    messaging backend, one message after another. Backends able to send
+    more messages over one connection provide their own subclass as
+    "batch_sender".
+    """
+
+    def __init__(self, publish):
+        """
+        :param callable publish: "publish" function of the messaging backend.
+        """
+        self.publish = publish
+
+    def send(self, messages):
+        """
+        Sends the messages.
+
+        :param list messages: List of (topic, msg) tuples.
+        """
+        for topic, msg in messages:
+            self.publish(topic, msg)
+
+    def close(self):
+        """
+        Closes the connection to the messaging backend, if there is any.
+        """
+
+
+def get_batch_sender():
+    """
+    Returns new BatchSender of the configured messaging backend.
+    """
+    backend = _messaging_backends[conf.messaging_sender]
+    return backend.get('batch_sender', BatchSender)(backend['publish'])
+
+
+def publish_batch(messages):
+    """
+    Publish the list of messages to a given backend at once. Backends
+    without the batch support send the messages one by one.
+
+    :param list messages: List of (topic, msg) tuples.
+    """
+    sender = get_batch_sender()
+    try:
+        sender.send(messages)
+    finally:
+        sender.close()
+
+
+class MessagePublisher(object):
+    """
+    Sends the outgoing messages in batches from the background thread, so
+    the code publishing them does not wait for the messaging backend.
+
+    The messages are sent in the order they were published. Only when the
+    `coalesce_window` is set, the repeated messages with one of the
+    COALESCED_TOPICS and the same event "id" received within this window
+    are replaced by the last one.
+    """
+
+    def __init__(self, sender=None, queue_size=1000,
+                 batch_size=100, coalesce_window=0):
+        """
+        :param BatchSender sender: Sender of the batches, kept open until
+            the publisher is stopped. Defaults to the BatchSender of the
+            configured messaging backend.
+        :param int queue_size: Maximum number of messages waiting to be sent.
+        :param int batch_size: Maximum number of messages sent at once.
+        :param float coalesce_window: Number of seconds to wait for more
+            messages before sending the batch.
+        """
+        self.sender = sender if sender is not None else get_batch_sender()
+        self.batch_size = max(batch_size, 1)
+        self.coalesce_window = coalesce_window
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(
+            target=self._send_loop, name="freshmaker-publisher", daemon=True)
+        self.thread.start()
+
+    def put(self, topic, msg):
+        """
+        Queues the message to be sent.
+
+        :return: False when the queue is full and the message was not queued.
+        :rtype: bool
+        """
+        from freshmaker.monitor import messaging_tx_queue_depth
+
+        messaging_tx_queue_depth.observe(self.queue.qsize())
+        try:
+            self.queue.put_nowait((topic, msg))
+        except queue.Full:
+            return False
+        return True
+
+    def flush(self):
+        """
+        Waits until all the queued messages are sent.
+        """
+        self.queue.join()
+
+    def stop(self, wait=True):
+        """
+        Stops the publisher once it sends the already queued messages and
+        closes its sender.
+
+        :param bool wait: When True, waits until the publisher is stopped.
+        """
+        self.queue.put(StopIteration)
+        if wait:
+            self.thread.join()
+
+    def _get_batch(self):
+        """
+        Returns the list of items received from the queue for the next batch.
+        Blocks until there is at least one item.
+        """
+        items = [self.queue.get()]
+        deadline = time.monotonic() + self.coalesce_window
+        while len(items) < self.batch_size and items[-1] is not StopIteration:
+            try:
+                timeout = deadline - time.monotonic()
+                if timeout > 0:
+                    items.append(self.queue.get(timeout=timeout))
+                else:
+                    items.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _coalesce(self, messages):
+        """
+        Returns the `messages` without the ones replaced by the later message
+        of the same event.
+        """
+        coalesced = collections.OrderedDict()
+        for idx, (topic, msg) in enumerate(messages):
+            if topic in COALESCED_TOPICS and isinstance(msg, dict) and "id" in msg:
+                key = (topic, msg["id"])
+                # Move the message to the position of the last one.
+                coalesced.pop(key, None)
+            else:
+                key = idx
+            coalesced[key] = (topic, msg)
+        return list(coalesced.values())
+
+    def _send_loop(self):
+        try:
+            self._send_batches()
+        finally:
+            self.sender.close()
+
+    def _send_batches(self):
+        from freshmaker.monitor import (
+            messaging_tx_sent_ok_counter, messaging_tx_failed_counter,
+            messaging_tx_coalesced_counter, messaging_tx_send_latency)
+
+        stop = False
+        while not stop:
+            items = self._get_batch()
+            messages = [item for item in items if item is not StopIteration]
+            stop = len(messages) != len(items)
+            try:
+                if not messages:
+                    continue
+                to_send = messages
+                if self.coalesce_window:
+                    to_send = self._coalesce(messages)
+                    messaging_tx_coalesced_counter.inc(len(messages) - len(to_send))
+                start = time.monotonic()
+                try:
+                    self.sender.send(to_send)
+                    messaging_tx_sent_ok_counter.inc(len(to_send))
+                except Exception:
+                    messaging_tx_failed_counter.inc(len(to_send))
+                    log.exception("Failed to send %d messages.", len(to_send))
+                finally:
+                    messaging_tx_send_latency.observe(time.monotonic() - start)
+            finally:
+                for item in items:
+                    self.queue.task_done()
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def get_publisher():
+    """
+    Returns the MessagePublisher used by `publish`, starts it on first call.
+    """
+    global _publisher
+    with _publisher_lock:
+        if _publisher is None:
+            _publisher = MessagePublisher(
+                queue_size=conf.messaging_publisher_queue_size,
+                batch_size=conf.messaging_publisher_batch_size,
+                coalesce_window=conf.messaging_publisher_coalesce_window)
+            atexit.register(stop_publisher)
+        return _publisher
+
+
+def stop_publisher():
+    """
+    Sends the queued messages and stops the MessagePublisher used by `publish`.
+    """
+    global _publisher
+    with _publisher_lock:
+        publisher, _publisher = _publisher, None
+    if publisher is not None:
+        publisher.stop(wait=True)
+
+
 def _fedmsg_publish(topic, msg):
     # fedmsg doesn't really need access to conf, however other backends do
     import fedmsg
@@ -95,6 +328,69 @@ def _rhmsg_publish(topic, msg):
         producer.send(outgoing_msg)
 
 
+class _RhmsgBatchSender(BatchSender):
+    """
+    Sends the messages to Unified Message Bus through one AMQProducer kept
+    open between the batches. The producer is connected again only after
+    it fails to send the messages.
+    """
+
+    def __init__(self, publish):
+        super(_RhmsgBatchSender, self).__init__(publish)
+        self.producer = None
+
+    def send(self, messages):
+        """
+        Sends the messages, the consecutive messages with the same topic are
+        sent at once. Only the messages which were not sent yet are sent
+        again when the sending fails.
+
+        :param list messages: List of (topic, msg) tuples.
+        """
+        idx = 0
+        while idx < len(messages):
+            topic = messages[idx][0]
+            msgs = []
+            while idx < len(messages) and messages[idx][0] == topic:
+                msgs.append(messages[idx][1])
+                idx += 1
+            self._send_topic(topic, msgs)
+
+    @retry(wait_on=(RuntimeError,), logger=log)
+    def _send_topic(self, topic, msgs):
+        import proton
+        from rhmsg.activemq.producer import AMQProducer
+
+        config = conf.messaging_backends['rhmsg']
+        if self.producer is None:
+            self.producer = AMQProducer(
+                urls=config['BROKER_URLS'],
+                certificate=config['CERT_FILE'],
+                private_key=config['KEY_FILE'],
+                trusted_certificates=config['CA_CERT'])
+
+        outgoing_msgs = []
+        for msg in msgs:
+            outgoing_msg = proton.Message()
+            outgoing_msg.body = json.dumps(msg)
+            outgoing_msgs.append(outgoing_msg)
+        try:
+            self.producer.through_topic('{0}.{1}'.format(config['TOPIC_PREFIX'], topic))
+            self.producer.send(*outgoing_msgs)
+        except Exception:
+            # Reconnect on the next attempt.
+            self.close()
+            raise
+
+    def close(self):
+        if self.producer is not None:
+            producer, self.producer = self.producer, None
+            try:
+                producer.close()
+            except Exception:
+                log.exception("Failed to close the UMB producer.")
+
+
 # A counter used for in-memory messages.
 _in_memory_msg_id = 0
 _initial_messages = []
@@ -138,6 +434,7 @@ _messaging_backends = {
         'publish': _in_memory_publish
     },
     'rhmsg': {
-        'publish': _rhmsg_publish
+        'publish': _rhmsg_publish,
+        'batch_sender': _RhmsgBatchSender,
     }
 }
@@ -0,0 +1,37 @@
+"""Add indexes for the frequently used Event and ArtifactBuild queries
+
+Revision ID: 5b8e2d1f6a90
+Revises: c4e8a7d2f913
+Create Date: 2026-10-17 16:21:09.734512
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5b8e2d1f6a90'
+down_revision = 'c4e8a7d2f913'
+
+from alembic import op
+
+
+def upgrade():
+    op.create_index('idx_event_search_key_event_type_id', 'events',
+                    ['search_key', 'event_type_id'], unique=False)
+    op.create_index('idx_event_state_time_created', 'events',
+                    ['state', 'time_created'], unique=False)
+    op.create_index('idx_artifact_build_type_build_id', 'artifact_builds',
+                    ['type', 'build_id'], unique=False)
+    op.create_index('idx_artifact_build_rebuilt_nvr_type', 'artifact_builds',
+                    ['rebuilt_nvr', 'type'], unique=False)
+    op.create_index('idx_artifact_build_dep_on_id_state_type', 'artifact_builds',
+                    ['dep_on_id', 'state', 'type'], unique=False)
+    op.create_index('idx_artifact_build_event_id_state', 'artifact_builds',
+                    ['event_id', 'state'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_artifact_build_event_id_state', table_name='artifact_builds')
+    op.drop_index('idx_artifact_build_dep_on_id_state_type', table_name='artifact_builds')
+    op.drop_index('idx_artifact_build_rebuilt_nvr_type', table_name='artifact_builds')
+    op.drop_index('idx_artifact_build_type_build_id', table_name='artifact_builds')
+    op.drop_index('idx_event_state_time_created', table_name='events')
+    op.drop_index('idx_event_search_key_event_type_id', table_name='events')
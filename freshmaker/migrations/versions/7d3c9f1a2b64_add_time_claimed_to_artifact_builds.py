@@ -0,0 +1,22 @@
+"""Add time_claimed to artifact_builds
+
+Revision ID: 7d3c9f1a2b64
+Revises: 5b8e2d1f6a90
+Create Date: 2026-10-17 21:12:40.518233
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '7d3c9f1a2b64'
+down_revision = '5b8e2d1f6a90'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('artifact_builds', sa.Column('time_claimed', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('artifact_builds', 'time_claimed')
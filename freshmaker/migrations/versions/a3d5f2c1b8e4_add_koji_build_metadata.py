@@ -0,0 +1,33 @@
+"""Add koji_build_metadata table
+
+Revision ID: a3d5f2c1b8e4
+Revises: fcba8824bf8d
+Create Date: 2026-10-17 09:12:41.318205
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'a3d5f2c1b8e4'
+down_revision = 'fcba8824bf8d'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('koji_build_metadata',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('nvr', sa.String(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('data', sa.Text(), nullable=True),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('time_created', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_koji_build_metadata_nvr_kind', 'koji_build_metadata',
+                    ['nvr', 'kind'], unique=True)
+
+
+def downgrade():
+    op.drop_index('idx_koji_build_metadata_nvr_kind', table_name='koji_build_metadata')
+    op.drop_table('koji_build_metadata')
@@ -0,0 +1,36 @@
+"""Add queued_events table
+
+Revision ID: c4e8a7d2f913
+Revises: a3d5f2c1b8e4
+Create Date: 2026-10-17 14:03:27.518930
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a7d2f913'
+down_revision = 'a3d5f2c1b8e4'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table('queued_events',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('idempotency_key', sa.String(), nullable=False),
+    sa.Column('event_type', sa.String(), nullable=False),
+    sa.Column('data', sa.Text(), nullable=False),
+    sa.Column('time_created', sa.DateTime(), nullable=False),
+    sa.Column('time_claimed', sa.DateTime(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('time_failed', sa.DateTime(), nullable=True),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('idx_queued_events_idempotency_key', 'queued_events',
+                    ['idempotency_key'], unique=True)
+
+
+def downgrade():
+    op.drop_index('idx_queued_events_idempotency_key', table_name='queued_events')
+    op.drop_table('queued_events')
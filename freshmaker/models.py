@@ -25,22 +25,24 @@
 """
 
 import json
+import uuid
 
 from collections import defaultdict
-from datetime import datetime
-from sqlalchemy.orm import (validates, relationship)
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import (aliased, validates, relationship)
 from sqlalchemy.schema import Index
-from sqlalchemy.sql.expression import false
+from sqlalchemy.sql.expression import false, literal
 
 from flask_login import UserMixin
 
-from freshmaker import db, log
+from freshmaker import conf, db, log
 from freshmaker import messaging
 from freshmaker.utils import get_url_for
 from freshmaker.types import (ArtifactType, ArtifactBuildState, EventState,
                               RebuildReason)
 from freshmaker.events import (
-    MBSModuleStateChangeEvent, GitModuleMetadataChangeEvent,
+    BaseEvent, MBSModuleStateChangeEvent, GitModuleMetadataChangeEvent,
     GitRPMSpecChangeEvent, TestingEvent, GitDockerfileChangeEvent,
     BodhiUpdateCompleteStableEvent, KojiTaskStateChangeEvent, BrewSignRPMEvent,
     ErrataAdvisoryRPMsSignedEvent, BrewContainerTaskStateChangeEvent,
@@ -74,6 +76,10 @@ EVENT_TYPES = {
 
 INVERSE_EVENT_TYPES = {v: k for k, v in EVENT_TYPES.items()}
 
+# Maximum length of the chains of builds followed by the recursive queries,
+# so broken data with cycles in these chains cannot loop forever.
+MAX_BUILD_CHAIN_DEPTH = 1000
+
 
 def _utc_datetime_to_iso(datetime_object):
     """
@@ -159,6 +165,18 @@ class Event(FreshmakerBase):
     builds = relationship("ArtifactBuild", back_populates="event",
                           lazy="dynamic", cascade="all, delete-orphan",
                           passive_deletes=True)
+    # Events this Event depends on and Events depending on this Event.
+    # Use add_event_dependency() to add new dependency.
+    event_dependencies = relationship(
+        "Event", secondary="event_dependencies",
+        primaryjoin="Event.id == EventDependency.event_id",
+        secondaryjoin="Event.id == EventDependency.event_dependency_id",
+        order_by="EventDependency.id", viewonly=True)
+    depending_events = relationship(
+        "Event", secondary="event_dependencies",
+        primaryjoin="Event.id == EventDependency.event_dependency_id",
+        secondaryjoin="Event.id == EventDependency.event_id",
+        order_by="EventDependency.id", viewonly=True)
     # True if the even should be handled in dry run mode.
     dry_run = db.Column(db.Boolean, default=False)
     # For manual rebuilds, set to user requesting the rebuild. Otherwise null.
@@ -312,34 +330,14 @@ class Event(FreshmakerBase):
             dep = EventDependency(event_id=self.id,
                                   event_dependency_id=event.id)
             session.add(dep)
+            # The relationships are view-only, so reload them on next access.
+            session.expire(self, ["event_dependencies"])
+            session.expire(event, ["depending_events"])
+            self._dependency_builds_by_nvr = None
             return dep
         else:
             return None
 
-    @property
-    def event_dependencies(self):
-        """
-        Returns the list of Events this Event depends on.
-        """
-        events = []
-        deps = EventDependency.query.filter_by(event_id=self.id).all()
-        for dep in deps:
-            events.append(Event.query.filter_by(
-                id=dep.event_dependency_id).first())
-        return events
-
-    @property
-    def depending_events(self):
-        """
-        Returns the list of Events depending on this Event.
-        """
-        depending_events = []
-        parents = EventDependency.query.filter_by(event_dependency_id=self.id).all()
-        for p in parents:
-            depending_events.append(Event.query.filter_by(
-                id=p.event_id).first())
-        return depending_events
-
     def has_all_builds_in_state(self, state):
         """
         Returns True when all builds are in the given `state`.
@@ -403,8 +401,13 @@ class Event(FreshmakerBase):
             EventState(state).counter.inc()
 
         db.session.commit()
-        messaging.publish('event.state.changed', self.json())
-        messaging.publish('event.state.changed.min', self.json_min())
+        data = self.json()
+        messaging.publish('event.state.changed', data)
+        # The min representation differs only in the builds, so count their
+        # states in the database instead of serializing them once again.
+        data_min = {k: v for k, v in data.items() if k != 'builds'}
+        data_min['builds_summary'] = Event.get_builds_summaries([self])[self.id]
+        messaging.publish('event.state.changed.min', data_min)
 
         return True
 
@@ -426,19 +429,86 @@ class Event(FreshmakerBase):
 
     def json(self):
         data = self._common_json()
-        data['builds'] = [b.json() for b in self.builds]
+        data['builds'] = ArtifactBuild.bulk_json(self.builds.order_by(ArtifactBuild.id).all())
         return data
 
-    def json_min(self):
-        builds_summary = defaultdict(int)
-        builds_summary['total'] = len(self.builds.all())
-        for build in self.builds:
-            state_name = ArtifactBuildState(build.state).name
-            builds_summary[state_name] += 1
+    @classmethod
+    def bulk_json(cls, events):
+        """
+        Returns the JSON representation of all the `events`, the same as
+        `Event.json()` returns for single event. The builds of all the events
+        are loaded and serialized using a fixed number of SQL queries.
 
-        data = self._common_json()
-        data['builds_summary'] = dict(builds_summary)
-        return data
+        :param list events: List of Event instances.
+        :rtype: list
+        """
+        builds_by_event_id = defaultdict(list)
+        if events:
+            builds = ArtifactBuild.query.filter(
+                ArtifactBuild.event_id.in_([event.id for event in events])
+            ).order_by(ArtifactBuild.id).all()
+            for build, build_json in zip(builds, ArtifactBuild.bulk_json(builds)):
+                builds_by_event_id[build.event_id].append(build_json)
+
+        ret = []
+        for event in events:
+            data = event._common_json()
+            data['builds'] = builds_by_event_id[event.id]
+            ret.append(data)
+        return ret
+
+    @classmethod
+    def get_builds_summaries(cls, events):
+        """
+        Returns the summary of the build states for each of the `events`,
+        counted by single SQL query.
+
+        :param list events: List of Event instances.
+        :return: Dict with the event id as a key and the dict with the total
+            number of builds and the number of builds in each state as
+            a value.
+        :rtype: dict
+        """
+        summaries = {}
+        for event in events:
+            summaries[event.id] = {'total': 0}
+
+        if not summaries:
+            return summaries
+
+        rows = db.session.query(
+            ArtifactBuild.event_id, ArtifactBuild.state,
+            db.func.count(ArtifactBuild.id)
+        ).filter(
+            ArtifactBuild.event_id.in_(list(summaries.keys()))
+        ).group_by(ArtifactBuild.event_id, ArtifactBuild.state).all()
+
+        for event_id, state, count in rows:
+            summary = summaries[event_id]
+            summary['total'] += count
+            summary[ArtifactBuildState(state).name] = count
+        return summaries
+
+    @classmethod
+    def bulk_json_min(cls, events):
+        """
+        Returns the minimal JSON representation of all the `events`, the same
+        as `Event.json_min()` returns for single event, with the builds
+        summaries counted by single SQL query.
+
+        :param list events: List of Event instances.
+        :rtype: list
+        """
+        summaries = cls.get_builds_summaries(events)
+        ret = []
+        for event in events:
+            data = event._common_json()
+            data['builds_summary'] = summaries[event.id]
+            ret.append(data)
+        return ret
+
+    def json_min(self):
+        return Event.bulk_json_min([self])[0]
 
     def _common_json(self):
         event_url = get_url_for('event', id=self.id)
@@ -471,16 +541,19 @@ class Event(FreshmakerBase):
         Dependent events of may also rebuild some same images that current event
         will build. So, for building images found from current event, we also
         need those YUM repositories used to build images in dependent events.
-        """
-        builds_nvrs = [build.name for build in self.builds]
 
+        The dependencies are found and added by single INSERT ... SELECT
+        statement and the dependent events are loaded by one more query.
+        """
         states = [EventState.INITIALIZED.value,
                   EventState.BUILDING.value,
                   EventState.COMPLETE.value]
 
-        query = db.session.query(ArtifactBuild.event_id)
-        dep_event_ids = query.join(ArtifactBuild.event).filter(
-            ArtifactBuild.name.in_(builds_nvrs),
+        this_build = aliased(ArtifactBuild)
+        dep_event_ids = db.session.query(ArtifactBuild.event_id).join(
+            this_build, this_build.name == ArtifactBuild.name
+        ).join(ArtifactBuild.event).filter(
+            this_build.event_id == self.id,
             ArtifactBuild.event_id != self.id,
             ArtifactBuild.type == ArtifactType.IMAGE.value,
             Event.manual_triggered == false(),
@@ -488,12 +561,26 @@ class Event(FreshmakerBase):
             Event.state.in_(states),
         ).distinct()
 
-        dep_events = []
-        query = db.session.query(Event)
-        for row in dep_event_ids:
-            dep_event = query.filter_by(id=row[0]).first()
-            self.add_event_dependency(db.session, dep_event)
-            dep_events.append(dep_event)
+        # Skip the dependencies added already, the same as add_event_dependency
+        # does. This works on both PostgreSQL and SQLite, unlike the dialect
+        # specific ON CONFLICT clauses.
+        existing_dep = db.session.query(EventDependency.id).filter(
+            EventDependency.event_id == self.id,
+            EventDependency.event_dependency_id == ArtifactBuild.event_id,
+        ).exists()
+        new_deps = dep_event_ids.filter(~existing_dep).with_entities(
+            literal(self.id), ArtifactBuild.event_id)
+        db.session.execute(EventDependency.__table__.insert().from_select(
+            ["event_id", "event_dependency_id"], new_deps))
+
+        dep_events = db.session.query(Event).filter(
+            Event.id.in_(dep_event_ids.subquery().select())).order_by(Event.id).all()
+
+        # The relationships are view-only, so reload them on next access.
+        db.session.expire(self, ["event_dependencies"])
+        self._dependency_builds_by_nvr = None
+        for dep_event in dep_events:
+            db.session.expire(dep_event, ["depending_events"])
         db.session.commit()
         return dep_events
 
@@ -503,17 +590,43 @@ class Event(FreshmakerBase):
         of the parent event). `nvr` is used as `original_nvr` when finding the `ArtifactBuild`.
         It returns all the parent artifact builds from the first found event dependency.
         If the build is not found, it returns None.
+
+        The builds of all the event dependencies are loaded by single query
+        on the first call and kept in this Event instance, so the handler can
+        call this method for every image it records.
+        """
+        builds_by_nvr = getattr(self, "_dependency_builds_by_nvr", None)
+        if builds_by_nvr is None:
+            builds_by_nvr = self._get_dependency_builds_by_nvr()
+            self._dependency_builds_by_nvr = builds_by_nvr
+        return builds_by_nvr.get(nvr)
+
+    def _get_dependency_builds_by_nvr(self):
+        """
+        Returns dict with original_nvr as a key and the list of the `DONE`
+        artifact builds from the first event dependency which built that
+        NVR as a value.
         """
-        for parent_event in self.event_dependencies:
-            parent_build = db.session.query(
-                ArtifactBuild).filter_by(event_id=parent_event.id,
-                                         original_nvr=nvr,
-                                         state=ArtifactBuildState.DONE.value).all()
-            if parent_build:
-                return parent_build
+        builds = db.session.query(ArtifactBuild).join(
+            EventDependency,
+            EventDependency.event_dependency_id == ArtifactBuild.event_id,
+        ).filter(
+            EventDependency.event_id == self.id,
+            ArtifactBuild.state == ArtifactBuildState.DONE.value,
+            ArtifactBuild.original_nvr.isnot(None),
+        ).order_by(EventDependency.id, ArtifactBuild.id).all()
+
+        builds_by_nvr = {}
+        for build in builds:
+            nvr_builds = builds_by_nvr.setdefault(build.original_nvr, [])
+            if not nvr_builds or nvr_builds[0].event_id == build.event_id:
+                nvr_builds.append(build)
+        return builds_by_nvr
 
 
 Index('idx_event_message_id', Event.message_id, unique=True)
+Index('idx_event_search_key_event_type_id', Event.search_key, Event.event_type_id)
+Index('idx_event_state_time_created', Event.state, Event.time_created)
 
 
 class EventDependency(FreshmakerBase):
@@ -541,6 +654,9 @@ class ArtifactBuild(FreshmakerBase):
     state_reason = db.Column(db.String, nullable=True)
     time_submitted = db.Column(db.DateTime, nullable=False)
     time_completed = db.Column(db.DateTime)
+    # Time when the PLANNED build has been claimed by `claim` for the
+    # submission to the build system.
+    time_claimed = db.Column(db.DateTime)
 
     # Link to the Artifact on which this one depends and which triggered
     # the rebuild of this Artifact.
@@ -595,6 +711,63 @@ class ArtifactBuild(FreshmakerBase):
         session.add(build)
         return build
 
+    @classmethod
+    def record_plan(cls, session, event, plan):
+        """
+        Records all the builds of the rebuild plan of `event` in single
+        transaction and sends single ``event.builds.recorded`` message
+        instead of the message for each of them.
+
+        :param session: the `db.session`.
+        :param Event event: Event the builds are recorded for.
+        :param list plan: List of dicts describing the builds in the order
+            they are recorded. Each dict contains the "name", "original_nvr"
+            and "state" keys and optionally the "type" (defaults to
+            ``ArtifactType.IMAGE``), "state_reason", "rebuild_reason" and
+            "build_args" keys. The optional "dep_on" key is either
+            an ArtifactBuild or the original NVR of the build recorded earlier
+            in the same `plan`.
+        :rtype: dict
+        :return: Dict with the original NVR as a key and the recorded
+            ArtifactBuild as a value.
+        """
+        if not plan:
+            return {}
+
+        now = datetime.utcnow()
+        builds = {}
+        for item in plan:
+            dep_on = item.get("dep_on")
+            if isinstance(dep_on, str):
+                dep_on = builds[dep_on]
+            build = cls(
+                name=item["name"],
+                original_nvr=item["original_nvr"],
+                type=item.get("type", ArtifactType.IMAGE.value),
+                event=event,
+                state=item["state"],
+                state_reason=item.get("state_reason") or None,
+                build_args=item.get("build_args"),
+                time_submitted=now,
+                dep_on=dep_on,
+                rebuild_reason=item.get("rebuild_reason", RebuildReason.UNKNOWN.value),
+            )
+            if build.state in [ArtifactBuildState.DONE.value,
+                               ArtifactBuildState.FAILED.value,
+                               ArtifactBuildState.CANCELED.value]:
+                build.time_completed = now
+            if ArtifactBuildState(build.state).counter:
+                ArtifactBuildState(build.state).counter.inc()
+            builds[build.original_nvr] = build
+
+        session.add_all(builds.values())
+        session.commit()
+
+        data = event._common_json()
+        data["builds"] = cls.bulk_json(list(builds.values()))
+        messaging.publish("event.builds.recorded", data)
+        return builds
+
     @validates('state')
     def validate_state(self, key, field):
         if field in [s.value for s in list(ArtifactBuildState)]:
@@ -636,12 +809,45 @@ class ArtifactBuild(FreshmakerBase):
 
         Return the NVR of most original image
         """
-        original_nvr = None
-        build = db.session.query(ArtifactBuild).filter(cls.rebuilt_nvr == nvr).first()
-        while build:
-            original_nvr = build.original_nvr
-            build = db.session.query(ArtifactBuild).filter(cls.rebuilt_nvr == original_nvr).first()
-        return original_nvr
+        return cls.get_most_original_nvrs([nvr]).get(nvr)
+
+    @classmethod
+    def get_most_original_nvrs(cls, nvrs):
+        """
+        Get the most original NVRs of all the `nvrs` using single recursive
+        SQL query following the rebuilt_nvr -> original_nvr chain.
+
+        :param list nvrs: List of NVRs.
+        :rtype: dict
+        :return: Dict with NVR as a key and the NVR of the most original
+            image as a value. NVRs which were not built by freshmaker are
+            not included.
+        """
+        if not nvrs:
+            return {}
+
+        chain = db.session.query(
+            cls.rebuilt_nvr.label("nvr"),
+            cls.original_nvr.label("original_nvr"),
+            literal(1).label("depth"),
+        ).filter(cls.rebuilt_nvr.in_(nvrs)).cte("nvr_chain", recursive=True)
+        parent = aliased(cls)
+        chain = chain.union_all(
+            db.session.query(
+                chain.c.nvr, parent.original_nvr, chain.c.depth + 1,
+            ).filter(
+                parent.rebuilt_nvr == chain.c.original_nvr,
+                # Stop in case the NVRs form a cycle.
+                chain.c.depth < MAX_BUILD_CHAIN_DEPTH,
+            )
+        )
+
+        ret = {}
+        rows = db.session.query(
+            chain.c.nvr, chain.c.original_nvr).order_by(chain.c.depth).all()
+        for nvr, original_nvr in rows:
+            ret[nvr] = original_nvr
+        return ret
 
     @property
     def bundle_pullspec_overrides(self):
@@ -694,6 +900,10 @@ class ArtifactBuild(FreshmakerBase):
             return False
 
         self.state = state
+        # The claim belongs to the PLANNED state only, so the build can be
+        # claimed again once it is moved back to the PLANNED state.
+        self._claimed = False
+        self.time_claimed = None
         if ArtifactBuildState(state).counter:
             ArtifactBuildState(state).counter.inc()
 
@@ -708,58 +918,232 @@ class ArtifactBuild(FreshmakerBase):
         # can rebuild them.
         if self.state in [ArtifactBuildState.FAILED.value,
                           ArtifactBuildState.CANCELED.value]:
-            for build in self.depending_artifact_builds():
-                build.transition(
-                    self.state, "Cannot build artifact, because its "
-                    "dependency cannot be built.")
-
+            self._transition_depending_artifact_builds(
+                self.state, "Cannot build artifact, because its "
+                "dependency cannot be built.")
+
+        # The build may be transitioned before it is stored in the database,
+        # so flush it to get the ID needed by json().
+        if self.id is None:
+            db.session.flush()
         messaging.publish('build.state.changed', self.json())
 
         return True
 
+    @property
+    def claimed(self):
+        """
+        True if this artifact build has been claimed by `claim` and it has
+        not been moved to other state since then.
+        """
+        return getattr(self, "_claimed", False)
+
+    def claim(self):
+        """
+        Atomically claims this PLANNED artifact build for the submission to
+        the build system using conditional UPDATE, so the build is submitted
+        only once, even when handlers of several events processed
+        concurrently try to submit it. The caller is expected to commit the
+        claim right away.
+
+        The build stays in the PLANNED state until it is moved to other state
+        by `transition` once it is submitted, or until the claim is returned
+        by `release_claim`. The claim which is not resolved within
+        ``conf.container_build_claim_timeout`` seconds, for example because
+        the backend crashed before submitting the build, expires and the
+        build can be claimed again.
+
+        :return: True if the build has been claimed, False if it is not
+            in the PLANNED state anymore or it is claimed by someone else.
+        :rtype: bool
+        """
+        if self.claimed:
+            return True
+        # Store the pending changes, for example the move of failed build
+        # back to the PLANNED state when it is retried.
+        db.session.flush()
+        now = datetime.utcnow()
+        expired = now - timedelta(seconds=conf.container_build_claim_timeout)
+        self._claimed = db.session.query(ArtifactBuild).filter(
+            ArtifactBuild.id == self.id,
+            ArtifactBuild.state == ArtifactBuildState.PLANNED.value,
+            db.or_(ArtifactBuild.time_claimed.is_(None),
+                   ArtifactBuild.time_claimed < expired),
+        ).update({ArtifactBuild.time_claimed: now},
+                 synchronize_session=False) == 1
+        if not self._claimed:
+            log.info("Artifact build %r is not in PLANNED state anymore or "
+                     "it is being submitted already, it is not submitted "
+                     "again.", self)
+        # Load the new state and claim.
+        db.session.expire(self, ["state", "time_claimed"])
+        return self._claimed
+
+    def release_claim(self):
+        """
+        Returns the claim of this artifact build, so it can be submitted
+        later. The change is not committed.
+        """
+        if self.claimed:
+            self._claimed = False
+            self.time_claimed = None
+
+    def _transition_depending_artifact_builds(self, state, state_reason):
+        """
+        Moves all the artifact builds depending on this one, directly or
+        transitively, to the `state` using single UPDATE statement and sends
+        single ``builds.state.changed`` message with all of them.
+
+        The builds already in the `state` are not changed, nor are the builds
+        depending on them, the same as if `transition` was called
+        for each depending build.
+
+        :return: list of ids of the changed artifact builds.
+        """
+        chain = db.session.query(ArtifactBuild.id.label("id")).filter(
+            ArtifactBuild.dep_on_id == self.id,
+            ArtifactBuild.state != state,
+        ).cte("depending_builds", recursive=True)
+        child = aliased(ArtifactBuild)
+        # UNION instead of UNION ALL, so the query ends even if the dep_on
+        # references form a cycle.
+        chain = chain.union(
+            db.session.query(child.id).filter(
+                child.dep_on_id == chain.c.id,
+                child.state != state,
+            )
+        )
+        build_ids = [row[0] for row in db.session.query(chain.c.id)]
+        if not build_ids:
+            return []
+
+        log.info("Artifact builds %r depending on %r moved to state %s, %r" % (
+            build_ids, self, ArtifactBuildState(state).name, state_reason))
+
+        values = {"state": state, "state_reason": state_reason}
+        if state in [ArtifactBuildState.DONE.value,
+                     ArtifactBuildState.FAILED.value,
+                     ArtifactBuildState.CANCELED.value]:
+            values["time_completed"] = datetime.utcnow()
+        db.session.query(ArtifactBuild).filter(
+            ArtifactBuild.id.in_(build_ids)
+        ).update(values, synchronize_session=False)
+
+        # Reload the changed builds which are already in the session.
+        for obj in list(db.session.identity_map.values()):
+            if isinstance(obj, ArtifactBuild) and obj.id in build_ids:
+                db.session.expire(obj)
+
+        if ArtifactBuildState(state).counter:
+            ArtifactBuildState(state).counter.inc(len(build_ids))
+
+        builds = ArtifactBuild.query.filter(
+            ArtifactBuild.id.in_(build_ids)).order_by(ArtifactBuild.id).all()
+        messaging.publish('builds.state.changed', {
+            "builds": ArtifactBuild.bulk_json(builds),
+        })
+        return build_ids
+
     def __repr__(self):
         return "<ArtifactBuild %s, type %s, state %s, event %s>" % (
             self.name, ArtifactType(self.type).name,
             ArtifactBuildState(self.state).name, self.event.message_id)
 
     def json(self):
-        build_args = {}
-        if self.build_args:
-            build_args = json.loads(self.build_args)
+        return ArtifactBuild.bulk_json([self])[0]
 
-        build_url = get_url_for('build', id=self.id)
-        db.session.add(self)
-        return {
-            "id": self.id,
-            "name": self.name,
-            "original_nvr": self.original_nvr,
-            "rebuilt_nvr": self.rebuilt_nvr,
-            "type": self.type,
-            "type_name": ArtifactType(self.type).name,
-            "state": self.state,
-            "state_name": ArtifactBuildState(self.state).name,
-            "state_reason": self.state_reason,
-            "dep_on": self.dep_on.name if self.dep_on else None,
-            "dep_on_id": self.dep_on.id if self.dep_on else None,
-            "time_submitted": _utc_datetime_to_iso(self.time_submitted),
-            "time_completed": _utc_datetime_to_iso(self.time_completed),
-            "event_id": self.event_id,
-            "build_id": self.build_id,
-            "url": build_url,
-            "build_args": build_args,
-            "odcs_composes": [rel.compose.odcs_compose_id for rel in self.composes],
-            "rebuild_reason": RebuildReason(self.rebuild_reason or 0).name.lower()
-        }
+    @classmethod
+    def bulk_json(cls, builds):
+        """
+        Returns the JSON representation of all the `builds`, the same as
+        `ArtifactBuild.json()` returns for single build. The names of builds
+        the `builds` depend on and the ODCS compose IDs are loaded using two
+        SQL queries, no matter how many builds there are.
+
+        :param list builds: List of ArtifactBuild instances already stored
+            in the database.
+        :rtype: list
+        """
+        if not builds:
+            return []
+
+        assert all(build.id for build in builds), \
+            "ArtifactBuild.bulk_json() requires builds stored in the database."
+
+        dep_on_ids = {build.dep_on_id for build in builds if build.dep_on_id}
+        dep_on_names = {}
+        if dep_on_ids:
+            dep_on_names = dict(db.session.query(cls.id, cls.name).filter(
+                cls.id.in_(dep_on_ids)))
+
+        odcs_composes = defaultdict(list)
+        rows = db.session.query(
+            ArtifactBuildCompose.build_id, Compose.odcs_compose_id
+        ).join(Compose, ArtifactBuildCompose.compose_id == Compose.id).filter(
+            ArtifactBuildCompose.build_id.in_([build.id for build in builds])
+        ).order_by(ArtifactBuildCompose.build_id, ArtifactBuildCompose.compose_id)
+        for build_id, odcs_compose_id in rows:
+            odcs_composes[build_id].append(odcs_compose_id)
+
+        ret = []
+        for build in builds:
+            build_args = {}
+            if build.build_args:
+                build_args = json.loads(build.build_args)
+
+            build_url = get_url_for('build', id=build.id)
+            ret.append({
+                "id": build.id,
+                "name": build.name,
+                "original_nvr": build.original_nvr,
+                "rebuilt_nvr": build.rebuilt_nvr,
+                "type": build.type,
+                "type_name": ArtifactType(build.type).name,
+                "state": build.state,
+                "state_name": ArtifactBuildState(build.state).name,
+                "state_reason": build.state_reason,
+                "dep_on": dep_on_names.get(build.dep_on_id),
+                "dep_on_id": build.dep_on_id if build.dep_on_id in dep_on_names else None,
+                "time_submitted": _utc_datetime_to_iso(build.time_submitted),
+                "time_completed": _utc_datetime_to_iso(build.time_completed),
+                "event_id": build.event_id,
+                "build_id": build.build_id,
+                "url": build_url,
+                "build_args": build_args,
+                "odcs_composes": odcs_composes[build.id],
+                "rebuild_reason": RebuildReason(build.rebuild_reason or 0).name.lower()
+            })
+        return ret
 
     def get_root_dep_on(self):
-        dep_on = self.dep_on
-        while dep_on:
-            dep = dep_on.dep_on
-            if dep:
-                dep_on = dep
-            else:
-                break
-        return dep_on
+        """
+        Returns the ArtifactBuild at the root of the dep_on chain of this
+        build using single recursive SQL query, or None if this build does
+        not depend on any other build.
+        """
+        if self.dep_on_id is None:
+            if self.dep_on is None:
+                return None
+            # The dep_on has not been flushed to database yet.
+            db.session.flush()
+
+        chain = db.session.query(
+            ArtifactBuild.id.label("id"),
+            ArtifactBuild.dep_on_id.label("dep_on_id"),
+            literal(1).label("depth"),
+        ).filter(ArtifactBuild.id == self.dep_on_id).cte("dep_on_chain", recursive=True)
+        parent = aliased(ArtifactBuild)
+        chain = chain.union_all(
+            db.session.query(
+                parent.id, parent.dep_on_id, chain.c.depth + 1,
+            ).filter(
+                parent.id == chain.c.dep_on_id,
+                chain.c.depth < MAX_BUILD_CHAIN_DEPTH,
+            )
+        )
+        return db.session.query(ArtifactBuild).join(
+            chain, ArtifactBuild.id == chain.c.id
+        ).order_by(chain.c.depth.desc()).first()
 
     def add_composes(self, session, composes):
         """Add an ODCS compose to this build"""
@@ -786,6 +1170,13 @@ class ArtifactBuild(FreshmakerBase):
         return list({b.original_nvr for b in builds.all()})
 
 
+Index('idx_artifact_build_type_build_id', ArtifactBuild.type, ArtifactBuild.build_id)
+Index('idx_artifact_build_rebuilt_nvr_type', ArtifactBuild.rebuilt_nvr, ArtifactBuild.type)
+Index('idx_artifact_build_dep_on_id_state_type', ArtifactBuild.dep_on_id,
+      ArtifactBuild.state, ArtifactBuild.type)
+Index('idx_artifact_build_event_id_state', ArtifactBuild.event_id, ArtifactBuild.state)
+
+
 class Compose(FreshmakerBase):
     __tablename__ = 'composes'
 
@@ -831,3 +1222,277 @@ class ArtifactBuildCompose(FreshmakerBase):
 
     build = db.relationship('ArtifactBuild', back_populates='composes')
     compose = db.relationship('Compose', back_populates='builds')
+
+
+class KojiBuildMetadata(FreshmakerBase):
+    """
+    Persistent cache of immutable facts about Koji builds, keyed by NVR.
+
+    Each row stores one `kind` of data (for example "additional_data" or
+    "odcs_compose_ids") for a single NVR. Successful lookups are kept for
+    `conf.koji_build_metadata_cache_ttl` seconds, failed lookups (with
+    `error` set) only for `conf.koji_build_metadata_negative_cache_ttl`
+    seconds.
+
+    The cache is accessed using its own connection, so reading or writing
+    it never commits or rolls back the caller's `db.session`. Any database
+    error is logged and treated as a cache miss.
+    """
+    __tablename__ = "koji_build_metadata"
+
+    id = db.Column(db.Integer, primary_key=True)
+    nvr = db.Column(db.String, nullable=False)
+    kind = db.Column(db.String, nullable=False)
+    # JSON encoded cached value.
+    data = db.Column(db.Text, nullable=True)
+    # Set when the lookup failed, the row is then a negative cache entry.
+    error = db.Column(db.String, nullable=True)
+    time_created = db.Column(db.DateTime, nullable=False)
+
+    @staticmethod
+    def _expiration_dates():
+        now = datetime.utcnow()
+        return (
+            now - timedelta(seconds=conf.koji_build_metadata_cache_ttl),
+            now - timedelta(seconds=conf.koji_build_metadata_negative_cache_ttl),
+        )
+
+    @classmethod
+    def get_cached(cls, nvr, kind):
+        """
+        Returns the cached `kind` of data for build `nvr`.
+
+        :param str nvr: NVR of the Koji build.
+        :param str kind: Kind of the cached data.
+        :return: None if there is no valid cache entry, otherwise tuple
+            (data, error) where `error` is None for positive entries.
+        :rtype: tuple or None
+        """
+        if conf.koji_build_metadata_cache_ttl <= 0:
+            return None
+
+        table = cls.__table__
+        try:
+            with db.engine.connect() as conn:
+                row = conn.execute(
+                    table.select().where(table.c.nvr == nvr).where(table.c.kind == kind)
+                ).first()
+        except SQLAlchemyError as e:
+            log.warning("Cannot read cached %s of %s: %s", kind, nvr, e)
+            return None
+
+        if row is None:
+            return None
+
+        positive_expiration, negative_expiration = cls._expiration_dates()
+        if row.error is not None:
+            if row.time_created < negative_expiration:
+                return None
+            return None, row.error
+        if row.time_created < positive_expiration:
+            return None
+        return json.loads(row.data), None
+
+    @classmethod
+    def set_cached(cls, nvr, kind, data=None, error=None):
+        """
+        Stores the `kind` of data for build `nvr` in the cache, replacing
+        the previous entry if there is any.
+
+        :param str nvr: NVR of the Koji build.
+        :param str kind: Kind of the cached data.
+        :param data: JSON serializable data to cache.
+        :param str error: When set, stores negative cache entry with this
+            error message instead of `data`.
+        """
+        if conf.koji_build_metadata_cache_ttl <= 0:
+            return
+
+        table = cls.__table__
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(
+                    table.delete().where(table.c.nvr == nvr).where(table.c.kind == kind))
+                conn.execute(table.insert().values(
+                    nvr=nvr,
+                    kind=kind,
+                    data=json.dumps(data) if error is None else None,
+                    error=error,
+                    time_created=datetime.utcnow(),
+                ))
+        except SQLAlchemyError as e:
+            # Most likely another worker cached the same data in the meantime.
+            log.warning("Cannot cache %s of %s: %s", kind, nvr, e)
+
+    @classmethod
+    def evict_expired(cls, session):
+        """
+        Removes expired positive and negative cache entries.
+
+        :return: Number of removed entries.
+        :rtype: int
+        """
+        positive_expiration, negative_expiration = cls._expiration_dates()
+        count = session.query(cls).filter(
+            cls.error.is_(None), cls.time_created < positive_expiration
+        ).delete(synchronize_session=False)
+        count += session.query(cls).filter(
+            cls.error.isnot(None), cls.time_created < negative_expiration
+        ).delete(synchronize_session=False)
+        session.commit()
+        return count
+
+
+Index('idx_koji_build_metadata_nvr_kind', KojiBuildMetadata.nvr, KojiBuildMetadata.kind,
+      unique=True)
+
+
+class QueuedEvent(FreshmakerBase):
+    """
+    Durable queue of the internal events, for example the events returned
+    by the handlers for further work or injected by the producer.
+
+    The event is stored before it is put into the in-memory work queue of
+    the consumer and removed (acknowledged) once it is processed. The events
+    which have not been acknowledged before the backend stopped are loaded
+    again when the consumer starts, so every event is processed at least
+    once. The events which cannot be loaded again, for example because
+    their class has been renamed, are kept in the queue marked as failed.
+
+    Like the `KojiBuildMetadata`, the queue is accessed using its own
+    connection, so it never commits or rolls back the caller's `db.session`.
+    """
+    __tablename__ = "queued_events"
+
+    id = db.Column(db.Integer, primary_key=True)
+    # Only one event with the same idempotency key can be queued at once.
+    idempotency_key = db.Column(db.String, nullable=False)
+    # Name of the event class, for debugging purposes.
+    event_type = db.Column(db.String, nullable=False)
+    # Event serialized by `BaseEvent.dumps`.
+    data = db.Column(db.Text, nullable=False)
+    time_created = db.Column(db.DateTime, nullable=False)
+    # Time when the event was last put into the in-memory work queue.
+    time_claimed = db.Column(db.DateTime, nullable=True)
+    # Number of times the event has been put into the in-memory work queue.
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    # Time when the event failed to load and the reason why. Failed events
+    # are not claimed anymore.
+    time_failed = db.Column(db.DateTime, nullable=True)
+    error = db.Column(db.String, nullable=True)
+
+    @classmethod
+    def enqueue(cls, event, idempotency_key=None):
+        """
+        Stores the `event` in the queue as claimed by the caller, who is
+        responsible for processing and acknowledging it.
+
+        :param BaseEvent event: Event to store.
+        :param str idempotency_key: Events with the same key are stored only
+            once until they are acknowledged. Random key is used when not set.
+        :return: ID of the queued event or None if the event with the same
+            idempotency key is already queued.
+        :rtype: int or None
+        :raises SQLAlchemyError: When the event cannot be stored.
+        :raises TypeError: When the event cannot be serialized.
+        """
+        data = event.dumps()
+        now = datetime.utcnow()
+        table = cls.__table__
+        try:
+            with db.engine.begin() as conn:
+                result = conn.execute(table.insert().values(
+                    idempotency_key=idempotency_key or str(uuid.uuid4()),
+                    event_type=type(event).__name__,
+                    data=data,
+                    time_created=now,
+                    time_claimed=now,
+                    attempts=1,
+                ))
+        except IntegrityError:
+            return None
+        return result.inserted_primary_key[0]
+
+    @classmethod
+    def dequeue(cls, limit, claimed_before, max_attempts=None):
+        """
+        Claims at most `limit` queued events which have not been claimed
+        since `claimed_before`, in the order they have been queued.
+
+        The events which cannot be loaded or which have been claimed
+        `max_attempts` times already are marked as failed and kept in the
+        queue, so they can be investigated and fixed.
+
+        :param int limit: Maximum number of events to claim.
+        :param datetime claimed_before: Only the events claimed before this
+            time are claimed again.
+        :param int max_attempts: Maximum number of times the event is claimed.
+            Not limited when None.
+        :return: List of (id, event) tuples.
+        :rtype: list
+        """
+        now = datetime.utcnow()
+        table = cls.__table__
+        ret = []
+        with db.engine.begin() as conn:
+            rows = conn.execute(
+                table.select().where(
+                    table.c.time_failed.is_(None),
+                    (table.c.time_claimed.is_(None)) |
+                    (table.c.time_claimed < claimed_before)
+                ).order_by(table.c.id).limit(limit).with_for_update(skip_locked=True)
+            ).fetchall()
+            if not rows:
+                return ret
+
+            conn.execute(table.update().where(
+                table.c.id.in_([row.id for row in rows])
+            ).values(time_claimed=now, attempts=table.c.attempts + 1))
+
+            for row in rows:
+                if max_attempts is not None and row.attempts >= max_attempts:
+                    log.error("Queued %s event %d has not been processed in %d "
+                              "attempts, marking it as failed.",
+                              row.event_type, row.id, row.attempts)
+                    conn.execute(table.update().where(
+                        table.c.id == row.id
+                    ).values(time_failed=now, error="Not processed in %d attempts." % (
+                        row.attempts)))
+                    continue
+                try:
+                    ret.append((row.id, BaseEvent.loads(row.data)))
+                except Exception as e:
+                    log.exception("Cannot load queued %s event %d, marking it "
+                                  "as failed.", row.event_type, row.id)
+                    conn.execute(table.update().where(
+                        table.c.id == row.id
+                    ).values(time_failed=now, error=str(e)))
+        return ret
+
+    @classmethod
+    def renew(cls, ids):
+        """
+        Renews the claim of the events which are still being processed, so
+        they are not claimed by `dequeue` of other backend.
+
+        :param list ids: IDs of the claimed events.
+        """
+        table = cls.__table__
+        with db.engine.begin() as conn:
+            conn.execute(table.update().where(
+                table.c.id.in_(ids), table.c.time_failed.is_(None)
+            ).values(time_claimed=datetime.utcnow()))
+
+    @classmethod
+    def ack(cls, ids):
+        """
+        Removes the processed events from the queue.
+
+        :param list ids: IDs of the processed events.
+        """
+        table = cls.__table__
+        with db.engine.begin() as conn:
+            conn.execute(table.delete().where(table.c.id.in_(ids)))
+
+
+Index('idx_queued_events_idempotency_key', QueuedEvent.idempotency_key, unique=True)
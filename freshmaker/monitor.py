@@ -32,6 +32,7 @@ from prometheus_client import (  # noqa: F401
 from sqlalchemy import event
 
 # Service-specific imports
+from freshmaker import conf
 
 
 if not os.environ.get('prometheus_multiproc_dir'):
@@ -74,6 +75,20 @@ messaging_tx_failed_counter = Counter(
     'messaging_tx_failed',
     'Number of messages, for which the sender failed',
     registry=registry)
+messaging_tx_coalesced_counter = Counter(
+    'messaging_tx_coalesced',
+    'Number of messages, which were not sent, because they were replaced '
+    'by newer message of the same event',
+    registry=registry)
+messaging_tx_queue_depth = Histogram(
+    'messaging_tx_queue_depth',
+    'Number of messages waiting in the publisher queue when new message is added',
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, float("inf")),
+    registry=registry)
+messaging_tx_send_latency = Histogram(
+    'messaging_tx_send_latency',
+    'Time in seconds needed to send single batch of messages',
+    registry=registry)
 
 db_engine_connect_counter = Counter(
     'db_engine_connect',
@@ -88,6 +103,21 @@ db_transaction_rollback_counter = Counter(
     'Number of transactions, which were rolled back',
     registry=registry)
 
+http_requests_counter = Counter(
+    'http_requests',
+    'Number of HTTP requests sent to the external service',
+    ['service'],
+    registry=registry)
+http_new_connections_counter = Counter(
+    'http_new_connections',
+    'Number of new HTTP connections opened to the external service, '
+    'requests not opening new connection reused a pooled one',
+    ['service'],
+    registry=registry)
+for service in ('lightblue', 'pyxis', 'errata', 'pulp'):
+    http_requests_counter.labels(service=service)
+    http_new_connections_counter.labels(service=service)
+
 # Service-specific metrics
 freshmaker_artifact_build_done_counter = Counter(
     'freshmaker_artifact_build_done',
@@ -126,6 +156,30 @@ freshmaker_event_api_latency = Histogram(
     'event_api_latency',
     'EventAPI latency', registry=registry)
 
+freshmaker_consumer_lane_queue_depth = Histogram(
+    'consumer_lane_queue_depth',
+    'Number of events waiting in the consumer lane when new event is added',
+    ['lane'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, float("inf")),
+    registry=registry)
+freshmaker_consumer_lane_wait_time = Histogram(
+    'consumer_lane_wait_time',
+    'Time in seconds the event waited in the consumer lane',
+    ['lane'],
+    buckets=(0.1, 1, 5, 15, 60, 300, 900, 1800, 3600, float("inf")),
+    registry=registry)
+# The "bulk" lane processes the events not assigned to any configured lane.
+for lane in set(conf.consumer_lanes) | {'bulk'}:
+    freshmaker_consumer_lane_queue_depth.labels(lane=lane)
+    freshmaker_consumer_lane_wait_time.labels(lane=lane)
+freshmaker_koji_tasks_poll_latency = Histogram(
+    'koji_tasks_poll_latency',
+    'Latency of polling the state of unfinished Koji tasks', registry=registry)
+freshmaker_koji_tasks_polled_counter = Counter(
+    'koji_tasks_polled',
+    'Number of Koji tasks, which state was queried from Koji',
+    registry=registry)
+
 
 def db_hook_event_listeners(target=None):
     # Service-specific import of db
@@ -158,44 +158,83 @@ class FreshmakerODCSClient(object):
             of found tag.
         :rtype: str
         """
+        return self._get_compose_sources([nvr])[0]
+
+    def _get_compose_sources(self, nvrs):
+        """Get tags from which to collect packages to compose for multiple
+        builds. All the Koji queries are done in two multicalls.
+        :param list nvrs: build NVRs used to find correct tags.
+        :return: list of found tags in the same order as `nvrs`, see
+            ``_get_compose_source``.
+        :rtype: list
+        """
         with koji_service(
                 conf.koji_profile, log, dry_run=self.handler.dry_run) as service:
-            # Get the list of *-candidate tags, because packages added into
-            # Errata should be tagged into -candidate tag.
-            tags = service.session.listTags(nvr)
-            candidate_tags = [tag['name'] for tag in tags
-                              if tag['name'].endswith('-candidate')]
-
-            # Candidate tags may include unsigned packages and ODCS won't
-            # allow generating compose from them, so try to find out final
-            # version of candidate tag (without the "-candidate" suffix).
-            final_tags = []
-            for candidate_tag in candidate_tags:
-                final = candidate_tag[:-len("-candidate")]
-                final_tags += [tag['name'] for tag in tags
-                               if tag['name'] == final]
-
-            # Prefer final tags over candidate tags.
-            tags_to_try = final_tags + candidate_tags
-            for tag in tags_to_try:
-                latest_build = service.session.listTagged(
-                    tag,
-                    latest=True,
-                    package=koji.parse_NVR(nvr)['name'])
-                if latest_build and latest_build[0]['nvr'] == nvr:
-                    self.handler.log_info(
-                        "Package %r is latest version in tag %r, "
-                        "will use this tag", nvr, tag)
-                    return tag
-                elif not latest_build:
-                    self.handler.log_info(
-                        "Could not find package %r in tag %r, "
-                        "skipping this tag", nvr, tag)
-                else:
-                    self.handler.log_info(
-                        "Package %r is not he latest in the tag %r ("
-                        "latest is %r), skipping this tag",
-                        nvr, tag, latest_build[0]['nvr'])
+            # For every build, find out the tags to try in order of
+            # preference.
+            nvrs_tags_to_try = []
+            calls = []
+            for nvr, tags in zip(nvrs, service.multicall(
+                    [("listTags", (nvr, )) for nvr in nvrs])):
+                if isinstance(tags, Exception):
+                    raise tags
+
+                # Get the list of *-candidate tags, because packages added into
+                # Errata should be tagged into -candidate tag.
+                candidate_tags = [tag['name'] for tag in tags
+                                  if tag['name'].endswith('-candidate')]
+
+                # Candidate tags may include unsigned packages and ODCS won't
+                # allow generating compose from them, so try to find out final
+                # version of candidate tag (without the "-candidate" suffix).
+                final_tags = []
+                for candidate_tag in candidate_tags:
+                    final = candidate_tag[:-len("-candidate")]
+                    final_tags += [tag['name'] for tag in tags
+                                   if tag['name'] == final]
+
+                # Prefer final tags over candidate tags.
+                tags_to_try = final_tags + candidate_tags
+                nvrs_tags_to_try.append(tags_to_try)
+                package = koji.parse_NVR(nvr)['name']
+                calls += [
+                    ("listTagged", (tag, ), {"latest": True, "package": package})
+                    for tag in tags_to_try]
+
+            latest_builds = iter(service.multicall(calls))
+
+        sources = []
+        for nvr, tags_to_try in zip(nvrs, nvrs_tags_to_try):
+            tags_latest_builds = [
+                (tag, next(latest_builds)) for tag in tags_to_try]
+            sources.append(self._find_compose_source(nvr, tags_latest_builds))
+        return sources
+
+    def _find_compose_source(self, nvr, tags_latest_builds):
+        """Returns the first tag in which the `nvr` is the latest build.
+        :param str nvr: build NVR.
+        :param list tags_latest_builds: list of (tag, latest builds in tag)
+            tuples in order of preference.
+        :rtype: str
+        """
+        for tag, latest_build in tags_latest_builds:
+            if isinstance(latest_build, Exception):
+                raise latest_build
+            if latest_build and latest_build[0]['nvr'] == nvr:
+                self.handler.log_info(
+                    "Package %r is latest version in tag %r, "
+                    "will use this tag", nvr, tag)
+                return tag
+            elif not latest_build:
+                self.handler.log_info(
+                    "Could not find package %r in tag %r, "
+                    "skipping this tag", nvr, tag)
+            else:
+                self.handler.log_info(
+                    "Package %r is not he latest in the tag %r ("
+                    "latest is %r), skipping this tag",
+                    nvr, tag, latest_build[0]['nvr'])
+        return None
 
     def get_compose(self, compose_id):
         """ Get compose info from ODCS
@@ -250,9 +289,10 @@ class FreshmakerODCSClient(object):
         errata = Errata()
         builds = errata.get_srpm_nvrs(errata_id)
         compose_source = None
-        for nvr in builds:
+        builds = list(builds)
+        sources = self._get_compose_sources(builds)
+        for nvr, source in zip(builds, sources):
             packages += self._get_packages_for_compose(nvr)
-            source = self._get_compose_source(nvr)
             if compose_source and compose_source != source:
                 # TODO: Handle this by generating two ODCS composes
                 db_event.builds_transition(
@@ -30,6 +30,8 @@ from freshmaker.types import EventState, ArtifactBuildState
 from freshmaker.kojiservice import koji_service
 from freshmaker.events import BrewContainerTaskStateChangeEvent
 from freshmaker.consumer import work_queue_put
+from freshmaker.monitor import (
+    freshmaker_koji_tasks_poll_latency, freshmaker_koji_tasks_polled_counter)
 
 
 try:
@@ -41,12 +43,25 @@ except ImportError:
     _sa_disconnect_exceptions = (StatementError,)  # type: ignore
 
 
+# Maps the numeric Koji task state to its name.
+_KOJI_TASK_STATES = {v: k for k, v in koji.TASK_STATES.items()}
+
+
 class FreshmakerProducer(PollingProducer):
     frequency = timedelta(seconds=conf.polling_interval)
 
+    def __init__(self, hub):
+        super(FreshmakerProducer, self).__init__(hub)
+        # Koji task ID -> final state of the tasks, which are already known
+        # to be finished and do not have to be polled from Koji again.
+        self._finished_tasks = {}
+        # Time of the last removal of the expired Koji build metadata.
+        self._metadata_evicted_at = None
+
     def poll(self):
         try:
             self.check_unfinished_koji_tasks(db.session)
+            self.evict_expired_koji_build_metadata(db.session)
         except _sa_disconnect_exceptions as ex:
             db.session.rollback()
             log.error("Invalid request, session is rolled back: %s", ex.orig)
@@ -57,26 +72,59 @@ class FreshmakerProducer(PollingProducer):
         log.info('Poller will now sleep for "{}" seconds'
                  .format(conf.polling_interval))
 
+    def evict_expired_koji_build_metadata(self, session):
+        """
+        Removes the expired Koji build metadata from the database, at most
+        once per KOJI_BUILD_METADATA_EVICTION_INTERVAL seconds.
+        """
+        now = datetime.utcnow()
+        interval = timedelta(seconds=conf.koji_build_metadata_eviction_interval)
+        if (self._metadata_evicted_at is not None and
+                now - self._metadata_evicted_at < interval):
+            return
+        models.KojiBuildMetadata.evict_expired(session)
+        self._metadata_evicted_at = now
+
+    @freshmaker_koji_tasks_poll_latency.time()
     def check_unfinished_koji_tasks(self, session):
         stale_date = datetime.utcnow() - timedelta(days=7)
-        db_events = session.query(models.Event).filter(
+        builds = session.query(
+            models.ArtifactBuild.name, models.ArtifactBuild.build_id).join(
+            models.Event, models.ArtifactBuild.event_id == models.Event.id).filter(
             models.Event.state == EventState.BUILDING.value,
-            models.Event.time_created >= stale_date).all()
+            models.Event.time_created >= stale_date,
+            models.ArtifactBuild.state == ArtifactBuildState.BUILD.value,
+            models.ArtifactBuild.build_id > 0).all()
 
-        for db_event in db_events:
-            for build in db_event.builds:
-                if build.state != ArtifactBuildState.BUILD.value:
-                    continue
-                if build.build_id <= 0:
+        # Forget the finished tasks of builds which are not in the BUILD
+        # state anymore, so the cache does not grow indefinitely.
+        task_ids = {build_id for _, build_id in builds}
+        for task_id in list(self._finished_tasks):
+            if task_id not in task_ids:
+                del self._finished_tasks[task_id]
+
+        to_poll = sorted(task_ids - set(self._finished_tasks))
+        if to_poll:
+            with koji_service(
+                    conf.koji_profile, log, login=False) as koji_session:
+                tasks = koji_session.get_task_infos(to_poll)
+            freshmaker_koji_tasks_polled_counter.inc(len(to_poll))
+
+            for task_id, task in zip(to_poll, tasks):
+                if isinstance(task, Exception) or not task:
+                    log.error("Cannot get Koji task %s: %s", task_id, task)
                     continue
-                with koji_service(
-                        conf.koji_profile, log, login=False) as koji_session:
-                    task = koji_session.get_task_info(build.build_id)
-                    task_states = {v: k for k, v in koji.TASK_STATES.items()}
-                    new_state = task_states[task["state"]]
-                    if new_state not in ["FAILED", "CLOSED"]:
-                        continue
-                    event = BrewContainerTaskStateChangeEvent(
-                        "fake event", build.name, None, None, build.build_id,
-                        "BUILD", new_state)
-                    work_queue_put(event)
+                new_state = _KOJI_TASK_STATES[task["state"]]
+                if new_state in ["FAILED", "CLOSED"]:
+                    self._finished_tasks[task_id] = new_state
+
+        # The state change event is generated on every poll until the build
+        # leaves the BUILD state, the same way as if it was polled from Koji.
+        for name, build_id in builds:
+            if build_id not in self._finished_tasks:
+                continue
+            event = BrewContainerTaskStateChangeEvent(
+                "fake event", name, None, None, build_id,
+                "BUILD", self._finished_tasks[build_id])
+            work_queue_put(event, idempotency_key="koji-task-%d-%s" % (
+                build_id, self._finished_tasks[build_id]))
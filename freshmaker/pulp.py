@@ -25,6 +25,7 @@ import json
 import requests
 
 from freshmaker.utils import retry
+from freshmaker.httpsession import get_session
 from freshmaker import conf
 
 
@@ -38,7 +39,7 @@ class Pulp(object):
         self.rest_api_root = '{0}/pulp/api/v2/'.format(self.server_url.rstrip('/'))
 
     def _rest_post(self, endpoint, post_data):
-        r = requests.post(
+        r = get_session("pulp").post(
             '{0}{1}'.format(self.rest_api_root, endpoint.lstrip('/')),
             post_data,
             auth=(self.username, self.password),
@@ -47,7 +48,7 @@ class Pulp(object):
         return r.json()
 
     def _rest_get(self, endpoint, **kwargs):
-        r = requests.get(
+        r = get_session("pulp").get(
             '{0}{1}'.format(self.rest_api_root, endpoint.lstrip('/')),
             params=kwargs,
             auth=(self.username, self.password),
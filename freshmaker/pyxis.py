@@ -1,11 +1,12 @@
 import dogpile.cache
-import requests
 import urllib
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from requests_kerberos import HTTPKerberosAuth, OPTIONAL
 import semver
 
 from freshmaker import log, conf
+from freshmaker.httpsession import get_session
 from freshmaker.utils import get_ocp_release_date
 
 
@@ -56,9 +57,9 @@ class Pyxis(object):
         """
         entity_url = urllib.parse.urljoin(self._api_root, entity)
 
-        auth_method = HTTPKerberosAuth(mutual_authentication=OPTIONAL)
-        response = requests.get(entity_url, params=params, auth=auth_method,
-                                timeout=conf.net_timeout)
+        session = get_session(
+            "pyxis", auth=lambda: HTTPKerberosAuth(mutual_authentication=OPTIONAL))
+        response = session.get(entity_url, params=params, timeout=conf.net_timeout)
 
         if response.ok:
             return response.json()
@@ -88,6 +89,76 @@ class Pyxis(object):
 
         return self._make_request(path, params=query_params)
 
+    def _get_page(self, entity, params, page):
+        """
+        Request single page of `entity` from Pyxis
+
+        :param str entity: what data/entity to request from Pyxis
+        :param dict params: parameters to add to GET request
+        :param int page: number of the page, starting with 0
+        :return: Json response from Pyxis
+        :rtype: dict
+        """
+        return self._make_request(entity, params={**params, "page": page})
+
+    def _iter_pagination(self, entity, params):
+        """
+        Process all pages in Pyxis and yield the 'data' items as soon as
+        their page is received.
+
+        The first page is used to find out the total number of items, the
+        remaining pages are then requested concurrently. The items are always
+        yielded in the same order as returned by Pyxis.
+
+        :param str entity: what data/entity to request from Pyxis
+        :param dict params: parameters to add to GET request
+        :return: generator of all 'data' fields from responses from Pyxis
+        :rtype: generator
+        """
+        local_params = {"page_size": str(conf.pyxis_page_size)}
+        local_params.update(params)
+        # When only some fields are requested, the total must be requested too.
+        include = local_params.get("include")
+        if isinstance(include, str) and "total" not in include.split(","):
+            local_params["include"] = include + ",total"
+
+        response_data = self._get_page(entity, local_params, 0)
+        if not response_data.get('data'):
+            return
+        yield from response_data['data']
+
+        total = response_data.get("total")
+        if total is None:
+            # Without the total, fall back to requesting the pages one by one.
+            # When the page after the actual last page is reached, data will be
+            # an empty list.
+            page = 1
+            while True:
+                response_data = self._get_page(entity, local_params, page)
+                if not response_data.get('data'):
+                    break
+                yield from response_data['data']
+                page += 1
+            return
+
+        page_size = int(local_params["page_size"])
+        pages = range(1, (total + page_size - 1) // page_size)
+        if not pages:
+            return
+
+        executor = ThreadPoolExecutor(max_workers=min(conf.max_thread_workers, len(pages)))
+        futures = [
+            executor.submit(self._get_page, entity, local_params, page) for page in pages
+        ]
+        try:
+            for future in futures:
+                yield from future.result().get('data', [])
+        finally:
+            # Do not request the remaining pages when the caller stops early.
+            for future in futures:
+                future.cancel()
+            executor.shutdown(wait=False)
+
     def _pagination(self, entity, params):
         """
         Process all pages in Pyxis
@@ -97,20 +168,7 @@ class Pyxis(object):
         :return: list of all 'data' fields from responses from Pyxis
         :rtype: list
         """
-        local_params = {"page_size": "100"}
-        local_params.update(params)
-        ret = []
-        page = 0
-        while True:
-            local_params["page"] = page
-            response_data = self._make_request(entity, params=local_params)
-            # When the page after the actual last page is reached, data will be an empty list
-            if not response_data.get('data'):
-                break
-            ret.extend(response_data['data'])
-            page += 1
-
-        return ret
+        return list(self._iter_pagination(entity, params))
 
     def get_operator_indices(self):
         """ Get all index images for organization(s)(configurable) from Pyxis """
@@ -205,7 +263,7 @@ class Pyxis(object):
         request_params = {'include': ','.join(['data.brew', 'data.repositories'])}
 
         # get manifest_list_digest of ContainerImage from Pyxis
-        for image in self._pagination(f'images/nvr/{nvr}', request_params):
+        for image in self._iter_pagination(f'images/nvr/{nvr}', request_params):
             for repo in image['repositories']:
                 if must_be_published and not repo['published']:
                     continue
@@ -213,15 +271,42 @@ class Pyxis(object):
                     return repo['manifest_list_digest']
         return None
 
+    @staticmethod
+    def get_related_image_digest_index(bundles):
+        """
+        Build index of bundles by the digests of their related images.
+
+        :param iterable bundles: bundles to index, for example the result
+            of ``get_latest_bundles``
+        :return: dict with related image digest as a key and list of bundles
+            having this digest in related images as a value
+        :rtype: dict
+        """
+        index = {}
+        for bundle in bundles:
+            digests = {img.get('digest') for img in bundle.get('related_images', [])}
+            for digest in digests:
+                index.setdefault(digest, []).append(bundle)
+        return index
+
     def get_bundles_by_related_image_digest(self, image_digest, bundles):
         """
         Get bundles that have the specified image digest in related images.
 
+        When looking up multiple digests in the same bundles, build the index
+        by ``get_related_image_digest_index`` once and pass it as `bundles`.
+
         :param str image_digest: digest of related image
-        :param list bundles: list of bundles to search from
+        :param bundles: bundles to search from, for example the generator
+            returned by ``_iter_pagination``, or the index returned by
+            ``get_related_image_digest_index``
+        :type bundles: iterable or dict
         :return: list of bundles
         :rtype: list
         """
+        if isinstance(bundles, dict):
+            return list(bundles.get(image_digest, []))
+
         ret = []
         for bundle in bundles:
             if any(image_digest == img.get('digest') for img in bundle.get('related_images', [])):
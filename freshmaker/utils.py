@@ -21,6 +21,7 @@
 #
 
 import functools
+import re
 import requests
 import subprocess
 import sys
@@ -41,36 +42,164 @@ def _cmp(a, b):
     return (a > b) - (a < b)
 
 
+# Ranks of the version segments as ordered by rpmvercmp. The "~" sorts before
+# everything else including the end of the version string, the "^" sorts
+# after the end of the version string, but before any other segment and
+# numeric segments are always newer than alphabetic ones.
+_RPMVERCMP_TILDE = (0, "")
+_RPMVERCMP_END = (1, "")
+_RPMVERCMP_CARET = (2, "")
+_RPMVERCMP_ALPHA = 3
+_RPMVERCMP_NUMERIC = 4
+_RPMVERCMP_SEGMENTS = re.compile(r"~|\^|[0-9]+|[a-zA-Z]+")
+
+
+def rpmvercmp_key(version):
+    """
+    Returns the key for sorting the version or release strings in the same
+    order as rpmvercmp (``rpm.labelCompare``) does.
+
+    :param str version: Version or release string.
+    :rtype: tuple
+    :return: Tuple of (rank, value) pairs.
+    """
+    key = []
+    for segment in _RPMVERCMP_SEGMENTS.findall(version):
+        if segment == "~":
+            key.append(_RPMVERCMP_TILDE)
+        elif segment == "^":
+            key.append(_RPMVERCMP_CARET)
+        elif segment.isdigit():
+            key.append((_RPMVERCMP_NUMERIC, int(segment)))
+        else:
+            key.append((_RPMVERCMP_ALPHA, segment))
+    key.append(_RPMVERCMP_END)
+    return tuple(key)
+
+
+@functools.total_ordering
+class NVR(object):
+    """
+    Parsed N-V-R with precomputed key for sorting.
+
+    The instances are immutable and interned, use ``NVR.parse`` or
+    ``NVR.parse_nvra`` to get them. The NVRs are ordered by name and then by
+    epoch, version and release the same way as ``kobo.rpmlib.compare_nvr``
+    orders them.
+    """
+    __slots__ = ("nvr", "name", "version", "release", "epoch", "evr_key", "sort_key")
+
+    def __init__(self, nvr, name, version, release, epoch):
+        self.nvr = nvr
+        self.name = name
+        self.version = version
+        self.release = release
+        self.epoch = epoch
+        self.evr_key = (
+            rpmvercmp_key(epoch), rpmvercmp_key(version), rpmvercmp_key(release))
+        self.sort_key = (name, self.evr_key)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=65536)
+    def parse(nvr):
+        """
+        Parses the N-V-R string.
+
+        :param str nvr: N-V-R string in any format accepted by
+            ``kobo.rpmlib.parse_nvr``.
+        :rtype: NVR
+        :raises ValueError: If `nvr` is not valid N-V-R.
+        """
+        parsed = kobo.rpmlib.parse_nvr(nvr)
+        return NVR(
+            nvr, parsed["name"], parsed["version"], parsed["release"], parsed["epoch"])
+
+    @staticmethod
+    @functools.lru_cache(maxsize=65536)
+    def parse_nvra(nvra):
+        """
+        Parses the N-V-R.A string, the architecture is dropped.
+
+        :param str nvra: N-V-R.A string in any format accepted by
+            ``kobo.rpmlib.parse_nvra``.
+        :rtype: NVR
+        :raises ValueError: If `nvra` is not valid N-V-R.A.
+        """
+        parsed = kobo.rpmlib.parse_nvra(nvra)
+        return NVR(
+            nvra, parsed["name"], parsed["version"], parsed["release"], parsed["epoch"])
+
+    def compare(self, other, ignore_epoch=False):
+        """
+        Compares this NVR with the `other` one with the same name.
+
+        :param NVR other: NVR to compare with.
+        :param bool ignore_epoch: ignore epoch during the comparison.
+        :rtype: int
+        :return: 1 if this NVR is newer than `other`, 0 if they are the same,
+            -1 if this NVR is older.
+        :raises ValueError: If the names of the NVRs are different.
+        """
+        if self.name != other.name:
+            raise ValueError(
+                "Package names doesn't match: %s, %s" % (self.name, other.name))
+        if ignore_epoch:
+            return _cmp(self.evr_key[1:], other.evr_key[1:])
+        return _cmp(self.evr_key, other.evr_key)
+
+    def __eq__(self, other):
+        if not isinstance(other, NVR):
+            return NotImplemented
+        return self.sort_key == other.sort_key
+
+    def __lt__(self, other):
+        if not isinstance(other, NVR):
+            return NotImplemented
+        return self.sort_key < other.sort_key
+
+    def __hash__(self):
+        return hash(self.sort_key)
+
+    def __repr__(self):
+        return "NVR(%r)" % self.nvr
+
+    def __str__(self):
+        return self.nvr
+
+
+def nvr_sort_key(nvr):
+    """
+    Key function sorting the N-V-R strings by name, epoch, version and
+    release.
+
+    :param str nvr: N-V-R string.
+    :rtype: tuple
+    """
+    return NVR.parse(nvr).sort_key
+
+
 def sorted_by_nvr(lst, get_nvr=None, reverse=False):
     """
     Sorts the list `lst` containing NVR by the NVRs.
 
     :param list lst: List with NVRs to sort.
     :param fnc get_nvr: Function taking the item from a list and returning
-        the NVR. If None, the item from `lst` is expected to be NVR string.
+        the NVR. If None, the item from `lst` is expected to be NVR string
+        or to have the `nvr` attribute.
     :param bool reverse: When True, the result of sorting is reversed.
     :rtype: list
     :return: Sorted `lst`.
     """
-    def _compare_items(item1, item2):
+    def _get_key(item):
         if get_nvr:
-            nvr1 = get_nvr(item1)
-            nvr2 = get_nvr(item2)
-        elif hasattr(item1, 'nvr') and hasattr(item2, 'nvr'):
-            nvr1 = item1.nvr
-            nvr2 = item2.nvr
+            nvr = get_nvr(item)
+        elif hasattr(item, 'nvr'):
+            nvr = item.nvr
         else:
-            nvr1 = item1
-            nvr2 = item2
-
-        nvr1_dict = kobo.rpmlib.parse_nvr(nvr1)
-        nvr2_dict = kobo.rpmlib.parse_nvr(nvr2)
-        if nvr1_dict["name"] != nvr2_dict["name"]:
-            return _cmp(nvr1_dict["name"], nvr2_dict["name"])
-        return kobo.rpmlib.compare_nvr(nvr1_dict, nvr2_dict)
+            nvr = item
+        return nvr_sort_key(nvr)
 
-    return sorted(
-        lst, key=functools.cmp_to_key(_compare_items), reverse=reverse)
+    return sorted(lst, key=_get_key, reverse=reverse)
 
 
 def get_url_for(*args, **kwargs):
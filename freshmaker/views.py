@@ -278,9 +278,9 @@ class EventAPI(MethodView):
             }
 
             if not show_full_json:
-                json_data['items'] = [item.json_min() for item in p_query.items]
+                json_data['items'] = models.Event.bulk_json_min(p_query.items)
             else:
-                json_data['items'] = [item.json() for item in p_query.items]
+                json_data['items'] = models.Event.bulk_json(p_query.items)
 
             return jsonify(json_data), 200
 
@@ -447,7 +447,7 @@ class BuildAPI(MethodView):
             json_data = {
                 'meta': pagination_metadata(p_query, request.args)
             }
-            json_data['items'] = [item.json() for item in p_query.items]
+            json_data['items'] = models.ArtifactBuild.bulk_json(p_query.items)
 
             return jsonify(json_data), 200
 
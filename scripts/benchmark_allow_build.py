@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026  Red Hat, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Compares the speed of the BaseHandler.allow_build with the previous
+# implementation, which deep-copied the configuration and matched the raw
+# regular expressions on every call.
+# It is intended to be called from the top-level Freshmaker git repository.
+#
+
+import copy
+import logging
+import os
+import re
+import sys
+import timeit
+
+# Set the PYTHON_PATH to top level Freshmaker directory and also set
+# the FRESHMAKER_DEVELOPER_ENV to 1.
+sys.path.append(os.getcwd())
+os.environ["FRESHMAKER_DEVELOPER_ENV"] = "1"
+
+from freshmaker import conf, log  # noqa: E402
+from freshmaker.config import all_, any_  # noqa: E402
+from freshmaker.handlers import BaseHandler  # noqa: E402
+from freshmaker.types import ArtifactType  # noqa: E402
+
+ALLOWLIST = {
+    "global": {
+        "image": all_(
+            {"advisory_state": ["REL_PREP", "PUSH_READY", "IN_PUSH", "SHIPPED_LIVE"]},
+            any_(
+                {"advisory_security_impact": ["Critical", "Important"]},
+                {"advisory_highest_cve_severity": ["Critical", "Important"]},
+                {"has_hightouch_bugs": True},
+            ),
+        ),
+    },
+    "BenchmarkHandler": {
+        "image": any_(
+            {"advisory_name": r"RHSA-\d+:\d+", "image_name": ["openshift-.*", "ubi.*"]},
+            {"advisory_name": r"RHBA-\d+:\d+", "image_name": r"rhel-server-container"},
+        ),
+    },
+}
+BLOCKLIST = {
+    "BenchmarkHandler": {
+        "image": {"image_name": ["openshift-enterprise-.*-rhel7", r".*-source"]},
+    },
+}
+
+
+def legacy_match_rule(criteria, rule):
+    """ The rule matching as implemented before the rules were compiled. """
+    if isinstance(rule, list):
+        if not rule:
+            return False
+        operator = any if rule[0] == "any" else all
+        return operator([legacy_match_rule(criteria, subrule) for subrule in rule[1]])
+
+    if not (set(rule.keys()) & set(criteria.keys())):
+        return False
+
+    for key, value in criteria.items():
+        value_patterns = rule.get(key, None)
+        if value_patterns is None:
+            continue
+        if not isinstance(value_patterns, (tuple, list)):
+            value_patterns = [str(value_patterns)]
+        if not any((re.match(regex, str(value)) for regex in value_patterns)):
+            return False
+    return True
+
+
+def legacy_allow_build(handler_name, artifact_type, **criteria):
+    """ BaseHandler.allow_build as implemented before the rules were compiled. """
+    allowlist_rules = copy.deepcopy(conf.handler_build_allowlist.get("global", {}))
+    blocklist_rules = copy.deepcopy(conf.handler_build_blocklist.get("global", {}))
+    allowlist_rules.update(conf.handler_build_allowlist.get(handler_name, {}))
+    blocklist_rules.update(conf.handler_build_blocklist.get(handler_name, {}))
+
+    allowlist = allowlist_rules.get(artifact_type.name.lower(), [])
+    if legacy_match_rule(criteria, allowlist):
+        blocklist = blocklist_rules.get(artifact_type.name.lower(), [])
+        return not legacy_match_rule(criteria, blocklist)
+    return False
+
+
+class BenchmarkHandler(BaseHandler):
+    name = "BenchmarkHandler"
+
+    def __init__(self):
+        # Do not initialize the ODCS client, it is not needed here.
+        self._log_prefix = ""
+
+    def can_handle(self, event):
+        return False
+
+    def handle(self, event):
+        pass
+
+
+def main():
+    # Do not measure the debug logging.
+    log.setLevel(logging.INFO)
+    conf.handler_build_allowlist = ALLOWLIST
+    conf.handler_build_blocklist = BLOCKLIST
+    handler = BenchmarkHandler()
+
+    # Typical set of candidate images evaluated for a single advisory.
+    candidates = [
+        {
+            "advisory_name": "RHSA-2021:%d" % (1000 + i % 5),
+            "advisory_state": "SHIPPED_LIVE",
+            "advisory_security_impact": "Important",
+            "advisory_highest_cve_severity": "Important",
+            "has_hightouch_bugs": False,
+            "image_name": name,
+        }
+        for i, name in enumerate(
+            ["openshift-%d" % i for i in range(300)] +
+            ["ubi8-%d" % i for i in range(100)] +
+            ["openshift-enterprise-%d-rhel7" % i for i in range(100)]
+        )
+    ]
+
+    for criteria in candidates:
+        assert (handler.allow_build(ArtifactType.IMAGE, **criteria) ==
+                legacy_allow_build(handler.name, ArtifactType.IMAGE, **criteria))
+
+    def run_legacy():
+        for criteria in candidates:
+            legacy_allow_build(handler.name, ArtifactType.IMAGE, **criteria)
+
+    def run_current():
+        for criteria in candidates:
+            handler.allow_build(ArtifactType.IMAGE, **criteria)
+
+    def run_current_cold():
+        # Replacing the configuration drops the compiled rules and verdicts.
+        conf.handler_build_allowlist = dict(ALLOWLIST)
+        run_current()
+
+    number = 20
+    for name, func in (("legacy", run_legacy),
+                       ("compiled, cold cache", run_current_cold),
+                       ("compiled, warm cache", run_current)):
+        seconds = min(timeit.repeat(func, number=number, repeat=3)) / number
+        print("%-22s %8.3f ms per %d allow_build calls" % (
+            name, seconds * 1000, len(candidates)))
+
+
+if __name__ == "__main__":
+    main()
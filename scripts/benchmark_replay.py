@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026  Red Hat, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+#
+#
+# Replays the LightBlue, Koji, Errata, Pyxis and ODCS traffic recorded by
+# vcrpy against the RebuildImagesOnRPMAdvisoryChange or HandleBotasAdvisory
+# handler and measures the wall time, number of requests per service, peak
+# RSS and the resulting batches of builds.
+#
+# The handler runs in DRY_RUN mode against an in-memory SQLite database,
+# so no build is submitted and the production database is never touched.
+#
+# At first, record the cassette with the traffic of the advisory. This needs
+# the access to the real services. The cassette recorded by LightBlue when
+# VCRPY_PATH is configured (<VCRPY_PATH>/<event_id>.yml) can be used as a
+# starting point, the missing requests are appended to it:
+#
+#   $ FRESHMAKER_CONFIG_FILE=/etc/freshmaker/config.py \
+#     python3 scripts/benchmark_replay.py --record --cassette rpm-12345.yml \
+#         rpm 12345
+#
+# Then replay it offline, optionally with synthetic latency added to every
+# request:
+#
+#   $ FRESHMAKER_CONFIG_FILE=/etc/freshmaker/config.py \
+#     python3 scripts/benchmark_replay.py --cassette rpm-12345.yml \
+#         --latency 50 rpm 12345
+#
+# The configuration must point to the same servers as when the cassette was
+# recorded, otherwise the requests do not match the cassette.
+#
+# Every run appends its results together with the current git commit to the
+# --results file (JSON lines) and prints the difference against the previous
+# run of the same scenario, so the performance regressions are visible
+# across commits.
+# It is intended to be called from the top-level Freshmaker git repository.
+#
+
+import argparse
+import collections
+import datetime
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+# Set the PYTHON_PATH to top level Freshmaker directory and also set
+# the FRESHMAKER_DEVELOPER_ENV to 1.
+sys.path.append(os.getcwd())
+os.environ["FRESHMAKER_DEVELOPER_ENV"] = "1"
+
+from freshmaker import app, conf, db, log  # noqa: E402
+from freshmaker.errata import Errata, ErrataAdvisory  # noqa: E402
+from freshmaker.events import (  # noqa: E402
+    BotasErrataShippedEvent, ErrataAdvisoryRPMsSignedEvent)
+from freshmaker.handlers.botas import HandleBotasAdvisory  # noqa: E402
+from freshmaker.handlers.koji import RebuildImagesOnRPMAdvisoryChange  # noqa: E402
+from freshmaker.models import ArtifactBuild, Event  # noqa: E402
+from freshmaker.types import EventState  # noqa: E402
+
+HANDLERS = {
+    "rpm": (RebuildImagesOnRPMAdvisoryChange, ErrataAdvisoryRPMsSignedEvent),
+    "botas": (HandleBotasAdvisory, BotasErrataShippedEvent),
+}
+
+# Request body is part of the match, because LightBlue queries and Koji
+# XML-RPC calls are all POST requests to the same URL.
+MATCH_ON = ["method", "scheme", "host", "port", "path", "query", "body"]
+
+
+def get_service_hosts():
+    """
+    Returns dict mapping the hostname to the name of the service.
+    """
+    urls = {
+        "lightblue": conf.lightblue_server_url,
+        "pyxis": conf.pyxis_server_url,
+        "errata": conf.errata_tool_server_url,
+        "odcs": conf.odcs_server_url,
+    }
+    try:
+        import koji
+        urls["koji"] = koji.read_config(conf.koji_profile)["server"]
+    except Exception as e:
+        log.warning("Cannot read the Koji profile %s: %s", conf.koji_profile, e)
+
+    return {urlparse(url).hostname: service for service, url in urls.items() if url}
+
+
+class RequestRecorder(object):
+    """
+    Counts the HTTP requests per service and adds synthetic latency to them.
+    """
+
+    def __init__(self, latency=0, jitter=0):
+        """
+        :param float latency: Latency added to every request in milliseconds.
+        :param float jitter: Maximum random latency in milliseconds added
+            on top of the `latency`.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.service_hosts = get_service_hosts()
+        self.requests = collections.Counter()
+        self._lock = threading.Lock()
+        self._orig_send = None
+
+    def _send(self, session, request, **kwargs):
+        hostname = urlparse(request.url).hostname
+        service = self.service_hosts.get(hostname, hostname)
+        with self._lock:
+            self.requests[service] += 1
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay:
+            time.sleep(delay / 1000.0)
+        return self._orig_send(session, request, **kwargs)
+
+    def __enter__(self):
+        self._orig_send = requests.Session.send
+        recorder = self
+
+        def send(session, request, **kwargs):
+            return recorder._send(session, request, **kwargs)
+
+        requests.Session.send = send
+        return self
+
+    def __exit__(self, *args):
+        requests.Session.send = self._orig_send
+
+
+def get_batches(db_event):
+    """
+    Returns the NVRs of the builds of `db_event` grouped to batches. Builds
+    in batch N depend on builds in batch N-1.
+    """
+    depths = {}
+
+    def _depth(build):
+        if build.id not in depths:
+            depths[build.id] = _depth(build.dep_on) + 1 if build.dep_on else 0
+        return depths[build.id]
+
+    batches = collections.defaultdict(list)
+    for build in db_event.builds:
+        batches[_depth(build)].append(build.original_nvr)
+    return [sorted(batches[depth]) for depth in sorted(batches)]
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL,
+            universal_newlines=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def run(args):
+    import vcr
+
+    handler_class, event_class = HANDLERS[args.handler]
+
+    # Use the fresh in-memory database, so the results do not depend on
+    # previous runs and the Koji build metadata cache is always cold.
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    conf.messaging_sender = "in_memory"
+    # All the traffic goes to the single cassette below, so do not let
+    # LightBlue record its requests separately.
+    conf.vcrpy_path = ""
+    db.create_all()
+
+    my_vcr = vcr.VCR(
+        record_mode="new_episodes" if args.record else "none",
+        match_on=MATCH_ON,
+        allow_playback_repeats=True,
+    )
+    with app.app_context(), my_vcr.use_cassette(args.cassette), \
+            RequestRecorder(args.latency, args.jitter) as recorder:
+        start = time.monotonic()
+        advisory = ErrataAdvisory.from_advisory_id(Errata(), args.errata_id)
+        event = event_class("benchmark-%s" % args.errata_id, advisory, dry_run=True)
+        handler = handler_class()
+        if not handler.can_handle(event):
+            raise ValueError(
+                "%s cannot handle advisory %s." % (handler.name, args.errata_id))
+        handler.handle(event)
+        wall_time = time.monotonic() - start
+
+        db_event = Event.query.filter_by(message_id=event.msg_id).first()
+        batches = get_batches(db_event) if db_event else []
+
+    return {
+        "commit": get_git_commit(),
+        "time": datetime.datetime.utcnow().isoformat(),
+        "scenario": os.path.basename(args.cassette),
+        "handler": handler_class.name,
+        "errata_id": args.errata_id,
+        "latency_ms": args.latency,
+        "jitter_ms": args.jitter,
+        "max_thread_workers": conf.max_thread_workers,
+        "wall_time_s": round(wall_time, 3),
+        "requests": dict(recorder.requests),
+        # ru_maxrss is in kilobytes on Linux.
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "event_state": EventState(db_event.state).name if db_event else None,
+        "builds": ArtifactBuild.query.count(),
+        "batches": batches,
+    }
+
+
+def find_previous_result(results_file, result):
+    """
+    Returns the last stored result of the same scenario as `result`.
+    """
+    if not os.path.exists(results_file):
+        return None
+
+    key = ("scenario", "handler", "latency_ms", "jitter_ms", "max_thread_workers")
+    previous = None
+    with open(results_file) as f:
+        for line in f:
+            stored = json.loads(line)
+            if all(stored.get(k) == result[k] for k in key):
+                previous = stored
+    return previous
+
+
+def print_result(result, previous):
+    def _diff(old):
+        if old is None:
+            return ""
+        return " (was %s)" % old
+
+    previous = previous or {}
+    print("Commit:        %s" % result["commit"])
+    print("Handler:       %s, advisory %s" % (result["handler"], result["errata_id"]))
+    print("Event state:   %s" % result["event_state"])
+    print("Wall time:     %.3fs%s" % (
+        result["wall_time_s"], _diff(previous.get("wall_time_s"))))
+    print("Peak RSS:      %d kB%s" % (
+        result["peak_rss_kb"], _diff(previous.get("peak_rss_kb"))))
+    print("Requests:")
+    for service, count in sorted(result["requests"].items()):
+        old_count = previous.get("requests", {}).get(service) if previous else None
+        print("  %-12s %d%s" % (service, count, _diff(old_count)))
+    print("Builds:        %d%s" % (result["builds"], _diff(previous.get("builds"))))
+    print("Batches:       %s" % [len(batch) for batch in result["batches"]])
+    if previous and previous.get("batches") != result["batches"]:
+        print("WARNING: The batches differ from the previous run of commit %s." % (
+            previous.get("commit")))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replays recorded traffic against Freshmaker handlers "
+                    "and measures their performance.")
+    parser.add_argument("handler", choices=sorted(HANDLERS),
+                        help="Handler to run, 'rpm' for RebuildImagesOnRPMAdvisoryChange, "
+                             "'botas' for HandleBotasAdvisory.")
+    parser.add_argument("errata_id", type=int, help="ID of the advisory.")
+    parser.add_argument("--cassette", required=True,
+                        help="Path to the vcrpy cassette with the recorded traffic.")
+    parser.add_argument("--record", action="store_true",
+                        help="Record the requests missing in the cassette. "
+                             "Without this option, the benchmark runs offline.")
+    parser.add_argument("--latency", type=float, default=0,
+                        help="Synthetic latency in milliseconds added to every request.")
+    parser.add_argument("--jitter", type=float, default=0,
+                        help="Maximum random latency in milliseconds added on top of "
+                             "--latency.")
+    parser.add_argument("--results", default="benchmark-results.jsonl",
+                        help="File the results are appended to.")
+    args = parser.parse_args()
+
+    result = run(args)
+    previous = find_previous_result(args.results, result)
+    print_result(result, previous)
+    with open(args.results, "a") as f:
+        f.write(json.dumps(result, sort_keys=True) + "\n")
+
+
+if __name__ == "__main__":
+    main()
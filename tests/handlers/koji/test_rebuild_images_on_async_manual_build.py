@@ -244,6 +244,10 @@ class TestRebuildImagesOnAsyncManualBuild(helpers.ModelsTestCase):
                               'tags': [{'name': '1-147'}]}]
         })
 
+    def tearDown(self):
+        super(TestRebuildImagesOnAsyncManualBuild, self).tearDown()
+        self.patcher.unpatch_all()
+
     def test_can_handle_event(self):
         event = FreshmakerAsyncManualBuildEvent(
             'msg-id-01', 'repo-branch', ['image1', 'image2'])
@@ -336,6 +340,9 @@ class TestRebuildImagesOnAsyncManualBuild(helpers.ModelsTestCase):
             'find_images_trees_to_rebuild', return_value=[
                 [self.image_b, self.image_a, self.image_0],
                 [self.image_d, self.image_a, self.image_0]])
+        self.mock_generate_batches = self.patcher.patch('generate_batches', return_value=[
+            [self.image_b, self.image_d]
+        ])
         event = FreshmakerAsyncManualBuildEvent(
             'msg-id-123', 'test_branch', ['image-b-container', 'image-d-container'])
         handler = RebuildImagesOnAsyncManualBuild()
@@ -1086,7 +1086,13 @@ class TestRecordBatchesImages(helpers.ModelsTestCase):
         ]
 
         handler = RebuildImagesOnRPMAdvisoryChange()
-        handler._record_batches(batches, self.mock_event)
+        with patch('freshmaker.models.messaging.publish') as publish:
+            handler._record_batches(batches, self.mock_event)
+
+        # All the builds are announced by single message.
+        publish.assert_called_once()
+        self.assertEqual(publish.call_args[0][0], 'event.builds.recorded')
+        self.assertEqual(len(publish.call_args[0][1]['builds']), 2)
 
         # Check parent image
         query = db.session.query(ArtifactBuild)
@@ -18,12 +18,14 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import contextlib
 import queue
 import random
 import time
 import uuid
 import unittest
 import koji
+import sqlalchemy
 
 from unittest.mock import patch, MagicMock, PropertyMock
 from functools import wraps
@@ -242,6 +244,17 @@ class MockedKoji(object):
 
         return ret
 
+    def _multicall(self, calls):
+        """
+        Mocks KojiService.multicall by calling the mocked session methods.
+        """
+        results = []
+        for call in calls:
+            method, args = call[0], call[1]
+            kwargs = call[2] if len(call) > 2 else {}
+            results.append(getattr(self._koji_session, method)(*args, **kwargs))
+        return results
+
     def start(self):
         """
         Starts the Koji mocking.
@@ -256,6 +269,7 @@ class MockedKoji(object):
         self._koji_session = self._koji_service.session
         self._koji_session.listTags.side_effect = self._session_list_tags
         self._koji_session.listTagged.side_effect = self._session_list_tagged
+        self._koji_service.multicall.side_effect = self._multicall
 
         return self
 
@@ -287,6 +301,52 @@ def mock_koji(f):
     return wrapped
 
 
+def koji_multicall(service, calls):
+    """
+    Replacement for KojiService.multicall running the calls one after another
+    through the KojiService methods wrapping the particular Koji API calls, so
+    the tests mocking these methods cover the batched code paths too.
+    """
+    methods = {
+        "getBuild": "get_build",
+        "getTaskInfo": "get_task_info",
+        "getTaskRequest": "get_task_request",
+    }
+
+    results = []
+    for call in calls:
+        method, args = call[0], call[1]
+        kwargs = call[2] if len(call) > 2 else {}
+        try:
+            if method in methods:
+                results.append(getattr(service, methods[method])(*args, **kwargs))
+            elif method == "listArchives":
+                results.append(service.list_archives(*args, archive_type=kwargs.get("type")))
+            else:
+                results.append(getattr(service.session, method)(*args, **kwargs))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+@contextlib.contextmanager
+def count_queries():
+    """
+    Context manager which collects the SQL statements executed on the
+    Freshmaker database inside the `with` block and yields their list.
+    """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    sqlalchemy.event.listen(db.engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        sqlalchemy.event.remove(db.engine, "before_cursor_execute", before_cursor_execute)
+
+
 class FedMsgFactory(object):
     def __init__(self, *args, **kwargs):
         self.msg_id = "%s-%s" % (time.strftime("%Y"), uuid.uuid4())
@@ -18,13 +18,19 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import threading
+import time
+from datetime import datetime, timedelta
 import unittest
 from unittest import mock
 
+import flask
+
 import freshmaker
 
 from freshmaker.events import BrewSignRPMEvent
-from freshmaker.models import Event, ArtifactBuild
+from freshmaker.consumer import HandlerRegistry, PartitionedWorkerPool
+from freshmaker.models import Event, ArtifactBuild, QueuedEvent
 from freshmaker import db
 from freshmaker.types import ArtifactBuildState
 from freshmaker.handlers import fail_event_on_handler_exception
@@ -65,9 +71,6 @@ class ConsumerTest(helpers.ConsumerBaseTest):
         to proper handler and is able to get the further work from
         the handler.
         """
-        consumer = self.create_consumer()
-        global_consumer.return_value = consumer
-
         for reverse in [False, True]:
             order_lst = []
 
@@ -83,6 +86,9 @@ class ConsumerTest(helpers.ConsumerBaseTest):
             handler2.side_effect = mocked_handler2
             handler1_order.return_value = 100 if reverse else 0
 
+            # The handlers are sorted only once when the consumer starts.
+            consumer = self.create_consumer()
+            global_consumer.return_value = consumer
             msg = self._compose_state_change_msg()
             consumer.consume(msg)
             self.assertEqual(order_lst, [2, 1] if reverse else [1, 2])
@@ -152,6 +158,360 @@ class ConsumerTest(helpers.ConsumerBaseTest):
             self.assertTrue(build.state_reason, "Failed with traceback")
 
 
+class HandlerRegistryTest(helpers.FreshmakerTestCase):
+
+    def setUp(self):
+        super(HandlerRegistryTest, self).setUp()
+        self.registry = HandlerRegistry([
+            "freshmaker.handlers.koji:RebuildImagesOnODCSComposeDone",
+            "freshmaker.handlers.internal:UpdateDBOnODCSComposeFail",
+            "freshmaker.handlers.internal:GenerateAdvisorySignedEventOnRPMSign",
+            "tests.test_handler:MyHandler",
+        ])
+
+    def test_handlers_sorted(self):
+        self.assertEqual(
+            [handler.__name__ for handler in self.registry.handler_classes],
+            ["UpdateDBOnODCSComposeFail", "RebuildImagesOnODCSComposeDone",
+             "GenerateAdvisorySignedEventOnRPMSign", "MyHandler"])
+
+    def test_get_candidates(self):
+        # Handlers without event_types are candidates for every event.
+        self.assertEqual(
+            [handler.__name__ for handler in self.registry.get_candidates(
+                freshmaker.events.ODCSComposeStateChangeEvent)],
+            ["UpdateDBOnODCSComposeFail", "RebuildImagesOnODCSComposeDone",
+             "MyHandler"])
+        self.assertEqual(
+            [handler.__name__ for handler in self.registry.get_candidates(
+                freshmaker.events.TestingEvent)],
+            ["MyHandler"])
+
+    @mock.patch("freshmaker.handlers.internal.UpdateDBOnODCSComposeFail.can_handle")
+    @mock.patch("freshmaker.handlers.koji.RebuildImagesOnODCSComposeDone.can_handle")
+    @mock.patch("tests.test_handler.MyHandler.can_handle")
+    def test_get_handlers_reuses_idle_handlers(
+            self, my_can_handle, compose_done_can_handle, compose_fail_can_handle):
+        my_can_handle.return_value = False
+        compose_done_can_handle.return_value = False
+        compose_fail_can_handle.return_value = True
+        event = freshmaker.events.ODCSComposeStateChangeEvent(
+            "msg-id", {"id": 1, "state": 4})
+
+        handlers = list(self.registry.get_handlers(event))
+        self.assertEqual(len(handlers), 1)
+        self.assertEqual(type(handlers[0]).__name__, "UpdateDBOnODCSComposeFail")
+        idle_handlers = dict(self.registry._idle_handlers)
+        self.assertEqual(
+            sorted(handler.__name__ for handler in idle_handlers),
+            ["MyHandler", "RebuildImagesOnODCSComposeDone"])
+
+        # The handlers which did not handle the event are reused, the one
+        # which handled it is replaced by new instance.
+        new_handlers = list(self.registry.get_handlers(event))
+        self.assertIsNot(new_handlers[0], handlers[0])
+        self.assertEqual(self.registry._idle_handlers, idle_handlers)
+        # GenerateAdvisorySignedEventOnRPMSign is not asked at all.
+        self.assertEqual(compose_fail_can_handle.call_count, 2)
+        self.assertEqual(compose_done_can_handle.call_count, 2)
+
+
+class PartitionedWorkerPoolTest(helpers.FreshmakerTestCase):
+
+    def test_events_with_same_key_processed_in_order(self):
+        processed = []
+
+        def process(event):
+            processed.append((threading.current_thread().name, event.msg_id))
+
+        pool = PartitionedWorkerPool(4, process)
+        events = [
+            freshmaker.events.TestingEvent("msg-%d" % (i % 3)) for i in range(12)]
+        for event in events:
+            pool.put(event)
+        pool.stop(wait=True)
+
+        self.assertEqual(len(processed), 12)
+        for msg_id in ["msg-0", "msg-1", "msg-2"]:
+            workers = {worker for worker, processed_msg_id in processed
+                       if processed_msg_id == msg_id}
+            self.assertEqual(len(workers), 1)
+            self.assertEqual(
+                workers.pop(),
+                "freshmaker-bulk-worker-%d" % pool.get_worker_index(
+                    freshmaker.events.TestingEvent(msg_id)))
+
+    def test_partition_key(self):
+        pool = PartitionedWorkerPool(8, None)
+        pool.stop(wait=True)
+        compose_done = freshmaker.events.ODCSComposeStateChangeEvent(
+            "msg-1", {"id": 1, "state": 2})
+        compose_failed = freshmaker.events.ODCSComposeStateChangeEvent(
+            "msg-2", {"id": 1, "state": 4})
+        self.assertEqual(compose_done.partition_key, "odcs-compose-1")
+        self.assertEqual(
+            pool.get_worker_index(compose_done), pool.get_worker_index(compose_failed))
+
+
+class ConsumerWorkerPoolTest(helpers.ConsumerBaseTest):
+
+    @mock.patch.object(freshmaker.conf, "consumer_workers", new=2)
+    @mock.patch("freshmaker.consumer.FreshmakerConsumer.process_event")
+    def test_consume_in_worker_pool(self, process_event):
+        consumer_thread = threading.current_thread()
+        consumer_session = db.session()
+        processed = []
+
+        def mocked_process_event(msg):
+            # The exceptions raised here are caught by the consumer, so just
+            # record the state and check it in the test thread.
+            processed.append((
+                threading.current_thread(), flask.has_app_context(),
+                db.session(), msg.msg_id))
+
+        process_event.side_effect = mocked_process_event
+
+        consumer = self.create_consumer()
+        self.assertEqual(list(consumer.worker_pools), ["bulk"])
+        for i in range(4):
+            consumer.consume(freshmaker.events.TestingEvent("msg-%d" % i))
+        consumer.worker_pools["bulk"].stop(wait=True)
+
+        self.assertEqual(
+            sorted(msg_id for _, _, _, msg_id in processed),
+            ["msg-0", "msg-1", "msg-2", "msg-3"])
+        for thread, has_app_context, session, msg_id in processed:
+            self.assertIsNot(thread, consumer_thread)
+            # Every worker has its own app context and DB session.
+            self.assertTrue(has_app_context)
+            self.assertIsNot(session, consumer_session)
+
+    @mock.patch.object(freshmaker.conf, "consumer_workers", new=2)
+    @mock.patch("freshmaker.consumer.FreshmakerConsumer.shutdown")
+    @mock.patch("freshmaker.consumer.FreshmakerConsumer.process_event")
+    def test_stop_condition_checked_once_processed(self, process_event, shutdown):
+        processed = []
+
+        def mocked_process_event(msg):
+            shutdown.assert_not_called()
+            processed.append(msg.msg_id)
+
+        process_event.side_effect = mocked_process_event
+
+        consumer = self.create_consumer()
+        consumer.stop_condition = lambda message: message.msg_id == "msg-1"
+        consumer.consume(freshmaker.events.TestingEvent("msg-0"))
+        consumer.consume(freshmaker.events.TestingEvent("msg-1"))
+        consumer.worker_pools["bulk"].stop(wait=True)
+
+        self.assertEqual(sorted(processed), ["msg-0", "msg-1"])
+        shutdown.assert_called_once()
+
+    @mock.patch.object(freshmaker.conf, "consumer_workers", new=2)
+    @mock.patch("freshmaker.consumer.FreshmakerConsumer.process_event")
+    def test_stop_processes_scheduled_events(self, process_event):
+        processed = []
+
+        def mocked_process_event(msg):
+            time.sleep(0.01)
+            processed.append(msg.msg_id)
+
+        process_event.side_effect = mocked_process_event
+
+        consumer = self.create_consumer()
+        for i in range(6):
+            consumer.consume(freshmaker.events.TestingEvent("msg-%d" % i))
+        consumer.stop()
+
+        self.assertEqual(sorted(processed), ["msg-%d" % i for i in range(6)])
+
+    def test_consume_without_worker_pool(self):
+        consumer = self.create_consumer()
+        self.assertEqual(consumer.worker_pools, {})
+
+    @mock.patch.object(freshmaker.conf, "consumer_lanes", new={"fast": 1})
+    @mock.patch("freshmaker.consumer.FreshmakerConsumer.process_event")
+    def test_consume_in_priority_lanes(self, process_event):
+        bulk_started = threading.Event()
+        bulk_finish = threading.Event()
+        processed = []
+
+        def mocked_process_event(msg):
+            if msg.msg_id == "advisory":
+                bulk_started.set()
+                bulk_finish.wait(10)
+            processed.append(msg.msg_id)
+
+        process_event.side_effect = mocked_process_event
+
+        consumer = self.create_consumer()
+        self.assertEqual(sorted(consumer.worker_pools), ["bulk", "fast"])
+
+        advisory_event = freshmaker.events.TestingEvent("advisory")
+        compose_event = freshmaker.events.ODCSComposeStateChangeEvent(
+            "compose", {"id": 1, "state": 2})
+        self.assertEqual(consumer.get_lane(advisory_event), "bulk")
+        self.assertEqual(consumer.get_lane(compose_event), "fast")
+
+        consumer.consume(advisory_event)
+        self.assertTrue(bulk_started.wait(10))
+        # The compose event does not wait for the advisory in the bulk lane.
+        consumer.consume(compose_event)
+        consumer.worker_pools["fast"].stop(wait=True)
+        self.assertEqual(processed, ["compose"])
+
+        bulk_finish.set()
+        consumer.worker_pools["bulk"].stop(wait=True)
+        self.assertEqual(processed, ["compose", "advisory"])
+
+    @mock.patch.object(freshmaker.conf, "consumer_lanes", new={"fast": 1})
+    @mock.patch.object(freshmaker.conf, "consumer_event_lanes",
+                       new={"TestingEvent": "unknown"})
+    def test_get_lane_unknown_lane(self):
+        consumer = self.create_consumer()
+        self.assertEqual(
+            consumer.get_lane(freshmaker.events.TestingEvent("msg")), "bulk")
+        consumer.stop()
+
+
+@mock.patch.object(freshmaker.conf, "durable_event_queue", new=True)
+class ConsumerDurableEventQueueTest(helpers.ConsumerBaseTest):
+
+    @mock.patch("freshmaker.consumer.get_global_consumer")
+    def test_unprocessed_events_loaded_on_start(self, global_consumer):
+        consumer = self.create_consumer()
+        global_consumer.return_value = consumer
+
+        freshmaker.consumer.work_queue_put(freshmaker.events.TestingEvent("msg-1"))
+        freshmaker.consumer.work_queue_put(freshmaker.events.TestingEvent("msg-2"))
+        self.assertEqual(db.session.query(QueuedEvent).count(), 2)
+
+        # The events claimed by the running consumer are not loaded again.
+        consumer.load_queued_events()
+        self.assertEqual(consumer.incoming.qsize(), 2)
+
+        # The consumer stops before processing the events, so their claims
+        # are not renewed and expire.
+        expired = datetime.utcnow() - timedelta(
+            seconds=freshmaker.conf.durable_event_queue_lease + 1)
+        db.session.query(QueuedEvent).update({QueuedEvent.time_claimed: expired})
+        db.session.commit()
+
+        # The consumer is restarted. The create_consumer replaces the
+        # incoming queue filled on start, so load the events again.
+        with mock.patch("freshmaker.consumer.FreshmakerConsumer.load_queued_events") as load:
+            consumer = self.create_consumer()
+            load.assert_called_once()
+        consumer.load_queued_events()
+        self.assertEqual(
+            [consumer.incoming.get(block=False).msg_id for i in range(2)],
+            ["msg-1", "msg-2"])
+
+    @mock.patch("freshmaker.consumer.FreshmakerConsumer.process_event")
+    @mock.patch("freshmaker.consumer.get_global_consumer")
+    def test_processed_event_acknowledged(self, global_consumer, process_event):
+        consumer = self.create_consumer()
+        global_consumer.return_value = consumer
+
+        freshmaker.consumer.work_queue_put(freshmaker.events.TestingEvent("msg-1"))
+        consumer.consume(consumer.incoming.get(block=False))
+        process_event.assert_called_once()
+        self.assertEqual(db.session.query(QueuedEvent).count(), 0)
+
+    @mock.patch("freshmaker.consumer.FreshmakerConsumer.process_event")
+    @mock.patch("freshmaker.consumer.get_global_consumer")
+    def test_failed_event_not_acknowledged(self, global_consumer, process_event):
+        consumer = self.create_consumer()
+        global_consumer.return_value = consumer
+        process_event.return_value = False
+
+        freshmaker.consumer.work_queue_put(freshmaker.events.TestingEvent("msg-1"))
+        queued_event_id = db.session.query(QueuedEvent).one().id
+        self.assertEqual(consumer._queued_event_ids, {queued_event_id})
+        consumer.consume(consumer.incoming.get(block=False))
+
+        # The event stays in the queue, but its claim is not renewed anymore.
+        self.assertEqual(db.session.query(QueuedEvent).count(), 1)
+        self.assertEqual(consumer._queued_event_ids, set())
+
+    @mock.patch("freshmaker.handlers.internal.UpdateDBOnODCSComposeFail.handle",
+                autospec=True)
+    @mock.patch("freshmaker.handlers.internal.UpdateDBOnODCSComposeFail.can_handle")
+    def test_process_event_failed(self, can_handle, handle):
+        consumer = self.create_consumer()
+        can_handle.return_value = True
+        msg = consumer.get_abstracted_msg(self._compose_state_change_msg()['body'])
+
+        handle.side_effect = ValueError("Expected exception")
+        self.assertFalse(consumer.process_event(msg))
+
+        # The failure recorded in the database by the handler is final.
+        @fail_event_on_handler_exception
+        def mocked_handle(handler, msg):
+            raise ValueError("Expected exception")
+
+        handle.side_effect = mocked_handle
+        self.assertTrue(consumer.process_event(msg))
+
+    @mock.patch("freshmaker.consumer.get_global_consumer")
+    def test_max_attempts(self, global_consumer):
+        consumer = self.create_consumer()
+        global_consumer.return_value = consumer
+        freshmaker.consumer.work_queue_put(freshmaker.events.TestingEvent("msg-1"))
+
+        expired = datetime.utcnow() - timedelta(
+            seconds=freshmaker.conf.durable_event_queue_lease + 1)
+        for i in range(freshmaker.conf.durable_event_queue_max_attempts):
+            db.session.query(QueuedEvent).update({QueuedEvent.time_claimed: expired})
+            db.session.commit()
+            consumer.load_queued_events()
+
+        # The event was loaded on every attempt but the last one.
+        self.assertEqual(
+            consumer.incoming.qsize(), freshmaker.conf.durable_event_queue_max_attempts)
+        queued_event = db.session.query(QueuedEvent).one()
+        self.assertIsNotNone(queued_event.time_failed)
+
+    @mock.patch("freshmaker.models.QueuedEvent.renew")
+    @mock.patch("freshmaker.consumer.get_global_consumer")
+    def test_claims_renewed(self, global_consumer, renew):
+        with mock.patch.object(freshmaker.conf, "durable_event_queue_lease", new=0):
+            consumer = self.create_consumer()
+        global_consumer.return_value = consumer
+        freshmaker.consumer.work_queue_put(freshmaker.events.TestingEvent("msg-1"))
+        queued_event_id = db.session.query(QueuedEvent).one().id
+
+        while not renew.called:
+            time.sleep(0.1)
+        consumer.stop()
+        renew.assert_called_with([queued_event_id])
+
+    @mock.patch("freshmaker.handlers.internal.UpdateDBOnODCSComposeFail.handle")
+    @mock.patch("freshmaker.handlers.internal.UpdateDBOnODCSComposeFail.can_handle")
+    @mock.patch("freshmaker.consumer.get_global_consumer")
+    def test_further_work_queued(self, global_consumer, can_handle, handle):
+        consumer = self.create_consumer()
+        global_consumer.return_value = consumer
+        can_handle.return_value = True
+        handle.return_value = [freshmaker.events.TestingEvent("further work")]
+
+        consumer.consume(self._compose_state_change_msg())
+        queued_event = db.session.query(QueuedEvent).one()
+        self.assertEqual(queued_event.event_type, "TestingEvent")
+        self.assertEqual(consumer.incoming.get(block=False).msg_id, "further work")
+
+    @mock.patch("freshmaker.consumer.get_global_consumer")
+    def test_idempotency_key(self, global_consumer):
+        consumer = self.create_consumer()
+        global_consumer.return_value = consumer
+
+        for i in range(2):
+            freshmaker.consumer.work_queue_put(
+                freshmaker.events.TestingEvent("msg-%d" % i), idempotency_key="key")
+        self.assertEqual(consumer.incoming.get(block=False).msg_id, "msg-0")
+        self.assertTrue(consumer.incoming.empty())
+
+
 class ParseBrewSignRPMEventTest(helpers.ModelsTestCase):
 
     @mock.patch('freshmaker.events.conf.parsers',
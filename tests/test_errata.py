@@ -317,7 +317,7 @@ class TestErrata(helpers.FreshmakerTestCase):
         mocked_errata.builds["libntirpc-1.4.3-4.el7rhgs"] = {}
         self.assertFalse(self.errata.builds_signed(28484))
 
-    @patch('freshmaker.errata.requests.get')
+    @patch('freshmaker.errata.requests.Session.get')
     def test_get_errata_repo_ids(self, get):
         get.return_value.json.return_value = {
             'rhel-6-server-eus-source-rpms__6_DOT_7__x86_64': [
@@ -491,7 +491,7 @@ class TestErrataAuthorizedGet(helpers.FreshmakerTestCase):
 
         self.patcher = helpers.Patcher(
             'freshmaker.errata.')
-        self.requests_get = self.patcher.patch("requests.get")
+        self.requests_get = self.patcher.patch("requests.Session.get")
         self.response = MagicMock()
         self.response.json.return_value = {"foo": "bar"}
         self.unlink = self.patcher.patch("os.unlink")
@@ -23,6 +23,7 @@
 # Written by Chenxiong Qi <cqi@redhat.com>
 
 import json
+import threading
 
 from unittest.mock import patch
 from requests.exceptions import HTTPError
@@ -551,6 +552,81 @@ class TestAllowBuildBasedOnAllowlist(helpers.FreshmakerTestCase):
             ArtifactType.IMAGE, advisory_name='RHSA-2016:1000')
         self.assertFalse(allowed)
 
+    @patch.object(freshmaker.conf, 'handler_build_allowlist', new={
+        'MyHandler': {
+            'image': {'advisory_name': r'RHSA-\d+:\d+'},
+        }
+    })
+    def test_allowed_logs_configured_rule(self):
+        handler = MyHandler()
+        with patch.object(handler, 'log_debug') as log_debug:
+            self.assertTrue(handler.allow_build(
+                ArtifactType.IMAGE, advisory_name='RHSA-2017:1000'))
+        log_debug.assert_any_call(
+            'name=%r, allowlist=%r', 'MyHandler', {'advisory_name': r'RHSA-\d+:\d+'})
+
+    @patch.object(freshmaker.conf, 'handler_build_allowlist', new={
+        'MyHandler': {
+            'image': {'advisory_name': r'RHSA-\d+:\d+'},
+        }
+    })
+    def test_verdict_memoized(self):
+        handler = MyHandler()
+        with patch.object(MyHandler, '_match_compiled_allow_build_rule',
+                          wraps=MyHandler._match_compiled_allow_build_rule) as match:
+            for i in range(3):
+                allowed = handler.allow_build(
+                    ArtifactType.IMAGE, advisory_name='RHSA-2017:1000')
+                self.assertTrue(allowed)
+            # allowlist and blocklist are evaluated only once
+            self.assertEqual(match.call_count, 2)
+
+            # unhashable criteria are evaluated every time
+            for i in range(2):
+                allowed = handler.allow_build(
+                    ArtifactType.IMAGE, advisory_name='RHSA-2017:1000', nvrs=['foo-1-1'])
+                self.assertTrue(allowed)
+            self.assertEqual(match.call_count, 6)
+
+    def test_config_change_invalidates_cache(self):
+        handler = MyHandler()
+        rules = {'MyHandler': {'image': {'advisory_name': r'RHSA-\d+:\d+'}}}
+        with patch.object(freshmaker.conf, 'handler_build_allowlist', new=rules):
+            self.assertTrue(handler.allow_build(
+                ArtifactType.IMAGE, advisory_name='RHSA-2017:1000'))
+
+        rules = {'MyHandler': {'image': {'advisory_name': r'RHBA-\d+:\d+'}}}
+        with patch.object(freshmaker.conf, 'handler_build_allowlist', new=rules):
+            self.assertFalse(handler.allow_build(
+                ArtifactType.IMAGE, advisory_name='RHSA-2017:1000'))
+
+        with patch.object(freshmaker.conf, 'handler_build_blocklist', new={
+                'global': {'image': {'advisory_name': r'RHBA-2017:\d+'}}}):
+            with patch.object(freshmaker.conf, 'handler_build_allowlist', new=rules):
+                self.assertFalse(handler.allow_build(
+                    ArtifactType.IMAGE, advisory_name='RHBA-2017:1000'))
+
+    def test_compile_allow_build_rule(self):
+        rule = all_(
+            {'advisory_name': r'RHSA-\d+:\d+', 'published': True},
+            any_({'severity': ['critical', 'important']}),
+        )
+        compiled = MyHandler._compile_allow_build_rule(rule)
+
+        self.assertEqual(compiled[0], "all")
+        self.assertEqual(compiled[1][0][0], "dict")
+        self.assertEqual(compiled[1][0][1], frozenset(['advisory_name', 'published']))
+        self.assertEqual(
+            [regex.pattern for regex in dict(compiled[1][0][2])['published']], ['True'])
+        self.assertEqual(compiled[1][1][0], "any")
+        # Compiled rules are immutable and hashable
+        hash(compiled)
+
+        with self.assertRaises(TypeError):
+            MyHandler._compile_allow_build_rule([{'advisory_name': 'RHSA-.*'}])
+        with self.assertRaises(ValueError):
+            MyHandler._compile_allow_build_rule(['none', [{'advisory_name': 'RHSA-.*'}]])
+
 
 class TestStartToBuildImages(helpers.ModelsTestCase):
 
@@ -573,6 +649,69 @@ class TestStartToBuildImages(helpers.ModelsTestCase):
         self.assertEqual(build2.state, ArtifactBuildState.BUILD.value)
         self.assertEqual(len(db.session.query(ArtifactBuild).all()), 2)
 
+    @patch('freshmaker.handlers.ContainerBuildHandler.build_image_artifact_build')
+    def test_concurrent_handlers_submit_build_once(self, build_artifact):
+        db_event = Event.get_or_create(
+            db.session, 'msg1', 'current_event', ErrataAdvisoryRPMsSignedEvent)
+        build = ArtifactBuild.create(db.session, db_event, 'parent1-1-4',
+                                     'image', state=ArtifactBuildState.PLANNED.value)
+        db.session.commit()
+        build_id = build.id
+
+        loaded = threading.Event()
+        submitting = threading.Event()
+        other_states = []
+
+        def handle_other_event():
+            # The handler of another event is called from another worker
+            # thread with its own DB session and finds the build PLANNED too.
+            with freshmaker.app.app_context():
+                other_build = db.session.query(ArtifactBuild).get(build_id)
+                self.assertEqual(other_build.state, ArtifactBuildState.PLANNED.value)
+                loaded.set()
+                submitting.wait()
+                MyHandler().start_to_build_images([other_build])
+                other_states.append(other_build.state)
+                db.session.remove()
+
+        def submit(build, repo_urls):
+            # Let the other handler try to submit the build while this one
+            # is submitting it.
+            submitting.set()
+            thread.join()
+            return 1
+
+        build_artifact.side_effect = submit
+        thread = threading.Thread(target=handle_other_event)
+        thread.start()
+        loaded.wait()
+        MyHandler().start_to_build_images([build])
+
+        build_artifact.assert_called_once()
+        # The other handler leaves the build claimed by this one untouched.
+        self.assertEqual(other_states, [ArtifactBuildState.PLANNED.value])
+        self.assertEqual(build.state, ArtifactBuildState.BUILD.value)
+        self.assertEqual(build.build_id, 1)
+        self.assertEqual(build.state_reason, "Building container image in Koji.")
+
+    @patch('freshmaker.handlers.ContainerBuildHandler.build_image_artifact_build')
+    @patch('freshmaker.handlers.ContainerBuildHandler.get_repo_urls')
+    def test_get_repo_urls_failed(self, get_repo_urls, build_artifact):
+        get_repo_urls.side_effect = HTTPError('500 Server Error')
+        db_event = Event.get_or_create(
+            db.session, 'msg1', 'current_event', ErrataAdvisoryRPMsSignedEvent)
+        build = ArtifactBuild.create(db.session, db_event, 'parent1-1-4',
+                                     'image', state=ArtifactBuildState.PLANNED.value)
+        db.session.commit()
+
+        with self.assertLogs('freshmaker', 'ERROR'):
+            MyHandler().start_to_build_images([build])
+
+        build_artifact.assert_not_called()
+        self.assertEqual(build.state, ArtifactBuildState.FAILED.value)
+        self.assertFalse(build.claimed)
+        self.assertIsNone(build.time_claimed)
+
     @patch('freshmaker.kojiservice.KojiService.get_ocp_versions_range')
     def test_start_to_build_invalid_bundle_image(self, mock_get_ocp):
         mock_get_ocp.return_value = 'v4.7,v4.8'
@@ -591,3 +730,90 @@ class TestStartToBuildImages(helpers.ModelsTestCase):
 
         self.assertEqual(build.state, ArtifactBuildState.FAILED.value)
         self.assertTrue('invalid openshift versions range' in build.state_reason)
+
+
+@patch.object(freshmaker.conf, 'container_build_submission_workers', new=2)
+@patch.object(freshmaker.conf, 'container_build_submission_chunk_size', new=2)
+@patch('freshmaker.handlers.KojiService')
+class TestStartToBuildImagesConcurrently(helpers.ModelsTestCase):
+
+    def setUp(self):
+        super(TestStartToBuildImagesConcurrently, self).setUp()
+        self.db_event = Event.get_or_create(
+            db.session, 'msg1', 'current_event', ErrataAdvisoryRPMsSignedEvent)
+        self.builds = []
+        for nvr in ['foo-1-1', 'bar-1-1', 'baz-1-1']:
+            build = ArtifactBuild.create(
+                db.session, self.db_event, nvr.split('-')[0], 'image',
+                state=ArtifactBuildState.PLANNED.value, original_nvr=nvr)
+            build.build_args = json.dumps({
+                'repository': 'containers/' + nvr, 'commit': 'hash',
+                'branch': 'branch', 'target': 'target',
+                'original_parent': None,
+            })
+            self.builds.append(build)
+        db.session.commit()
+
+    @patch('freshmaker.handlers.ContainerBuildHandler.build_container')
+    def test_start_to_build_images(self, build_container, koji_service):
+        build_container.side_effect = [HTTPError('500 Server Error'), 11, 12]
+        handler = MyHandler()
+
+        with patch.object(db.session, 'commit', wraps=db.session.commit) as commit:
+            with self.assertLogs('freshmaker', 'ERROR'):
+                handler.start_to_build_images(self.builds)
+
+        # Two commits per chunk of builds, one for the claims and one for
+        # the results.
+        self.assertEqual(commit.call_count, 4)
+        # Single Koji session is created for every thread and reused.
+        self.assertEqual(koji_service.call_count, 2)
+        for call_args in build_container.call_args_list:
+            self.assertEqual(call_args[1]['service'], koji_service.return_value)
+
+        states = sorted(
+            (build.state, build.build_id) for build in self.builds)
+        self.assertEqual(states, [
+            (ArtifactBuildState.BUILD.value, 11),
+            (ArtifactBuildState.BUILD.value, 12),
+            (ArtifactBuildState.FAILED.value, None),
+        ])
+        for build in self.builds:
+            if build.state == ArtifactBuildState.BUILD.value:
+                self.assertTrue(build.rebuilt_nvr.startswith(build.original_nvr))
+
+    @patch('freshmaker.handlers.ContainerBuildHandler.odcs_get_compose')
+    @patch('freshmaker.handlers.ContainerBuildHandler.build_container')
+    def test_odcs_compose_not_ready(self, build_container, odcs_get_compose, koji_service):
+        build_container.return_value = 11
+        odcs_get_compose.return_value = {'state': COMPOSE_STATES['generating']}
+        build_args = json.loads(self.builds[0].build_args)
+        build_args['renewed_odcs_compose_ids'] = [5]
+        self.builds[0].build_args = json.dumps(build_args)
+        db.session.commit()
+
+        handler = MyHandler()
+        handler.start_to_build_images(self.builds)
+
+        self.assertEqual(self.builds[0].state, ArtifactBuildState.PLANNED.value)
+        self.assertIsNone(self.builds[0].rebuilt_nvr)
+        self.assertEqual(self.builds[1].state, ArtifactBuildState.BUILD.value)
+        self.assertEqual(self.builds[2].state, ArtifactBuildState.BUILD.value)
+        self.assertEqual(build_container.call_count, 2)
+
+    @patch('freshmaker.handlers.ContainerBuildHandler.build_container')
+    def test_invalid_build(self, build_container, koji_service):
+        build_container.return_value = 11
+        self.builds[0].build_args = json.dumps({'repo': 'foo'})
+        self.builds[1].state = ArtifactBuildState.DONE.value
+        db.session.commit()
+
+        handler = MyHandler()
+        with self.assertLogs('freshmaker', 'ERROR'):
+            handler.start_to_build_images(self.builds)
+
+        self.assertEqual(self.builds[0].state, ArtifactBuildState.FAILED.value)
+        self.assertIn("'repository'", self.builds[0].state_reason)
+        self.assertEqual(self.builds[1].state, ArtifactBuildState.FAILED.value)
+        self.assertEqual(self.builds[2].state, ArtifactBuildState.BUILD.value)
+        self.assertEqual(build_container.call_count, 1)
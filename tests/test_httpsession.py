@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2026  Red Hat, Inc.
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in
+# all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import threading
+from unittest.mock import patch, Mock
+
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool
+
+from freshmaker import conf, httpsession
+from freshmaker.monitor import http_requests_counter, http_new_connections_counter
+from tests import helpers
+
+
+class TestHTTPSession(helpers.FreshmakerTestCase):
+
+    def setUp(self):
+        super(TestHTTPSession, self).setUp()
+        httpsession.close_session("test")
+
+    def tearDown(self):
+        super(TestHTTPSession, self).tearDown()
+        httpsession.close_session("test")
+
+    def test_get_session_shared(self):
+        auth = Mock()
+        session = httpsession.get_session("test", auth=auth)
+
+        self.assertIs(httpsession.get_session("test", auth=auth), session)
+        self.assertIsInstance(session.auth, httpsession.ThreadLocalAuth)
+        auth.assert_not_called()
+
+    def test_auth_per_thread(self):
+        auth = Mock(side_effect=lambda: Mock())
+        session = httpsession.get_session("test", auth=auth)
+
+        request = Mock()
+        prepared_request = session.auth(request)
+        thread_auth = session.auth.get_auth()
+        self.assertIs(session.auth.get_auth(), thread_auth)
+        thread_auth.assert_called_once_with(request)
+        self.assertIs(prepared_request, thread_auth.return_value)
+
+        other_thread_auths = []
+        thread = threading.Thread(
+            target=lambda: other_thread_auths.append(session.auth.get_auth()))
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(other_thread_auths[0], thread_auth)
+        self.assertEqual(auth.call_count, 2)
+
+    def test_close_session(self):
+        session = httpsession.get_session("test")
+        httpsession.close_session("test")
+
+        self.assertIsNot(httpsession.get_session("test"), session)
+
+    def test_pool_size(self):
+        with patch.object(conf, "http_pool_sizes", new={"test": 3}):
+            session = httpsession.get_session("test")
+            adapter = session.get_adapter("https://localhost/")
+            self.assertEqual(adapter._pool_maxsize, 3)
+            self.assertEqual(httpsession.get_pool_size("other"), conf.max_thread_workers)
+
+    @patch.object(HTTPAdapter, "send")
+    def test_requests_counter(self, send):
+        counter = http_requests_counter.labels(service="test")
+        before = counter._value.get()
+
+        adapter = httpsession.get_session("test").get_adapter("https://localhost/")
+        adapter.send(Mock())
+        adapter.send(Mock())
+
+        self.assertEqual(counter._value.get() - before, 2)
+
+    def test_new_connections_counter(self):
+        counter = http_new_connections_counter.labels(service="test")
+        before = counter._value.get()
+
+        session = httpsession.get_session("test")
+        pool = session.get_adapter("http://localhost/").poolmanager.connection_from_url(
+            "http://localhost/")
+        self.assertIsInstance(pool, HTTPConnectionPool)
+        conn = pool._get_conn()
+        pool._put_conn(conn)
+        pool._get_conn()
+
+        self.assertEqual(counter._value.get() - before, 1)
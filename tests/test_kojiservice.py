@@ -22,7 +22,9 @@
 #
 from unittest import mock
 
-from freshmaker import kojiservice
+import koji
+
+from freshmaker import conf, kojiservice
 
 
 @mock.patch("freshmaker.kojiservice.koji")
@@ -87,3 +89,39 @@ def test_get_ocp_versions_range(mock_koji):
 
     svc = kojiservice.KojiService()
     assert svc.get_ocp_versions_range('foobar-2-123') == "v4.5,v4.6"
+
+
+@mock.patch("freshmaker.kojiservice.koji.read_config")
+@mock.patch("freshmaker.kojiservice.koji.ClientSession")
+def test_multicall(mock_client_session, mock_read_config):
+    mock_read_config.return_value = {"server": "https://koji.localhost/kojihub"}
+    mock_multicall = mock_client_session.return_value.multicall.return_value.__enter__
+    build_call = mock.Mock(result={"build_id": 1})
+    fault = koji.GenericError("No such build")
+    missing_call = mock.Mock()
+    type(missing_call).result = mock.PropertyMock(side_effect=fault)
+    archives_call = mock.Mock(result=[{"id": 10}])
+    mock_multicall.return_value.getBuild.side_effect = [build_call, missing_call]
+    mock_multicall.return_value.listArchives.return_value = archives_call
+
+    svc = kojiservice.KojiService()
+    ret = svc.multicall([
+        ("getBuild", ("foo-1-1", )),
+        ("getBuild", ("bar-1-1", )),
+        ("listArchives", (1, ), {"type": "image"}),
+    ])
+
+    assert ret == [{"build_id": 1}, fault, [{"id": 10}]]
+    mock_client_session.return_value.multicall.assert_called_once_with(
+        strict=False, batch=conf.koji_multicall_batch_size)
+    mock_multicall.return_value.getBuild.assert_has_calls(
+        [mock.call("foo-1-1"), mock.call("bar-1-1")])
+    mock_multicall.return_value.listArchives.assert_called_once_with(1, type="image")
+
+
+@mock.patch("freshmaker.kojiservice.koji.read_config")
+@mock.patch("freshmaker.kojiservice.koji.ClientSession")
+def test_multicall_no_calls(mock_client_session, mock_read_config):
+    svc = kojiservice.KojiService()
+    assert svc.multicall([]) == []
+    mock_client_session.return_value.multicall.assert_not_called()
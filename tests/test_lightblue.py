@@ -32,6 +32,7 @@ import freshmaker
 from freshmaker import conf
 
 from freshmaker.lightblue import ContainerImage, ContainerRepository, ExtraRepoNotConfiguredError
+from freshmaker.lightblue import KojiLookupError, ImagesToRebuildDeduplicator
 from freshmaker.lightblue import LightBlue, LightBlueRequestError, LightBlueSystemError
 from freshmaker.utils import sorted_by_nvr
 from tests.test_handler import MyHandler
@@ -403,6 +404,17 @@ class TestContainerImageObject(helpers.FreshmakerTestCase):
         self.assertEqual(self.dummy_image["generate_pulp_repos"], True)
         self.assertEqual(self.dummy_image["original_odcs_compose_ids"], [7300, 7301])
 
+    @patch('freshmaker.lightblue.ArtifactBuild.get_most_original_nvr')
+    @patch('freshmaker.kojiservice.KojiService.get_odcs_compose_ids')
+    def test_resolve_original_odcs_compose_ids_bulk(self, get_odcs_compose_ids, get_nvr):
+        get_odcs_compose_ids.return_value = [7300]
+
+        self.dummy_image.resolve_original_odcs_compose_ids(
+            {self.dummy_image.nvr: "original-1-1"})
+        get_nvr.assert_not_called()
+        get_odcs_compose_ids.assert_called_once_with("original-1-1")
+        self.assertEqual(self.dummy_image["original_odcs_compose_ids"], [7300])
+
     def test_resolve_content_sets_already_included_in_lb_response(self):
         image = ContainerImage.create({
             '_id': '1233829',
@@ -523,6 +535,21 @@ class TestContainerImageObject(helpers.FreshmakerTestCase):
 
         self.assertEqual(image["rpm_manifest"], "x")
 
+    def test_resolve_published_from_published_data(self):
+        image = ContainerImage.create({
+            '_id': '1233829',
+            'brew': {
+                'build': 'package-name-1-4-12.10',
+            },
+        })
+
+        lb = Mock()
+        image.resolve_published(
+            lb, {"published": False, "rpm_manifest": "x"})
+        self.assertEqual(image["published"], False)
+        self.assertEqual(image["rpm_manifest"], "x")
+        lb.get_images_by_nvrs.assert_not_called()
+
     def test_resolve_published_not_image_in_lb(self):
         image = ContainerImage.create({
             '_id': '1233829',
@@ -536,6 +563,72 @@ class TestContainerImageObject(helpers.FreshmakerTestCase):
         image.resolve_published(lb)
 
 
+@patch.object(conf, "koji_build_metadata_cache_ttl", new=3600)
+class TestContainerImageKojiMetadataCache(helpers.ModelsTestCase):
+
+    @patch('freshmaker.kojiservice.KojiService.get_build')
+    @patch('freshmaker.kojiservice.KojiService.get_task_request')
+    def test_get_additional_data_from_koji_cached(self, get_task_request, get_build):
+        get_build.return_value = {
+            "task_id": 123456,
+            "extra": {"image": {"parent_build_id": 1234}},
+        }
+        get_task_request.return_value = [
+            "git://example.com/rpms/repo-1#commit_hash1", "target1", {}]
+
+        for i in range(2):
+            data = ContainerImage.get_additional_data_from_koji("package-name-1-4-12.10")
+            self.assertEqual(data["commit"], "commit_hash1")
+            self.assertEqual(data["repository"], "rpms/repo-1")
+            self.assertEqual(data["parent_build_id"], 1234)
+
+        get_build.assert_called_once_with("package-name-1-4-12.10")
+        get_task_request.assert_called_once_with(123456)
+
+    @patch('freshmaker.kojiservice.KojiService.get_build')
+    def test_get_additional_data_from_koji_negative_cache(self, get_build):
+        get_build.return_value = None
+
+        for i in range(2):
+            with self.assertRaises(KojiLookupError):
+                ContainerImage.get_additional_data_from_koji("package-name-1-4-12.10")
+
+        get_build.assert_called_once_with("package-name-1-4-12.10")
+
+    @patch.object(conf, "supply_arch_overrides", new=False)
+    @patch('freshmaker.kojiservice.KojiService.multicall')
+    def test_get_additional_data_from_koji_multi(self, multicall):
+        multicall.side_effect = [
+            [
+                {"task_id": 1, "extra": {"image": {"parent_build_id": 10}}},
+                None,
+                {"task_id": 3, "extra": {}},
+            ],
+            [
+                ["git://example.com/rpms/repo-1#commit_hash1", "target1", {}],
+                ["git://example.com/rpms/repo-3#commit_hash3", "target3", {}],
+            ],
+        ]
+        nvrs = ["image-1-1", "image-2-1", "image-3-1"]
+
+        data = ContainerImage.get_additional_data_from_koji_multi(nvrs)
+        self.assertEqual(data["image-1-1"]["commit"], "commit_hash1")
+        self.assertEqual(data["image-1-1"]["parent_build_id"], 10)
+        self.assertIsInstance(data["image-2-1"], KojiLookupError)
+        self.assertEqual(data["image-3-1"]["repository"], "rpms/repo-3")
+        multicall.assert_has_calls([
+            call([("getBuild", (nvr, )) for nvr in nvrs]),
+            call([("getTaskRequest", (1, )), ("getTaskRequest", (3, ))]),
+        ])
+
+        # Both the positive and negative results are cached.
+        multicall.reset_mock()
+        cached = ContainerImage.get_additional_data_from_koji_multi(nvrs)
+        multicall.assert_not_called()
+        self.assertEqual(cached["image-1-1"], data["image-1-1"])
+        self.assertIsInstance(cached["image-2-1"], KojiLookupError)
+
+
 class TestContainerRepository(helpers.FreshmakerTestCase):
 
     def test_create(self):
@@ -837,7 +930,7 @@ class TestQueryEntityFromLightBlue(helpers.FreshmakerTestCase):
                        event_id=self.current_db_event_id)
         assert lb.event_id == self.current_db_event_id
 
-    @patch('freshmaker.lightblue.requests.post')
+    @patch('freshmaker.lightblue.requests.Session.post')
     def test_find_container_images(self, post):
         post.return_value.status_code = http.client.OK
         post.return_value.json.return_value = {
@@ -906,7 +999,7 @@ class TestQueryEntityFromLightBlue(helpers.FreshmakerTestCase):
                          image['brew']['package'])
 
     @patch('freshmaker.lightblue.ContainerImage.update_multi_arch')
-    @patch('freshmaker.lightblue.requests.post')
+    @patch('freshmaker.lightblue.requests.Session.post')
     def test_find_container_images_with_multi_arch(self, post, update_multi_arch):
         post.return_value.status_code = http.client.OK
         post.return_value.json.return_value = {
@@ -976,7 +1069,7 @@ class TestQueryEntityFromLightBlue(helpers.FreshmakerTestCase):
              'e0f97342ddf6a09972434f98837b5fd8b5bed9390f32f1d63e8a7e4893208af7'],
             [call_args[0][0]['image_id'] for call_args in update_multi_arch.call_args_list])
 
-    @patch('freshmaker.lightblue.requests.post')
+    @patch('freshmaker.lightblue.requests.Session.post')
     def test_find_container_repositories(self, post):
         post.return_value.status_code = http.client.OK
         post.return_value.json.return_value = {
@@ -1053,7 +1146,7 @@ class TestQueryEntityFromLightBlue(helpers.FreshmakerTestCase):
         self.assertEqual(repos[0]['repository'], 'spam')
         self.assertEqual(repos[1]['repository'], 'bacon')
 
-    @patch('freshmaker.lightblue.requests.post')
+    @patch('freshmaker.lightblue.requests.Session.post')
     def test_raise_error_if_request_data_is_incorrect(self, post):
         post.return_value.status_code = http.client.BAD_REQUEST
         post.return_value.json.return_value = {
@@ -1263,7 +1356,8 @@ class TestQueryEntityFromLightBlue(helpers.FreshmakerTestCase):
     def _filter_fnc(self, image):
         return image.nvr.startswith("filtered_")
 
-    @patch('freshmaker.lightblue.ArtifactBuild.get_most_original_nvr')
+    @patch('freshmaker.kojiservice.KojiService.multicall', new=helpers.koji_multicall)
+    @patch('freshmaker.lightblue.ArtifactBuild.get_most_original_nvrs')
     @patch('freshmaker.lightblue.LightBlue.find_container_repositories')
     @patch('freshmaker.lightblue.LightBlue.find_container_images')
     @patch('freshmaker.kojiservice.KojiService.get_build')
@@ -1271,10 +1365,11 @@ class TestQueryEntityFromLightBlue(helpers.FreshmakerTestCase):
     @patch('os.path.exists')
     def test_images_with_content_set_packages(
         self, exists, koji_task_request, koji_get_build, cont_images,
-        cont_repos, get_most_original_nvr
+        cont_repos, get_most_original_nvrs
     ):
 
         exists.return_value = True
+        get_most_original_nvrs.return_value = {}
         cont_repos.return_value = self.fake_repositories_with_content_sets
         # "filtered_x-1-23" image will be filtered by filter_fnc.
         cont_images.return_value = self.fake_container_images + [
@@ -1297,6 +1392,9 @@ class TestQueryEntityFromLightBlue(helpers.FreshmakerTestCase):
         ret = lb.find_images_with_packages_from_content_set(
             set(["openssl-1.2.3-3"]), ["dummy-content-set-1"], filter_fnc=self._filter_fnc)
 
+        # The most original NVRs of all the images are queried at once.
+        get_most_original_nvrs.assert_called_once()
+
         # Only the first image should be returned, because the first one
         # is in repository "product1/repo1", but we have asked for images
         # in repository "product/repo1".
@@ -1364,7 +1462,8 @@ class TestQueryEntityFromLightBlue(helpers.FreshmakerTestCase):
                              },
                          ])
 
-    @patch('freshmaker.lightblue.ArtifactBuild.get_most_original_nvr')
+    @patch('freshmaker.kojiservice.KojiService.multicall', new=helpers.koji_multicall)
+    @patch('freshmaker.lightblue.ArtifactBuild.get_most_original_nvrs')
     @patch('freshmaker.lightblue.LightBlue.find_container_repositories')
     @patch('freshmaker.lightblue.LightBlue.find_container_images')
     @patch('freshmaker.kojiservice.KojiService.get_build')
@@ -1372,9 +1471,10 @@ class TestQueryEntityFromLightBlue(helpers.FreshmakerTestCase):
     @patch('os.path.exists')
     def test_images_with_content_set_packages_unpublished(
         self, exists, koji_task_request, koji_get_build, cont_images, cont_repos,
-        get_most_original_nvr
+        get_most_original_nvrs
     ):
         exists.return_value = True
+        get_most_original_nvrs.return_value = {}
         cont_repos.return_value = self.fake_repositories_with_content_sets
 
         # "filtered_x-1-23" image will be filtered by filter_fnc.
@@ -1477,6 +1577,7 @@ class TestQueryEntityFromLightBlue(helpers.FreshmakerTestCase):
                              },
                          ])
 
+    @patch('freshmaker.kojiservice.KojiService.multicall', new=helpers.koji_multicall)
     @patch('freshmaker.lightblue.LightBlue.find_container_repositories')
     @patch('freshmaker.lightblue.LightBlue.find_container_images')
     @patch('freshmaker.kojiservice.KojiService.get_build')
@@ -1581,6 +1682,7 @@ class TestQueryEntityFromLightBlue(helpers.FreshmakerTestCase):
         self.assertEqual(set(ret[2]["content_sets"]),
                          set(['dummy-content-set-1', 'dummy-content-set-2']))
 
+    @patch('freshmaker.lightblue.LightBlue.find_parent_images', new=Mock(return_value={}))
     @patch('freshmaker.lightblue.LightBlue.find_images_with_packages_from_content_set')
     @patch('freshmaker.lightblue.LightBlue.find_parent_images_with_package')
     @patch('freshmaker.lightblue.LightBlue._filter_out_already_fixed_published_images')
@@ -1773,6 +1875,7 @@ class TestQueryEntityFromLightBlue(helpers.FreshmakerTestCase):
             mock.ANY, expected_directly_affected_nvrs, ["dummy-1-1"], ["dummy"]
         )
 
+    @patch('freshmaker.lightblue.LightBlue.find_parent_images', new=Mock(return_value={}))
     @patch('freshmaker.lightblue.LightBlue.find_images_with_packages_from_content_set')
     @patch('freshmaker.lightblue.LightBlue.find_parent_images_with_package')
     @patch('freshmaker.lightblue.LightBlue._filter_out_already_fixed_published_images')
@@ -1907,6 +2010,7 @@ class TestQueryEntityFromLightBlue(helpers.FreshmakerTestCase):
             "Couldn't find parent image some-original-nvr-7.6-252.1561619826. "
             "Lightblue data is probably incomplete"))
 
+    @patch('freshmaker.lightblue.LightBlue.find_parent_images', new=Mock(return_value={}))
     @patch('freshmaker.lightblue.ArtifactBuild.get_most_original_nvr')
     @patch("freshmaker.lightblue.LightBlue.get_images_by_nvrs")
     @patch('freshmaker.lightblue.LightBlue.find_images_with_packages_from_content_set')
@@ -1949,6 +2053,7 @@ class TestQueryEntityFromLightBlue(helpers.FreshmakerTestCase):
         self.assertEqual(len(ret), 1)
         self.assertIsNotNone(ret[0][0].get("parent"))
 
+    @patch('freshmaker.lightblue.LightBlue.find_parent_images', new=Mock(return_value={}))
     @patch('freshmaker.lightblue.ArtifactBuild.get_most_original_nvr')
     @patch("freshmaker.lightblue.LightBlue.get_images_by_nvrs")
     @patch('freshmaker.lightblue.LightBlue.find_images_with_packages_from_content_set')
@@ -2101,6 +2206,132 @@ class TestQueryEntityFromLightBlue(helpers.FreshmakerTestCase):
         self.assertEqual(set(ret[0]["content_sets"]),
                          set(["dummy-content-set-1", "dummy-content-set-2"]))
 
+    @patch("freshmaker.lightblue.LightBlue._get_published_data")
+    @patch("freshmaker.lightblue.ArtifactBuild.get_most_original_nvrs")
+    @patch("freshmaker.lightblue.ContainerImage.get_additional_data_from_koji_multi")
+    @patch("freshmaker.lightblue.ContainerImage.resolve")
+    @patch("freshmaker.lightblue.LightBlue.find_container_images")
+    @patch("os.path.exists")
+    def test_find_parent_images(self, exists, find_container_images, resolve,
+                                get_additional_data, get_most_original_nvrs,
+                                get_published_data):
+        exists.return_value = True
+        get_published_data.side_effect = lambda images: {
+            image.nvr: {"published": True} for image in images}
+        get_additional_data.side_effect = lambda nvrs: {nvr: {"nvr": nvr} for nvr in nvrs}
+        get_most_original_nvrs.side_effect = lambda nvrs: {nvr: "orig-" + nvr for nvr in nvrs}
+
+        def _image(nvr, parent_nvr=None, rpms=None):
+            return ContainerImage.create({
+                "brew": {"build": nvr},
+                "parent_brew_build": parent_nvr,
+                "parent_image_builds": {},
+                "rpm_manifest": [{"rpms": [{"name": rpm} for rpm in rpms or []]}],
+            })
+
+        base = _image("base-1-1", rpms=["openssl"])
+        middle = _image("middle-1-1", "base-1-1")
+        leaf_1 = _image("leaf-1-1", "middle-1-1")
+        leaf_2 = _image("leaf-2-1", "middle-1-1")
+        leaf_3 = _image("leaf-3-1", "missing-1-1")
+        find_container_images.side_effect = [[middle], [base]]
+
+        lb = LightBlue(server_url=self.fake_server_url,
+                       cert=self.fake_cert_file,
+                       private_key=self.fake_private_key)
+        parent_images = lb.find_parent_images([leaf_1, leaf_2, leaf_3])
+
+        self.assertEqual(parent_images, {
+            "middle-1-1": middle, "missing-1-1": None, "base-1-1": base})
+        # Single query per level, parents shared by multiple images are
+        # queried only once.
+        self.assertEqual(find_container_images.call_count, 2)
+        first_query = find_container_images.call_args_list[0][0][0]["query"]["$and"][0]
+        self.assertEqual(first_query["field"], "brew.build")
+        self.assertEqual(first_query["op"], "$in")
+        self.assertEqual(set(first_query["values"]), {"middle-1-1", "missing-1-1"})
+        second_query = find_container_images.call_args_list[1][0][0]["query"]["$and"][0]
+        self.assertEqual(second_query["values"], ["base-1-1"])
+        # Parent images are resolved with all their children and the data
+        # from Koji and the database are queried at once for each level.
+        resolve.assert_any_call(
+            lb, [leaf_1, leaf_2], additional_data={"nvr": "middle-1-1"},
+            most_original_nvrs={"middle-1-1": "orig-middle-1-1"},
+            published_data={"published": True})
+        resolve.assert_any_call(
+            lb, [middle], additional_data={"nvr": "base-1-1"},
+            most_original_nvrs={"base-1-1": "orig-base-1-1"},
+            published_data={"published": True})
+        get_additional_data.assert_has_calls([call(["middle-1-1"]), call(["base-1-1"])])
+        get_most_original_nvrs.assert_has_calls([call(["middle-1-1"]), call(["base-1-1"])])
+        get_published_data.assert_has_calls([call([middle]), call([base])])
+
+        # The parents found by find_parent_images are not queried again.
+        with patch("freshmaker.lightblue.LightBlue.get_images_by_nvrs") as get_images_by_nvrs:
+            ret = lb.find_parent_images_with_package(
+                leaf_1, "openssl", [], parent_images=parent_images)
+            get_images_by_nvrs.assert_not_called()
+        self.assertEqual(ret, [])
+
+        with patch("freshmaker.lightblue.LightBlue.get_images_by_nvrs") as get_images_by_nvrs:
+            middle["rpm_manifest"] = [{"rpms": [{"name": "openssl"}]}]
+            ret = lb.find_parent_images_with_package(
+                leaf_1, "openssl", [], parent_images=parent_images)
+            get_images_by_nvrs.assert_not_called()
+        self.assertEqual(ret, [middle, base])
+        self.assertEqual(middle["parent"], base)
+
+    @patch("freshmaker.lightblue.LightBlue.find_container_images")
+    @patch("os.path.exists")
+    def test_get_published_data(self, exists, find_container_images):
+        exists.return_value = True
+        images = [
+            ContainerImage.create({"brew": {"build": nvr}})
+            for nvr in ["published-1-1", "unpublished-1-1", "missing-1-1"]
+        ]
+        find_container_images.side_effect = [
+            [ContainerImage.create({"brew": {"build": "published-1-1"}})],
+            [ContainerImage.create({
+                "brew": {"build": "unpublished-1-1"}, "rpm_manifest": "x"})],
+        ]
+
+        lb = LightBlue(server_url=self.fake_server_url,
+                       cert=self.fake_cert_file,
+                       private_key=self.fake_private_key)
+        ret = lb._get_published_data(images)
+
+        self.assertEqual(ret, {
+            "published-1-1": {"published": True},
+            "unpublished-1-1": {"published": False, "rpm_manifest": "x"},
+            "missing-1-1": {"published": False},
+        })
+        find_container_images.assert_has_calls([
+            call(lb._get_images_by_nvrs_request(
+                ["published-1-1", "unpublished-1-1", "missing-1-1"],
+                published=True, include_rpm_manifest=False)),
+            call(lb._get_images_by_nvrs_request(
+                ["unpublished-1-1", "missing-1-1"])),
+        ])
+
+        find_container_images.side_effect = LightBlueRequestError(
+            {"errors": [{"msg": "dummy error"}]}, http.client.REQUEST_TIMEOUT)
+        self.assertEqual(lb._get_published_data(images), {})
+
+    def test_container_image_has_rpm(self):
+        image = ContainerImage.create({
+            "brew": {"build": "foo-1-1"},
+            "architecture": "amd64",
+            "rpm_manifest": [{"rpms": [{"name": "openssl"}]}],
+        })
+        image.update_multi_arch(ContainerImage.create({
+            "brew": {"build": "foo-1-1"},
+            "architecture": "arm64",
+            "rpm_manifest": [{"rpms": [{"name": "openssl"}, {"name": "httpd"}]}],
+        }))
+        self.assertTrue(image.has_rpm("openssl"))
+        self.assertTrue(image.has_rpm("httpd"))
+        self.assertFalse(image.has_rpm("bash"))
+
     @patch('freshmaker.lightblue.LightBlue.find_container_repositories')
     @patch('freshmaker.lightblue.LightBlue.find_container_images')
     @patch('os.path.exists')
@@ -2130,12 +2361,14 @@ class TestQueryEntityFromLightBlue(helpers.FreshmakerTestCase):
                 "openssl",
                 ["dummy-content-set-1"])
 
+    @patch('freshmaker.kojiservice.KojiService.multicall', new=helpers.koji_multicall)
+    @patch('freshmaker.lightblue.LightBlue._get_published_data', return_value={})
     @patch('freshmaker.lightblue.ContainerImage.resolve')
     @patch('freshmaker.lightblue.LightBlue.find_container_repositories')
     @patch('freshmaker.lightblue.LightBlue.find_container_images')
     @patch('os.path.exists')
     def test_images_with_content_set_packages_leaf_container_images(
-            self, exists, cont_images, cont_repos, resolve):
+            self, exists, cont_images, cont_repos, resolve, get_published_data):
 
         exists.return_value = True
         cont_images.return_value = self.fake_container_images
@@ -2171,6 +2404,7 @@ class TestQueryEntityFromLightBlue(helpers.FreshmakerTestCase):
                             {'field': 'rpm_manifest.*.rpms.*.srpm_name', 'include': True, 'recursive': True}],
              'objectType': 'containerImage'})
 
+    @patch('freshmaker.kojiservice.KojiService.multicall', new=helpers.koji_multicall)
     @patch('freshmaker.lightblue.ArtifactBuild.get_most_original_nvr')
     @patch('freshmaker.lightblue.LightBlue.find_container_repositories')
     @patch('freshmaker.lightblue.LightBlue.find_container_images')
@@ -2842,6 +3076,80 @@ class TestDeduplicateImagesToRebuild(helpers.FreshmakerTestCase):
                 ret = self.lb._deduplicate_images_to_rebuild([httpd, perl])
                 self.assertEqual(ret, expected_images)
 
+    def test_incremental_deduplication(self):
+        httpd = self._create_imgs([
+            "httpd-2.4-12",
+            "s2i-base-1-10",
+            "s2i-core-1-11",
+            "rhel-server-docker-7.4-150",
+        ])
+        perl = self._create_imgs([
+            "perl-5.7-1",
+            "s2i-base-1-2",
+            "s2i-core-1-2",
+            "rhel-server-docker-7.4-150",
+        ])
+
+        deduplicator = ImagesToRebuildDeduplicator(self.lb)
+        deduplicator.add([httpd])
+        deduplicator.deduplicate()
+        self.assertEqual(deduplicator.dirty_image_groups, set())
+
+        deduplicator.add([perl])
+        ret = deduplicator.deduplicate()
+
+        expected_images = [
+            self._create_imgs([
+                "httpd-2.4-12",
+                "s2i-base-1-10",
+                "s2i-core-1-11",
+                "rhel-server-docker-7.4-150",
+            ]),
+            self._create_imgs([
+                "perl-5.7-1",
+                "s2i-base-1-10",
+                "s2i-core-1-11",
+                "rhel-server-docker-7.4-150",
+            ])
+        ]
+        self.assertEqual(ret, expected_images)
+        self.assertEqual(ret, self.lb._deduplicate_images_to_rebuild([httpd, perl]))
+        # The replaced images are no longer indexed.
+        self.assertEqual(
+            deduplicator.nvr_to_coordinates["s2i-base-1-10"], {(0, 1), (1, 1)})
+        self.assertNotIn("s2i-base-1-2", deduplicator.nvr_to_coordinates)
+        self.assertNotIn("s2i-core-1-2", deduplicator.nvr_to_coordinates)
+
+    @patch("freshmaker.lightblue.LightBlue.describe_image_group")
+    def test_incremental_deduplication_only_changed_groups(self, describe_image_group):
+        describe_image_group.side_effect = lambda image: image.nvr.rsplit("-", 1)[0]
+        httpd = self._create_imgs([
+            "httpd-2.4-12",
+            "rhel-server-docker-7.4-150",
+        ])
+        perl = self._create_imgs([
+            "perl-5.7-1",
+            "rhel-server-docker-7.4-150",
+        ])
+
+        deduplicator = ImagesToRebuildDeduplicator(self.lb)
+        deduplicator.add([httpd])
+        deduplicator.deduplicate()
+
+        deduplicator.add([perl])
+        self.assertEqual(
+            deduplicator.dirty_image_groups, {"perl-5.7", "rhel-server-docker-7.4"})
+        with patch.object(deduplicator, "_deduplicate_image_group") as dedup_group:
+            deduplicator.deduplicate()
+        self.assertEqual(
+            dedup_group.call_args_list,
+            [call("rhel-server-docker-7.4", "handle_parent_change"),
+             call("perl-5.7", "handle_parent_change"),
+             call("rhel-server-docker-7.4", "update_to_latest"),
+             call("perl-5.7", "update_to_latest")])
+        # The image group is described once per NVR.
+        self.assertEqual(describe_image_group.call_count, 3)
+
 
 @patch('os.path.exists', return_value=True)
 @patch('freshmaker.lightblue.LightBlue.get_fixed_published_image')
@@ -21,9 +21,11 @@
 # Written by Chenxiong Qi <cqi@redhat.com>
 
 
+import threading
+import time
 import unittest
 
-from unittest.mock import patch
+from unittest.mock import call, patch, Mock
 
 from freshmaker import conf
 from freshmaker import messaging
@@ -154,3 +156,232 @@ class TestInMemoryPublish(BaseMessagingTest):
             'freshmaker.images.ready',
             {'msg_id': '1', 'msg': fake_msg})
         work_queue_put.assert_called_once_with(from_fedmsg.return_value)
+
+
+class TestMessagePublisher(BaseMessagingTest):
+    """Test sending messages in batches by MessagePublisher"""
+
+    def setUp(self):
+        super(TestMessagePublisher, self).setUp()
+        self.batches = []
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def _send_batch(self, messages):
+        self.batches.append(messages)
+        self.gate.wait()
+
+    def _create_publisher(self, **kwargs):
+        self.sender = Mock()
+        self.sender.send.side_effect = self._send_batch
+        return messaging.MessagePublisher(self.sender, **kwargs)
+
+    def _create_blocked_publisher(self, **kwargs):
+        """
+        Returns the publisher blocked in sending the first message until
+        the self.gate is set, so the next messages are queued.
+        """
+        self.gate.clear()
+        publisher = self._create_publisher(**kwargs)
+        publisher.put("blocker", {})
+        while not self.batches:
+            time.sleep(0.01)
+        return publisher
+
+    def test_send_in_order(self):
+        publisher = self._create_blocked_publisher(batch_size=2)
+        for i in range(5):
+            self.assertTrue(publisher.put("build.state.changed", {"id": i}))
+        self.gate.set()
+        publisher.stop()
+
+        self.assertEqual(self.batches, [
+            [("blocker", {})],
+            [("build.state.changed", {"id": 0}), ("build.state.changed", {"id": 1})],
+            [("build.state.changed", {"id": 2}), ("build.state.changed", {"id": 3})],
+            [("build.state.changed", {"id": 4})],
+        ])
+
+    def test_coalesce_event_state_changed(self):
+        publisher = self._create_blocked_publisher(coalesce_window=0.01)
+        publisher.put("event.state.changed", {"id": 1, "state": 0})
+        publisher.put("event.state.changed", {"id": 2, "state": 0})
+        publisher.put("build.state.changed", {"id": 1, "state": 0})
+        publisher.put("event.state.changed", {"id": 1, "state": 1})
+        publisher.put("build.state.changed", {"id": 1, "state": 1})
+        self.gate.set()
+        publisher.flush()
+
+        self.assertEqual(self.batches[1], [
+            ("event.state.changed", {"id": 2, "state": 0}),
+            ("build.state.changed", {"id": 1, "state": 0}),
+            ("event.state.changed", {"id": 1, "state": 1}),
+            ("build.state.changed", {"id": 1, "state": 1}),
+        ])
+        publisher.stop()
+
+    def test_no_coalescing_without_window(self):
+        publisher = self._create_blocked_publisher()
+        publisher.put("event.state.changed", {"id": 1, "state": 0})
+        publisher.put("event.state.changed", {"id": 1, "state": 1})
+        self.gate.set()
+        publisher.stop()
+
+        self.assertEqual(self.batches[1], [
+            ("event.state.changed", {"id": 1, "state": 0}),
+            ("event.state.changed", {"id": 1, "state": 1}),
+        ])
+
+    def test_close_sender_on_stop(self):
+        publisher = self._create_publisher()
+        publisher.put("images.ready", {"id": 1})
+        publisher.flush()
+        publisher.put("images.ready", {"id": 2})
+        publisher.flush()
+        self.sender.close.assert_not_called()
+
+        publisher.stop()
+        self.sender.close.assert_called_once_with()
+        self.assertEqual(self.sender.send.call_count, 2)
+
+    def test_put_full_queue(self):
+        publisher = self._create_blocked_publisher(queue_size=1)
+        self.assertTrue(publisher.put("images.ready", {}))
+        self.assertFalse(publisher.put("images.ready", {}))
+        self.gate.set()
+        publisher.stop()
+        self.assertEqual(len(self.batches), 2)
+
+    @patch("freshmaker.monitor.messaging_tx_failed_counter.inc")
+    def test_send_failed(self, failed_inc):
+        sender = Mock()
+        sender.send.side_effect = [RuntimeError("Expected error"), None]
+        publisher = messaging.MessagePublisher(sender)
+        publisher.put("images.ready", {"id": 1})
+        publisher.flush()
+        publisher.put("images.ready", {"id": 2})
+        publisher.stop()
+
+        failed_inc.assert_called_once_with(1)
+        sender.send.assert_called_with([("images.ready", {"id": 2})])
+
+    @patch.object(conf, 'messaging_async_publish', new=True)
+    @patch.object(conf, 'messaging_sender', new='in_memory')
+    def test_publish_async(self):
+        batch_sender = Mock()
+        mock_messaging_backends = {
+            'in_memory': {'publish': Mock(), 'batch_sender': batch_sender},
+        }
+        with patch.dict('freshmaker.messaging._messaging_backends',
+                        mock_messaging_backends):
+            try:
+                self.assertIsNone(publish('images.ready', {'id': 1}))
+                messaging.get_publisher().flush()
+            finally:
+                messaging.stop_publisher()
+
+        batch_sender.return_value.send.assert_called_once_with([('images.ready', {'id': 1})])
+        batch_sender.return_value.close.assert_called_once_with()
+        mock_messaging_backends['in_memory']['publish'].assert_not_called()
+
+    @patch.object(conf, 'messaging_async_publish', new=True)
+    @patch.object(conf, 'messaging_sender', new='in_memory')
+    def test_publish_async_full_queue(self):
+        mock_messaging_backends = {'in_memory': {'publish': Mock()}}
+        with patch.dict('freshmaker.messaging._messaging_backends',
+                        mock_messaging_backends), \
+                patch('freshmaker.messaging.get_publisher') as get_publisher:
+            get_publisher.return_value.put.return_value = False
+            publish('images.ready', {'id': 1})
+
+        mock_messaging_backends['in_memory']['publish'].assert_called_once_with(
+            'images.ready', {'id': 1})
+
+    def test_publish_batch_fallback(self):
+        _in_memory_publish = Mock()
+        mock_messaging_backends = {'in_memory': {'publish': _in_memory_publish}}
+        with patch.dict('freshmaker.messaging._messaging_backends',
+                        mock_messaging_backends), \
+                patch.object(conf, 'messaging_sender', new='in_memory'):
+            messaging.publish_batch([('a', {}), ('b', {})])
+        self.assertEqual(_in_memory_publish.call_args_list, [call('a', {}), call('b', {})])
+
+
+@unittest.skipUnless(rhmsg, 'rhmsg is not available in Fedora yet.')
+class TestPublishBatchToRhmsg(BaseMessagingTest):
+    """Test publish messages to UMB using _RhmsgBatchSender"""
+
+    def setUp(self):
+        super(TestPublishBatchToRhmsg, self).setUp()
+        rhmsg_config = {
+            'rhmsg': {
+                'BROKER_URLS': ['amqps://localhost:5671'],
+                'CERT_FILE': '/path/to/cert',
+                'KEY_FILE': '/path/to/key',
+                'CA_CERT': '/path/to/ca-cert',
+                'TOPIC_PREFIX': 'VirtualTopic.eng.freshmaker',
+            }
+        }
+        self.patchers = [
+            patch.object(conf, 'messaging_sender', new='rhmsg'),
+            patch.object(conf, 'messaging_backends', new=rhmsg_config),
+            patch('freshmaker.utils.time.sleep'),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self):
+        for patcher in self.patchers:
+            patcher.stop()
+        super(TestPublishBatchToRhmsg, self).tearDown()
+
+    @patch('rhmsg.activemq.producer.AMQProducer')
+    @patch('proton.Message')
+    def test_publish_batch(self, Message, AMQProducer):
+        messaging.publish_batch([
+            ('images.ready', {}), ('images.ready', {}), ('build.state.changed', {})])
+
+        AMQProducer.assert_called_once_with(
+            urls=['amqps://localhost:5671'], certificate='/path/to/cert',
+            private_key='/path/to/key', trusted_certificates='/path/to/ca-cert')
+        producer = AMQProducer.return_value
+        self.assertEqual(producer.through_topic.call_args_list, [
+            call('VirtualTopic.eng.freshmaker.images.ready'),
+            call('VirtualTopic.eng.freshmaker.build.state.changed'),
+        ])
+        self.assertEqual(producer.send.call_args_list, [
+            call(Message.return_value, Message.return_value),
+            call(Message.return_value),
+        ])
+        producer.close.assert_called_once_with()
+
+    @patch('rhmsg.activemq.producer.AMQProducer')
+    @patch('proton.Message')
+    def test_producer_kept_open(self, Message, AMQProducer):
+        sender = messaging.get_batch_sender()
+        sender.send([('images.ready', {})])
+        sender.send([('build.state.changed', {})])
+
+        AMQProducer.assert_called_once()
+        self.assertEqual(AMQProducer.return_value.send.call_count, 2)
+        AMQProducer.return_value.close.assert_not_called()
+
+        sender.close()
+        AMQProducer.return_value.close.assert_called_once_with()
+
+    @patch('rhmsg.activemq.producer.AMQProducer')
+    @patch('proton.Message')
+    def test_resend_only_unsent_messages(self, Message, AMQProducer):
+        producer = AMQProducer.return_value
+        producer.send.side_effect = [None, RuntimeError("Expected error"), None]
+
+        messaging.publish_batch([('images.ready', {}), ('build.state.changed', {})])
+
+        # Connected again after the failure, images.ready is not sent twice.
+        self.assertEqual(AMQProducer.call_count, 2)
+        self.assertEqual(producer.through_topic.call_args_list, [
+            call('VirtualTopic.eng.freshmaker.images.ready'),
+            call('VirtualTopic.eng.freshmaker.build.state.changed'),
+            call('VirtualTopic.eng.freshmaker.build.state.changed'),
+        ])
+        self.assertEqual(producer.close.call_count, 2)
@@ -21,13 +21,17 @@
 # Written by Jan Kaluza <jkaluza@redhat.com>
 
 import datetime
-from unittest.mock import patch
+import json
 
-from freshmaker import db, events
+from unittest.mock import call, patch
+
+from freshmaker import conf, db, events
 from freshmaker.models import ArtifactBuild, ArtifactType
 from freshmaker.models import Event, EventState, EVENT_TYPES, EventDependency
-from freshmaker.models import Compose, ArtifactBuildCompose
+from freshmaker.models import Compose, ArtifactBuildCompose, KojiBuildMetadata
+from freshmaker.models import QueuedEvent
 from freshmaker.types import ArtifactBuildState, RebuildReason
+from freshmaker.errata import ErrataAdvisory
 from freshmaker.events import ErrataAdvisoryRPMsSignedEvent
 from tests import helpers
 
@@ -84,6 +88,10 @@ class TestModels(helpers.ModelsTestCase):
         self.assertEqual(build3.get_root_dep_on(), build1)
         self.assertEqual(build4.get_root_dep_on(), build1)
 
+        # One query refreshes the expired build4, the other one walks the chain.
+        _, count = self._count_queries(build4.get_root_dep_on)
+        self.assertEqual(count, 2)
+
     def test_depending_artifact_builds(self):
         event = Event.create(db.session, "test_msg_id", "test", events.TestingEvent)
         parent = ArtifactBuild.create(db.session, event, "parent", "module", 1234)
@@ -126,6 +134,42 @@ class TestModels(helpers.ModelsTestCase):
             self.assertEqual(build4.state, ArtifactBuildState.BUILD.value)
             self.assertEqual(build4.state_reason, None)
 
+    def test_build_transition_cascade_deep_tree(self):
+        event = Event.create(db.session, "test_msg_id", "test", events.TestingEvent)
+        root = ArtifactBuild.create(db.session, event, "root", "image", 1)
+        parent = root
+        for i in range(2000):
+            parent = ArtifactBuild.create(
+                db.session, event, "build-%d" % i, "image", 100 + i, parent)
+        sibling = ArtifactBuild.create(db.session, event, "sibling", "image", 3000, root)
+        # Already failed build stops the cascade, the same as transition() does.
+        failed = ArtifactBuild.create(
+            db.session, event, "failed", "image", 3001, root,
+            state=ArtifactBuildState.FAILED.value)
+        failed_child = ArtifactBuild.create(db.session, event, "failed-child", "image", 3002, failed)
+        db.session.commit()
+
+        with patch("freshmaker.models.messaging.publish") as publish, \
+                patch.object(ArtifactBuildState.FAILED.counter, "inc") as inc:
+            root.transition(ArtifactBuildState.FAILED.value, "reason")
+            db.session.commit()
+
+        self.assertEqual(
+            [c[0][0] for c in publish.call_args_list],
+            ["builds.state.changed", "build.state.changed"])
+        changed = publish.call_args_list[0][0][1]["builds"]
+        self.assertEqual(len(changed), 2001)
+        self.assertEqual(inc.call_args_list, [call(), call(2001)])
+
+        self.assertEqual(parent.state, ArtifactBuildState.FAILED.value)
+        self.assertEqual(
+            parent.state_reason,
+            "Cannot build artifact, because its dependency cannot be built.")
+        self.assertIsNotNone(parent.time_completed)
+        self.assertEqual(sibling.state, ArtifactBuildState.FAILED.value)
+        self.assertIsNone(failed.state_reason)
+        self.assertEqual(failed_child.state, ArtifactBuildState.BUILD.value)
+
     def test_build_transition_recursion_not_done_for_ok_states(self):
         for i, state in enumerate([ArtifactBuildState.DONE.value,
                                    ArtifactBuildState.PLANNED.value]):
@@ -144,6 +188,67 @@ class TestModels(helpers.ModelsTestCase):
                 self.assertEqual(build4.state, ArtifactBuildState.BUILD.value)
                 self.assertEqual(build4.state_reason, None)
 
+    @patch("freshmaker.models.messaging.publish")
+    def test_build_claim(self, publish):
+        event = Event.create(db.session, "test_msg_id", "test", events.TestingEvent)
+        build = ArtifactBuild.create(
+            db.session, event, "ed", "image", state=ArtifactBuildState.PLANNED.value)
+        db.session.commit()
+
+        self.assertTrue(build.claim())
+        db.session.commit()
+        self.assertTrue(build.claimed)
+        self.assertEqual(build.state, ArtifactBuildState.PLANNED.value)
+        self.assertIsNotNone(build.time_claimed)
+        publish.assert_not_called()
+
+        # The build is claimed already, so it cannot be claimed by the
+        # handler having another instance of it.
+        db.session.expunge(build)
+        other_build = ArtifactBuild.query.get(build.id)
+        self.assertFalse(other_build.claim())
+        db.session.expunge(other_build)
+        db.session.add(build)
+
+        self.assertTrue(build.transition(ArtifactBuildState.BUILD.value, "Building"))
+        self.assertFalse(build.claimed)
+        self.assertIsNone(build.time_claimed)
+        publish.assert_called_once_with("build.state.changed", build.json())
+
+        # The build is not PLANNED anymore.
+        db.session.commit()
+        self.assertFalse(build.claim())
+
+    def test_build_claim_expired(self):
+        event = Event.create(db.session, "test_msg_id", "test", events.TestingEvent)
+        build = ArtifactBuild.create(
+            db.session, event, "ed", "image", state=ArtifactBuildState.PLANNED.value)
+        db.session.commit()
+        self.assertTrue(build.claim())
+        db.session.commit()
+        build_id = build.id
+        db.session.expunge(build)
+
+        # The claim is not resolved in time, for example because the backend
+        # crashed before submitting the build.
+        other_build = ArtifactBuild.query.get(build_id)
+        with patch.object(conf, "container_build_claim_timeout", new=-1):
+            self.assertTrue(other_build.claim())
+
+    def test_build_release_claim(self):
+        event = Event.create(db.session, "test_msg_id", "test", events.TestingEvent)
+        build = ArtifactBuild.create(
+            db.session, event, "ed", "image", state=ArtifactBuildState.PLANNED.value)
+        db.session.commit()
+
+        build.claim()
+        build.release_claim()
+        db.session.commit()
+        self.assertFalse(build.claimed)
+        self.assertEqual(build.state, ArtifactBuildState.PLANNED.value)
+        self.assertIsNone(build.time_claimed)
+        self.assertTrue(build.claim())
+
     def test_get_unreleased(self):
         event1 = Event.create(db.session, "test_msg_id1", "test", events.TestingEvent)
         event1.state = EventState.COMPLETE
@@ -209,6 +314,152 @@ class TestModels(helpers.ModelsTestCase):
             'depends_on_events': [],
         })
 
+    def _create_event_with_builds(self, msg_id, count, odcs_compose_id):
+        event = Event.create(db.session, msg_id, msg_id, events.TestingEvent)
+        compose = Compose(odcs_compose_id=odcs_compose_id)
+        db.session.add(compose)
+        parent = None
+        for i in range(count):
+            parent = ArtifactBuild.create(
+                db.session, event, "build-%d" % i, "image", 1000 + i, parent)
+            db.session.commit()
+            parent.add_composes(db.session, [compose])
+        db.session.commit()
+        return event
+
+    def _count_queries(self, fnc):
+        db.session.expire_all()
+        with helpers.count_queries() as statements:
+            ret = fnc()
+        return ret, len(statements)
+
+    def test_event_json_constant_number_of_queries(self):
+        small_event = self._create_event_with_builds("small", 2, 1)
+        big_event = self._create_event_with_builds("big", 20, 2)
+
+        small_json, small_count = self._count_queries(small_event.json)
+        big_json, big_count = self._count_queries(big_event.json)
+        self.assertEqual(small_count, big_count)
+
+        self.assertEqual(len(big_json["builds"]), 20)
+        build_json = big_json["builds"][5]
+        self.assertEqual(build_json["name"], "build-5")
+        self.assertEqual(build_json["dep_on"], "build-4")
+        self.assertEqual(build_json["dep_on_id"], big_json["builds"][4]["id"])
+        self.assertEqual(build_json["odcs_composes"], [2])
+        self.assertIsNone(big_json["builds"][0]["dep_on"])
+
+        # Page of events is serialized with the constant number of queries too.
+        other_small_event = self._create_event_with_builds("other", 2, 3)
+        events_json, count = self._count_queries(
+            lambda: Event.bulk_json([small_event, big_event]))
+        self.assertEqual(events_json, [small_json, big_json])
+        _, small_events_count = self._count_queries(
+            lambda: Event.bulk_json([small_event, other_small_event]))
+        self.assertEqual(count, small_events_count)
+
+    def test_artifact_build_bulk_json(self):
+        event = self._create_event_with_builds("event", 3, 1)
+        builds = event.builds.order_by(ArtifactBuild.id).all()
+        self.assertEqual(
+            ArtifactBuild.bulk_json(builds), [build.json() for build in builds])
+        self.assertEqual(ArtifactBuild.bulk_json([]), [])
+
+    def test_artifact_build_bulk_json_does_not_change_session(self):
+        event = self._create_event_with_builds("event", 1, 1)
+        build = event.builds.first()
+        new_build = ArtifactBuild(
+            name="new", type=ArtifactType.IMAGE.value, event=event,
+            state=ArtifactBuildState.PLANNED.value)
+        db.session.expunge(new_build)
+
+        ArtifactBuild.bulk_json([build])
+        self.assertFalse(db.session.new)
+        self.assertNotIn(new_build, db.session)
+        with self.assertRaises(AssertionError):
+            ArtifactBuild.bulk_json([new_build])
+        self.assertNotIn(new_build, db.session)
+
+    @patch("freshmaker.models.messaging.publish")
+    def test_artifact_build_transition_before_commit(self, publish):
+        event = self._create_event_with_builds("event", 1, 1)
+        build = ArtifactBuild.create(
+            db.session, event, "new", "image", state=ArtifactBuildState.PLANNED.value)
+        build.transition(ArtifactBuildState.BUILD.value, "Building.")
+        self.assertIsNotNone(build.id)
+        publish.assert_called_once_with("build.state.changed", build.json())
+
+    def test_get_builds_summaries(self):
+        event = self._create_event_with_builds("event", 3, 1)
+        build = event.builds.first()
+        build.state = ArtifactBuildState.FAILED.value
+        empty_event = Event.create(db.session, "empty", "empty", events.TestingEvent)
+        db.session.commit()
+
+        # One query loads the events, the other one counts their builds.
+        summaries, count = self._count_queries(
+            lambda: Event.get_builds_summaries(Event.query.order_by(Event.id).all()))
+        self.assertEqual(count, 2)
+        self.assertEqual(summaries, {
+            event.id: {'total': 3, 'BUILD': 2, 'FAILED': 1},
+            empty_event.id: {'total': 0},
+        })
+        self.assertEqual(Event.get_builds_summaries([]), {})
+
+    def test_event_bulk_json_min_constant_number_of_queries(self):
+        small_event = self._create_event_with_builds("small", 2, 1)
+        big_event = self._create_event_with_builds("big", 20, 2)
+        other_small_event = self._create_event_with_builds("other", 2, 3)
+
+        events_json, count = self._count_queries(
+            lambda: Event.bulk_json_min([small_event, big_event]))
+        self.assertEqual(
+            events_json, [small_event.json_min(), big_event.json_min()])
+        self.assertEqual(events_json[1]['builds_summary'], {'total': 20, 'BUILD': 20})
+        _, small_events_count = self._count_queries(
+            lambda: Event.bulk_json_min([small_event, other_small_event]))
+        self.assertEqual(count, small_events_count)
+
+    def test_record_plan(self):
+        event = Event.create(db.session, "test_msg_id", "test", events.TestingEvent)
+        parent = ArtifactBuild.create(db.session, event, "parent", "image", 1234)
+        db.session.commit()
+
+        plan = [
+            {"name": "foo", "original_nvr": "foo-1-1", "dep_on": parent,
+             "state": ArtifactBuildState.PLANNED.value, "state_reason": "",
+             "rebuild_reason": RebuildReason.DIRECTLY_AFFECTED.value,
+             "build_args": '{"key": "value"}'},
+            {"name": "bar", "original_nvr": "bar-1-1", "dep_on": "foo-1-1",
+             "state": ArtifactBuildState.FAILED.value, "state_reason": "Error"},
+        ]
+        with patch("freshmaker.models.messaging.publish") as publish, \
+                patch.object(db.session, "commit", wraps=db.session.commit) as commit:
+            builds = ArtifactBuild.record_plan(db.session, event, plan)
+        commit.assert_called_once()
+
+        self.assertEqual(list(builds.keys()), ["foo-1-1", "bar-1-1"])
+        foo, bar = builds["foo-1-1"], builds["bar-1-1"]
+        self.assertEqual(foo.dep_on, parent)
+        self.assertEqual(foo.type, ArtifactType.IMAGE.value)
+        self.assertEqual(foo.state, ArtifactBuildState.PLANNED.value)
+        self.assertIsNone(foo.state_reason)
+        self.assertIsNone(foo.time_completed)
+        self.assertEqual(foo.rebuild_reason, RebuildReason.DIRECTLY_AFFECTED.value)
+        self.assertEqual(foo.build_args, '{"key": "value"}')
+        self.assertEqual(bar.dep_on, foo)
+        self.assertEqual(bar.state_reason, "Error")
+        self.assertIsNotNone(bar.time_completed)
+        self.assertEqual(bar.rebuild_reason, RebuildReason.UNKNOWN.value)
+
+        publish.assert_called_once()
+        topic, data = publish.call_args[0]
+        self.assertEqual(topic, "event.builds.recorded")
+        self.assertEqual(data["id"], event.id)
+        self.assertEqual([b["original_nvr"] for b in data["builds"]], ["foo-1-1", "bar-1-1"])
+
+        self.assertEqual(ArtifactBuild.record_plan(db.session, event, []), {})
+
     def test_get_most_original_nvr(self):
         event = Event.create(db.session, "test_msg_id", "test", events.TestingEvent)
         ArtifactBuild.create(
@@ -228,6 +479,42 @@ class TestModels(helpers.ModelsTestCase):
         nvr = ArtifactBuild.get_most_original_nvr("ubi-2-1.1580000003")
         self.assertEqual(nvr, "ubi-2-1")
 
+    def test_get_most_original_nvrs(self):
+        event = Event.create(db.session, "test_msg_id", "test", events.TestingEvent)
+        for i in range(3):
+            ArtifactBuild.create(
+                db.session, event, "ubi", "image", 1234 + i,
+                original_nvr="ubi-2-1.%d" % i, rebuilt_nvr="ubi-2-1.%d" % (i + 1))
+        ArtifactBuild.create(
+            db.session, event, "foo", "image", 1240,
+            original_nvr="foo-1-1", rebuilt_nvr="foo-1-1.1")
+        db.session.commit()
+
+        nvrs, count = self._count_queries(lambda: ArtifactBuild.get_most_original_nvrs(
+            ["ubi-2-1.3", "ubi-2-1.1", "foo-1-1.1", "bar-1-1"]))
+        self.assertEqual(count, 1)
+        self.assertEqual(nvrs, {
+            "ubi-2-1.3": "ubi-2-1.0",
+            "ubi-2-1.1": "ubi-2-1.0",
+            "foo-1-1.1": "foo-1-1",
+        })
+        self.assertEqual(ArtifactBuild.get_most_original_nvrs([]), {})
+        self.assertIsNone(ArtifactBuild.get_most_original_nvr("bar-1-1"))
+
+    def test_get_most_original_nvrs_cycle(self):
+        event = Event.create(db.session, "test_msg_id", "test", events.TestingEvent)
+        ArtifactBuild.create(
+            db.session, event, "ubi", "image", 1234,
+            original_nvr="ubi-2-1", rebuilt_nvr="ubi-2-2")
+        ArtifactBuild.create(
+            db.session, event, "ubi", "image", 1235,
+            original_nvr="ubi-2-2", rebuilt_nvr="ubi-2-1")
+        db.session.commit()
+
+        with patch("freshmaker.models.MAX_BUILD_CHAIN_DEPTH", 5):
+            self.assertIn(
+                ArtifactBuild.get_most_original_nvr("ubi-2-2"), ["ubi-2-1", "ubi-2-2"])
+
     def test_get_rebuilt_original_nvrs_by_search_key(self):
         event = Event.create(db.session, "test_msg_id", "12345", events.TestingEvent)
         ArtifactBuild.create(db.session, event, "foo", "image", 1001,
@@ -337,6 +624,24 @@ class TestFindDependentEvents(helpers.ModelsTestCase):
         self.assertIn((self.event_1.id, self.event_2.id), dep_rels)
         self.assertIn((self.event_1.id, self.event_3.id), dep_rels)
 
+    def test_find_dependent_events_existing_dependency(self):
+        self.event_1.add_event_dependency(db.session, self.event_3)
+        db.session.commit()
+        self.assertEqual(self.event_1.event_dependencies, [self.event_3])
+
+        with helpers.count_queries() as statements:
+            dep_events = self.event_1.find_dependent_events()
+
+        # One INSERT ... SELECT adds the dependencies, one SELECT loads the events.
+        self.assertEqual(len(statements), 2)
+        self.assertEqual(dep_events, [self.event_2, self.event_3])
+        self.assertEqual(self.event_1.event_dependencies, [self.event_3, self.event_2])
+        self.assertEqual(self.event_2.depending_events, [self.event_1])
+
+        # Calling it again does not add any duplicate dependency.
+        self.assertEqual(self.event_1.find_dependent_events(), dep_events)
+        self.assertEqual(db.session.query(EventDependency).count(), 2)
+
 
 class TestArtifactBuildComposesRel(helpers.ModelsTestCase):
     """Test m2m relationship between ArtifactBuild and Compose"""
@@ -457,6 +762,50 @@ class TestEventDependency(helpers.ModelsTestCase):
         self.assertEqual(event.event_dependencies, [event1])
         self.assertEqual(event1.depending_events, [event])
 
+    def test_get_artifact_build_from_event_dependencies(self):
+        event = Event.create(db.session, "test_msg_id", "test", events.TestingEvent)
+        dep_events = []
+        for i in range(2):
+            dep_event = Event.create(
+                db.session, "test_msg_id%d" % i, "test%d" % i, events.TestingEvent)
+            for name in ["foo", "bar"]:
+                ArtifactBuild.create(
+                    db.session, dep_event, name, "image", 1000 + i,
+                    state=ArtifactBuildState.DONE.value, original_nvr="%s-1-1" % name)
+            dep_events.append(dep_event)
+        ArtifactBuild.create(
+            db.session, dep_events[1], "baz", "image", 1010,
+            state=ArtifactBuildState.DONE.value, original_nvr="baz-1-1")
+        ArtifactBuild.create(
+            db.session, dep_events[0], "planned", "image", 1011,
+            state=ArtifactBuildState.PLANNED.value, original_nvr="planned-1-1")
+        db.session.commit()
+        for dep_event in dep_events:
+            event.add_event_dependency(db.session, dep_event)
+        db.session.commit()
+
+        with patch.object(db.session, "query", wraps=db.session.query) as query:
+            builds = event.get_artifact_build_from_event_dependencies("foo-1-1")
+            self.assertEqual([b.event_id for b in builds], [dep_events[0].id])
+            builds = event.get_artifact_build_from_event_dependencies("baz-1-1")
+            self.assertEqual([b.event_id for b in builds], [dep_events[1].id])
+            self.assertIsNone(event.get_artifact_build_from_event_dependencies("planned-1-1"))
+            self.assertIsNone(event.get_artifact_build_from_event_dependencies("missing-1-1"))
+            self.assertEqual(query.call_count, 1)
+
+        # Adding new dependency drops the cached builds.
+        new_dep_event = Event.create(db.session, "test_msg_id3", "test3", events.TestingEvent)
+        ArtifactBuild.create(
+            db.session, new_dep_event, "new", "image", 1020,
+            state=ArtifactBuildState.DONE.value, original_nvr="new-1-1")
+        db.session.commit()
+        event.add_event_dependency(db.session, new_dep_event)
+        db.session.commit()
+        builds = event.get_artifact_build_from_event_dependencies("new-1-1")
+        self.assertEqual([b.event_id for b in builds], [new_dep_event.id])
+        self.assertEqual(event.event_dependencies, dep_events + [new_dep_event])
+        self.assertEqual(new_dep_event.depending_events, [event])
+
     def test_return_added_dependency_relationship(self):
         event = Event.create(db.session, "test_msg_id", "test", events.TestingEvent)
         event1 = Event.create(db.session, "test_msg_id2", "test2", events.TestingEvent)
@@ -467,3 +816,237 @@ class TestEventDependency(helpers.ModelsTestCase):
 
         self.assertEqual(event.id, dep_rel.event_id)
         self.assertEqual(event1.id, dep_rel.event_dependency_id)
+
+
+@patch.object(conf, "koji_build_metadata_cache_ttl", new=3600)
+@patch.object(conf, "koji_build_metadata_negative_cache_ttl", new=60)
+class TestKojiBuildMetadata(helpers.ModelsTestCase):
+    """Test KojiBuildMetadata cache"""
+
+    def test_get_cached_miss(self):
+        self.assertIsNone(KojiBuildMetadata.get_cached("foo-1-1", "odcs_compose_ids"))
+
+    def test_set_and_get_cached(self):
+        KojiBuildMetadata.set_cached("foo-1-1", "odcs_compose_ids", [1, 2])
+        KojiBuildMetadata.set_cached("foo-1-1", "ocp_versions_range", None)
+
+        self.assertEqual(
+            KojiBuildMetadata.get_cached("foo-1-1", "odcs_compose_ids"), ([1, 2], None))
+        self.assertEqual(
+            KojiBuildMetadata.get_cached("foo-1-1", "ocp_versions_range"), (None, None))
+        self.assertIsNone(KojiBuildMetadata.get_cached("foo-1-2", "odcs_compose_ids"))
+
+    def test_set_cached_replaces_entry(self):
+        KojiBuildMetadata.set_cached("foo-1-1", "additional_data", error="not found")
+        self.assertEqual(
+            KojiBuildMetadata.get_cached("foo-1-1", "additional_data"), (None, "not found"))
+
+        KojiBuildMetadata.set_cached("foo-1-1", "additional_data", {"commit": "abc"})
+        self.assertEqual(
+            KojiBuildMetadata.get_cached("foo-1-1", "additional_data"), ({"commit": "abc"}, None))
+        self.assertEqual(db.session.query(KojiBuildMetadata).count(), 1)
+
+    def test_cache_disabled(self):
+        with patch.object(conf, "koji_build_metadata_cache_ttl", new=0):
+            KojiBuildMetadata.set_cached("foo-1-1", "odcs_compose_ids", [1])
+            self.assertIsNone(KojiBuildMetadata.get_cached("foo-1-1", "odcs_compose_ids"))
+        self.assertEqual(db.session.query(KojiBuildMetadata).count(), 0)
+
+    def test_expired_entries(self):
+        KojiBuildMetadata.set_cached("foo-1-1", "odcs_compose_ids", [1])
+        KojiBuildMetadata.set_cached("foo-1-2", "odcs_compose_ids", [2])
+        KojiBuildMetadata.set_cached("foo-1-3", "odcs_compose_ids", error="not found")
+        KojiBuildMetadata.set_cached("foo-1-4", "odcs_compose_ids", error="not found")
+
+        now = datetime.datetime.utcnow()
+        ages = {"foo-1-1": 7200, "foo-1-2": 1800, "foo-1-3": 120, "foo-1-4": 30}
+        for entry in db.session.query(KojiBuildMetadata):
+            entry.time_created = now - datetime.timedelta(seconds=ages[entry.nvr])
+        db.session.commit()
+
+        self.assertIsNone(KojiBuildMetadata.get_cached("foo-1-1", "odcs_compose_ids"))
+        self.assertEqual(
+            KojiBuildMetadata.get_cached("foo-1-2", "odcs_compose_ids"), ([2], None))
+        self.assertIsNone(KojiBuildMetadata.get_cached("foo-1-3", "odcs_compose_ids"))
+        self.assertEqual(
+            KojiBuildMetadata.get_cached("foo-1-4", "odcs_compose_ids"), (None, "not found"))
+
+        self.assertEqual(KojiBuildMetadata.evict_expired(db.session), 2)
+        self.assertEqual(
+            sorted(entry.nvr for entry in db.session.query(KojiBuildMetadata)),
+            ["foo-1-2", "foo-1-4"])
+
+
+class TestQueuedEvent(helpers.ModelsTestCase):
+    """Test QueuedEvent durable queue"""
+
+    def test_enqueue_and_dequeue(self):
+        advisory = ErrataAdvisory(123, "RHSA-2017", "QE", ["rpm"], "Critical")
+        events_to_queue = [
+            ErrataAdvisoryRPMsSignedEvent("msg-1", advisory),
+            events.BrewContainerTaskStateChangeEvent(
+                "msg-2", "foo", "master", "target", 10, "BUILDING", "CLOSED"),
+            events.FreshmakerManageEvent({"action": "eventcancel", "try": 0, "event_id": 1}),
+        ]
+        ids = [QueuedEvent.enqueue(event) for event in events_to_queue]
+
+        # The enqueued events are claimed by the caller.
+        before_enqueue = datetime.datetime.utcnow() - datetime.timedelta(seconds=60)
+        self.assertEqual(QueuedEvent.dequeue(10, before_enqueue), [])
+
+        # The events claimed by the dequeue are not claimed again by the
+        # next dequeue with the same `claimed_before`.
+        started = datetime.datetime.utcnow()
+        queued = QueuedEvent.dequeue(2, started)
+        self.assertEqual([queued_id for queued_id, event in queued], ids[:2])
+        self.assertIsInstance(queued[0][1], ErrataAdvisoryRPMsSignedEvent)
+        self.assertIsInstance(queued[0][1].advisory, ErrataAdvisory)
+        self.assertEqual(queued[0][1].advisory.errata_id, 123)
+        self.assertEqual(queued[1][1].task_id, 10)
+
+        queued = QueuedEvent.dequeue(10, started)
+        self.assertEqual([queued_id for queued_id, event in queued], ids[2:])
+        self.assertEqual(queued[0][1].action, "eventcancel")
+        self.assertEqual(queued[0][1].try_count, 1)
+        self.assertEqual(db.session.query(QueuedEvent).get(ids[0]).attempts, 2)
+
+    def test_renew(self):
+        queued_id = QueuedEvent.enqueue(events.TestingEvent("msg-1"))
+        claimed = datetime.datetime.utcnow() - datetime.timedelta(seconds=600)
+        db.session.query(QueuedEvent).update({QueuedEvent.time_claimed: claimed})
+        db.session.commit()
+
+        QueuedEvent.renew([queued_id])
+        self.assertEqual(QueuedEvent.dequeue(10, claimed + datetime.timedelta(seconds=1)), [])
+
+    def test_dequeue_max_attempts(self):
+        queued_id = QueuedEvent.enqueue(events.TestingEvent("msg-1"))
+        later = datetime.datetime.utcnow() + datetime.timedelta(seconds=60)
+        # The enqueue is the first attempt.
+        self.assertEqual(len(QueuedEvent.dequeue(10, later, max_attempts=2)), 1)
+        self.assertEqual(QueuedEvent.dequeue(10, later, max_attempts=2), [])
+
+        queued_event = db.session.query(QueuedEvent).get(queued_id)
+        self.assertIsNotNone(queued_event.time_failed)
+        self.assertEqual(queued_event.error, "Not processed in 2 attempts.")
+
+    def test_ack(self):
+        ids = [QueuedEvent.enqueue(events.TestingEvent("msg-%d" % i)) for i in range(3)]
+        QueuedEvent.ack(ids[:2])
+        self.assertEqual([e.id for e in db.session.query(QueuedEvent)], ids[2:])
+
+    def test_idempotency_key(self):
+        first = QueuedEvent.enqueue(events.TestingEvent("msg-1"), "key")
+        self.assertIsNotNone(first)
+        self.assertIsNone(QueuedEvent.enqueue(events.TestingEvent("msg-2"), "key"))
+        self.assertIsNotNone(QueuedEvent.enqueue(events.TestingEvent("msg-3")))
+
+        # The key can be used again once the event is acknowledged.
+        QueuedEvent.ack([first])
+        self.assertIsNotNone(QueuedEvent.enqueue(events.TestingEvent("msg-4"), "key"))
+
+    def test_dequeue_marks_broken_events_failed(self):
+        queued_id = QueuedEvent.enqueue(events.TestingEvent("msg-1"))
+        queued_event = db.session.query(QueuedEvent).get(queued_id)
+        queued_event.data = queued_event.data.replace("TestingEvent", "RenamedEvent")
+        db.session.commit()
+
+        now = datetime.datetime.utcnow()
+        self.assertEqual(QueuedEvent.dequeue(10, now), [])
+        db.session.expire_all()
+        queued_event = db.session.query(QueuedEvent).one()
+        self.assertIsNotNone(queued_event.time_failed)
+        self.assertEqual(queued_event.error, "Unknown event type RenamedEvent.")
+
+        # The failed event is not claimed again.
+        self.assertEqual(
+            QueuedEvent.dequeue(10, now + datetime.timedelta(seconds=60)), [])
+
+    def test_enqueue_not_serializable_event(self):
+        event = events.TestingEvent("msg-1")
+        event.data = object()
+        with self.assertRaises(TypeError):
+            QueuedEvent.enqueue(event)
+        self.assertEqual(db.session.query(QueuedEvent).count(), 0)
+
+    def test_event_stored_as_json(self):
+        advisory = ErrataAdvisory(123, "RHSA-2017", "QE", ["rpm"], "Critical")
+        queued_id = QueuedEvent.enqueue(
+            events.ManualRebuildWithAdvisoryEvent("msg-1", advisory, ["foo-1-1"]))
+        data = json.loads(db.session.query(QueuedEvent).get(queued_id).data)
+
+        self.assertEqual(data["version"], events.EVENT_DUMP_VERSION)
+        self.assertEqual(data["type"], "ManualRebuildWithAdvisoryEvent")
+        self.assertEqual(data["attributes"]["container_images"], ["foo-1-1"])
+        self.assertEqual(data["attributes"]["advisory"]["__class__"], "ErrataAdvisory")
+        self.assertEqual(data["attributes"]["advisory"]["__dict__"]["errata_id"], 123)
+
+
+class TestQueryPlans(helpers.ModelsTestCase):
+    """
+    Checks that the frequently used queries are served by the indexes and
+    do not fall back to the full table scan.
+    """
+
+    def setUp(self):
+        super(TestQueryPlans, self).setUp()
+        for i in range(50):
+            event = Event.create(
+                db.session, "msg-%d" % i, str(i), events.ErrataAdvisoryRPMsSignedEvent)
+            parent = None
+            for j in range(5):
+                parent = ArtifactBuild.create(
+                    db.session, event, "build-%d-%d" % (i, j), "image",
+                    i * 10 + j, parent, original_nvr="nvr-%d-%d-1" % (i, j),
+                    rebuilt_nvr="nvr-%d-%d-2" % (i, j))
+        db.session.commit()
+        db.session.execute("ANALYZE")
+
+    def _get_query_plan(self, query):
+        statement = query.statement.compile(
+            dialect=db.engine.dialect, compile_kwargs={"literal_binds": True})
+        rows = db.session.execute("EXPLAIN QUERY PLAN %s" % statement).fetchall()
+        return [row[-1] for row in rows]
+
+    def assertNoTableScan(self, query):
+        plan = self._get_query_plan(query)
+        scans = [step for step in plan
+                 if step.startswith("SCAN") and "USING" not in step]
+        self.assertEqual(scans, [], "Query falls back to table scan: %s" % plan)
+
+    def test_artifact_build_by_type_and_build_id(self):
+        self.assertNoTableScan(db.session.query(ArtifactBuild).filter_by(
+            type=ArtifactType.IMAGE.value, build_id=123))
+
+    def test_artifact_build_by_rebuilt_nvr(self):
+        self.assertNoTableScan(db.session.query(ArtifactBuild).filter(
+            ArtifactBuild.rebuilt_nvr == "nvr-1-1-2"))
+        self.assertNoTableScan(db.session.query(ArtifactBuild).filter(
+            ArtifactBuild.rebuilt_nvr == "nvr-1-1-2",
+            ArtifactBuild.type == ArtifactType.IMAGE.value))
+
+    def test_artifact_build_by_dep_on_state_and_type(self):
+        self.assertNoTableScan(db.session.query(ArtifactBuild).filter_by(
+            type=ArtifactType.IMAGE.value,
+            state=ArtifactBuildState.PLANNED.value,
+            dep_on_id=12))
+
+    def test_artifact_build_summaries(self):
+        self.assertNoTableScan(db.session.query(
+            ArtifactBuild.event_id, ArtifactBuild.state,
+            db.func.count(ArtifactBuild.id)
+        ).filter(
+            ArtifactBuild.event_id.in_([1, 2, 3])
+        ).group_by(ArtifactBuild.event_id, ArtifactBuild.state))
+
+    def test_event_by_search_key_and_type(self):
+        self.assertNoTableScan(db.session.query(Event).filter_by(
+            event_type_id=EVENT_TYPES[ErrataAdvisoryRPMsSignedEvent],
+            search_key="12"))
+        self.assertNoTableScan(Event.query.filter(Event.search_key == "12").filter(
+            Event.state.in_([EventState.INITIALIZED.value, EventState.BUILDING.value])))
+
+    def test_event_by_state_and_time_created(self):
+        self.assertNoTableScan(Event.query.filter(
+            Event.state.in_([EventState.INITIALIZED.value, EventState.BUILDING.value]),
+            Event.time_created < datetime.datetime.utcnow()))
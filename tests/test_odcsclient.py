@@ -155,15 +155,15 @@ class TestPrepareYumRepo(helpers.ModelsTestCase):
 
     @patch('freshmaker.odcsclient.create_odcs_client')
     @patch('freshmaker.odcsclient.FreshmakerODCSClient._get_packages_for_compose')
-    @patch('freshmaker.odcsclient.FreshmakerODCSClient._get_compose_source')
+    @patch('freshmaker.odcsclient.FreshmakerODCSClient._get_compose_sources')
     @patch('time.sleep')
     @patch('freshmaker.odcsclient.Errata')
     def test_get_repo_url_when_succeed_to_generate_compose(
-            self, errata, sleep, _get_compose_source,
+            self, errata, sleep, _get_compose_sources,
             _get_packages_for_compose, create_odcs_client):
         odcs = create_odcs_client.return_value
         _get_packages_for_compose.return_value = ['httpd', 'httpd-debuginfo']
-        _get_compose_source.return_value = 'rhel-7.2-candidate'
+        _get_compose_sources.return_value = ['rhel-7.2-candidate']
         odcs.new_compose.return_value = {
             "id": 3,
             "result_repo": "http://localhost/composes/latest-odcs-3-1/compose/Temporary",
@@ -182,7 +182,7 @@ class TestPrepareYumRepo(helpers.ModelsTestCase):
         db.session.refresh(self.ev)
         self.assertEqual(3, compose['id'])
 
-        _get_compose_source.assert_called_once_with("httpd-2.4.15-1.f27")
+        _get_compose_sources.assert_called_once_with(["httpd-2.4.15-1.f27"])
         _get_packages_for_compose.assert_called_once_with("httpd-2.4.15-1.f27")
 
         # Ensure new_compose is called to request a new compose
@@ -197,14 +197,14 @@ class TestPrepareYumRepo(helpers.ModelsTestCase):
 
     @patch('freshmaker.odcsclient.create_odcs_client')
     @patch('freshmaker.odcsclient.FreshmakerODCSClient._get_packages_for_compose')
-    @patch('freshmaker.odcsclient.FreshmakerODCSClient._get_compose_source')
+    @patch('freshmaker.odcsclient.FreshmakerODCSClient._get_compose_sources')
     @patch('time.sleep')
     @patch('freshmaker.odcsclient.Errata')
     def test_get_repo_url_packages_in_multiple_tags(
-            self, errata, sleep, _get_compose_source,
+            self, errata, sleep, _get_compose_sources,
             _get_packages_for_compose, create_odcs_client):
         _get_packages_for_compose.return_value = ['httpd', 'httpd-debuginfo']
-        _get_compose_source.side_effect = [
+        _get_compose_sources.return_value = [
             'rhel-7.2-candidate', 'rhel-7.7-candidate']
 
         errata.return_value.get_srpm_nvrs.return_value = [
@@ -224,14 +224,14 @@ class TestPrepareYumRepo(helpers.ModelsTestCase):
 
     @patch('freshmaker.odcsclient.create_odcs_client')
     @patch('freshmaker.odcsclient.FreshmakerODCSClient._get_packages_for_compose')
-    @patch('freshmaker.odcsclient.FreshmakerODCSClient._get_compose_source')
+    @patch('freshmaker.odcsclient.FreshmakerODCSClient._get_compose_sources')
     @patch('time.sleep')
     @patch('freshmaker.odcsclient.Errata')
     def test_get_repo_url_packages_not_found_in_tag(
-            self, errata, sleep, _get_compose_source,
+            self, errata, sleep, _get_compose_sources,
             _get_packages_for_compose, create_odcs_client):
         _get_packages_for_compose.return_value = ['httpd', 'httpd-debuginfo']
-        _get_compose_source.return_value = None
+        _get_compose_sources.return_value = [None, None]
 
         errata.return_value.get_srpm_nvrs.return_value = [
             set(["httpd-2.4.15-1.f27"]), set(["foo-2.4.15-1.f27"])]
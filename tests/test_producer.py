@@ -24,10 +24,11 @@
 
 import koji
 
+from datetime import timedelta
 from unittest.mock import patch, MagicMock
 import queue
 
-from freshmaker import db
+from freshmaker import conf, db
 from freshmaker.events import ErrataAdvisoryRPMsSignedEvent
 from freshmaker.models import ArtifactBuild, Event
 from freshmaker.types import EventState, ArtifactBuildState
@@ -56,13 +57,13 @@ class TestCheckUnfinishedKojiTasks(helpers.ModelsTestCase):
     def tearDown(self):
         self.koji_read_config_patcher.stop()
 
-    @patch('freshmaker.kojiservice.KojiService.get_task_info')
+    @patch('freshmaker.kojiservice.KojiService.get_task_infos')
     @patch('freshmaker.consumer.get_global_consumer')
-    def test_koji_task_failed(self, global_consumer, get_task_info):
+    def test_koji_task_failed(self, global_consumer, get_task_infos):
         consumer = self.create_consumer()
         global_consumer.return_value = consumer
 
-        get_task_info.return_value = {'state': koji.TASK_STATES['FAILED']}
+        get_task_infos.return_value = [{'state': koji.TASK_STATES['FAILED']}]
 
         hub = MagicMock()
         producer = FreshmakerProducer(hub)
@@ -71,13 +72,13 @@ class TestCheckUnfinishedKojiTasks(helpers.ModelsTestCase):
         self.assertEqual(event.task_id, 10)
         self.assertEqual(event.new_state, "FAILED")
 
-    @patch('freshmaker.kojiservice.KojiService.get_task_info')
+    @patch('freshmaker.kojiservice.KojiService.get_task_infos')
     @patch('freshmaker.consumer.get_global_consumer')
-    def test_koji_task_closed(self, global_consumer, get_task_info):
+    def test_koji_task_closed(self, global_consumer, get_task_infos):
         consumer = self.create_consumer()
         global_consumer.return_value = consumer
 
-        get_task_info.return_value = {'state': koji.TASK_STATES['CLOSED']}
+        get_task_infos.return_value = [{'state': koji.TASK_STATES['CLOSED']}]
 
         hub = MagicMock()
         producer = FreshmakerProducer(hub)
@@ -86,43 +87,88 @@ class TestCheckUnfinishedKojiTasks(helpers.ModelsTestCase):
         self.assertEqual(event.task_id, 10)
         self.assertEqual(event.new_state, "CLOSED")
 
-    @patch('freshmaker.kojiservice.KojiService.get_task_info')
+    @patch('freshmaker.kojiservice.KojiService.get_task_infos')
     @patch('freshmaker.consumer.get_global_consumer')
-    def test_koji_task_dry_run(self, global_consumer, get_task_info):
+    def test_koji_task_finished_not_polled_again(self, global_consumer, get_task_infos):
+        consumer = self.create_consumer()
+        global_consumer.return_value = consumer
+
+        db_event = Event.get_or_create(
+            db.session, "msg2", "another_event", ErrataAdvisoryRPMsSignedEvent)
+        db_event.state = EventState.BUILDING
+        build = ArtifactBuild.create(db.session, db_event, "parent2-1-4", "image")
+        build.state = ArtifactBuildState.BUILD
+        build.build_id = 20
+        db.session.commit()
+
+        get_task_infos.return_value = [
+            {'state': koji.TASK_STATES['CLOSED']},
+            {'state': koji.TASK_STATES['OPEN']}]
+
+        hub = MagicMock()
+        producer = FreshmakerProducer(hub)
+        producer.check_unfinished_koji_tasks(db.session)
+        get_task_infos.assert_called_once_with([10, 20])
+        event = consumer.incoming.get(block=False)
+        self.assertEqual(event.task_id, 10)
+        self.assertRaises(queue.Empty, consumer.incoming.get, block=False)
+
+        # The finished task is not polled again, but the event is generated
+        # again until the build is moved out of the BUILD state.
+        get_task_infos.reset_mock()
+        get_task_infos.return_value = [{'state': koji.TASK_STATES['OPEN']}]
+        producer.check_unfinished_koji_tasks(db.session)
+        get_task_infos.assert_called_once_with([20])
+        event = consumer.incoming.get(block=False)
+        self.assertEqual(event.task_id, 10)
+        self.assertEqual(event.new_state, "CLOSED")
+
+        # Once the build is done, the finished task is forgotten.
+        self.build.state = ArtifactBuildState.DONE
+        db.session.commit()
+        get_task_infos.reset_mock()
+        producer.check_unfinished_koji_tasks(db.session)
+        get_task_infos.assert_called_once_with([20])
+        self.assertEqual(producer._finished_tasks, {})
+        self.assertRaises(queue.Empty, consumer.incoming.get, block=False)
+
+    @patch('freshmaker.kojiservice.KojiService.get_task_infos')
+    @patch('freshmaker.consumer.get_global_consumer')
+    def test_koji_task_dry_run(self, global_consumer, get_task_infos):
         self.build.build_id = -10
         consumer = self.create_consumer()
         global_consumer.return_value = consumer
 
-        get_task_info.return_value = {'state': koji.TASK_STATES['CLOSED']}
+        get_task_infos.return_value = [{'state': koji.TASK_STATES['CLOSED']}]
 
         hub = MagicMock()
         producer = FreshmakerProducer(hub)
         producer.check_unfinished_koji_tasks(db.session)
         self.assertRaises(queue.Empty, consumer.incoming.get, block=False)
 
-    @patch('freshmaker.kojiservice.KojiService.get_task_info')
+    @patch('freshmaker.kojiservice.KojiService.get_task_infos')
     @patch('freshmaker.consumer.get_global_consumer')
-    def test_koji_task_open(self, global_consumer, get_task_info):
+    def test_koji_task_open(self, global_consumer, get_task_infos):
         self.build.build_id = -10
         consumer = self.create_consumer()
         global_consumer.return_value = consumer
 
-        get_task_info.return_value = {'state': koji.TASK_STATES['OPEN']}
+        get_task_infos.return_value = [{'state': koji.TASK_STATES['OPEN']}]
 
         hub = MagicMock()
         producer = FreshmakerProducer(hub)
         producer.check_unfinished_koji_tasks(db.session)
         self.assertRaises(queue.Empty, consumer.incoming.get, block=False)
 
-    @patch('freshmaker.kojiservice.KojiService.get_task_info')
+    @patch('freshmaker.kojiservice.KojiService.get_task_infos')
     @patch('freshmaker.consumer.get_global_consumer')
-    def test_koji_invalid_request(self, global_consumer, get_task_info):
+    def test_koji_invalid_request(self, global_consumer, get_task_infos):
         from sqlalchemy import select
         self.build.build_id = -10
         consumer = self.create_consumer()
         global_consumer.return_value = consumer
 
-        get_task_info.return_value = {'state': koji.TASK_STATES['OPEN']}
+        get_task_infos.return_value = [{'state': koji.TASK_STATES['OPEN']}]
 
         hub = MagicMock()
         producer = FreshmakerProducer(hub)
@@ -146,3 +192,19 @@ class TestCheckUnfinishedKojiTasks(helpers.ModelsTestCase):
         # Check if connection to db is established again
         my_session.connection().scalar(select([1]))
         self.assertFalse(my_session.connection().invalidated)
+
+
+class TestEvictExpiredKojiBuildMetadata(helpers.ModelsTestCase):
+
+    @patch('freshmaker.models.KojiBuildMetadata.evict_expired')
+    def test_eviction_throttled(self, evict_expired):
+        producer = FreshmakerProducer(MagicMock())
+        for i in range(3):
+            producer.evict_expired_koji_build_metadata(db.session)
+        evict_expired.assert_called_once_with(db.session)
+
+        # Evicted again once the interval passes.
+        producer._metadata_evicted_at -= timedelta(
+            seconds=conf.koji_build_metadata_eviction_interval)
+        producer.evict_expired_koji_build_metadata(db.session)
+        self.assertEqual(evict_expired.call_count, 2)
@@ -40,7 +40,7 @@ class TestPulp(helpers.FreshmakerTestCase):
         self.username = 'qa'
         self.password = 'qa'
 
-    @patch('freshmaker.pulp.requests.post')
+    @patch('freshmaker.pulp.requests.Session.post')
     def test_query_content_set_by_repo_ids(self, post):
         post.return_value.json.return_value = [
             {
@@ -104,7 +104,7 @@ class TestPulp(helpers.FreshmakerTestCase):
              'rhel-7-desktop-rpms'],
             content_sets)
 
-    @patch('freshmaker.pulp.requests.post')
+    @patch('freshmaker.pulp.requests.Session.post')
     def test_get_content_sets_by_ignoring_nonexisting_ones(self, post):
         post.return_value.json.return_value = [
             {
@@ -163,7 +163,7 @@ class TestPulp(helpers.FreshmakerTestCase):
         self.assertEqual(['rhel-7-workstation-rpms', 'rhel-7-desktop-rpms'],
                          content_sets)
 
-    @patch('freshmaker.pulp.requests.get')
+    @patch('freshmaker.pulp.requests.Session.get')
     def test_get_docker_repository_name(self, get):
         get.return_value.json.return_value = {
             'display_name': 'foo-526',
@@ -186,8 +186,8 @@ class TestPulp(helpers.FreshmakerTestCase):
 
         self.assertEqual(repo_name, "scl/foo-526")
 
-    @patch('freshmaker.pulp.requests.post')
-    @patch('freshmaker.pulp.requests.get')
+    @patch('freshmaker.pulp.requests.Session.post')
+    @patch('freshmaker.pulp.requests.Session.get')
     def test_retrying_calls(self, get, post):
         get.side_effect = exceptions.HTTPError("Connection error: get")
         post.side_effect = exceptions.HTTPError("Connection error: post")
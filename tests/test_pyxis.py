@@ -314,7 +314,7 @@ class TestQueryPyxis(helpers.FreshmakerTestCase):
         return new_mock
 
     @patch('freshmaker.pyxis.HTTPKerberosAuth')
-    @patch('freshmaker.pyxis.requests.get')
+    @patch('freshmaker.httpsession.requests.Session.get')
     def test_make_request(self, get, auth):
         get.return_value = self.response
         test_params = {'key1': 'val1'}
@@ -323,11 +323,10 @@ class TestQueryPyxis(helpers.FreshmakerTestCase):
         get_url = self.fake_server_url + 'v1/test'
         self.response.json.assert_called_once()
         test_params['page_size'] = "100"
-        get.assert_called_once_with(get_url, params=test_params, auth=auth(),
-                                    timeout=conf.net_timeout)
+        get.assert_called_once_with(get_url, params=test_params, timeout=conf.net_timeout)
 
     @patch('freshmaker.pyxis.HTTPKerberosAuth')
-    @patch('freshmaker.pyxis.requests.get')
+    @patch('freshmaker.httpsession.requests.Session.get')
     def test_make_request_error(self, get, auth):
         get.return_value = self.response
         self.response.ok = False
@@ -361,6 +360,41 @@ class TestQueryPyxis(helpers.FreshmakerTestCase):
                  ]
         my_request.assert_has_calls(calls)
 
+    @patch.object(conf, 'pyxis_page_size', new=2)
+    @patch('freshmaker.pyxis.Pyxis._make_request')
+    def test_pagination_with_total(self, request):
+        my_request = self.copy_call_args(request)
+        pages = {
+            0: {"page": 0, "total": 5, "data": ["fake_data1", "fake_data2"]},
+            1: {"page": 1, "total": 5, "data": ["fake_data3", "fake_data4"]},
+            2: {"page": 2, "total": 5, "data": ["fake_data5"]},
+        }
+        my_request.side_effect = lambda entity, params: pages[params["page"]]
+
+        data = self.px._pagination('test', {'include': 'data.field1'})
+
+        self.assertEqual(
+            data, ["fake_data1", "fake_data2", "fake_data3", "fake_data4", "fake_data5"])
+        # There's no request for the empty page after the last one
+        self.assertEqual(request.call_count, 3)
+        default_params = {'page_size': '2', 'include': 'data.field1,total'}
+        my_request.assert_has_calls([
+            call('test', params={**default_params, 'page': 0}),
+            call('test', params={**default_params, 'page': 1}),
+            call('test', params={**default_params, 'page': 2}),
+        ], any_order=True)
+
+    @patch.object(conf, 'pyxis_page_size', new=2)
+    @patch('freshmaker.pyxis.Pyxis._make_request')
+    def test_iter_pagination_stop_early(self, request):
+        request.return_value = {"total": 2, "data": ["fake_data1", "fake_data2"]}
+
+        items = self.px._iter_pagination('test', {})
+        self.assertEqual(next(items), "fake_data1")
+        items.close()
+
+        request.assert_called_once_with('test', params={'page_size': '2', 'page': 0})
+
     @patch.object(conf, 'pyxis_index_image_organizations', new=['org1', 'org2'])
     @patch('freshmaker.pyxis.Pyxis._pagination')
     def test_get_operator_indices(self, page):
@@ -460,7 +494,7 @@ class TestQueryPyxis(helpers.FreshmakerTestCase):
         out = self.px.get_latest_bundles(self.indices)
         self.assertEqual(out, self.bundles[:3])
 
-    @patch('freshmaker.pyxis.Pyxis._pagination')
+    @patch('freshmaker.pyxis.Pyxis._iter_pagination')
     def test_get_manifest_list_digest_by_nvr(self, page):
         page.return_value = self.images
         digest = self.px.get_manifest_list_digest_by_nvr('s2i-1-2')
@@ -472,7 +506,7 @@ class TestQueryPyxis(helpers.FreshmakerTestCase):
             {'include': 'data.brew,data.repositories'}
         )
 
-    @patch('freshmaker.pyxis.Pyxis._pagination')
+    @patch('freshmaker.pyxis.Pyxis._iter_pagination')
     def test_get_manifest_list_digest_by_nvr_unpublished(self, page):
         page.return_value = [
             {
@@ -510,6 +544,22 @@ class TestQueryPyxis(helpers.FreshmakerTestCase):
         expected_bundles = [self.bundles[0]]
         self.assertListEqual(new_bundles, expected_bundles)
 
+    def test_get_bundles_by_related_image_digest_index(self):
+        index = self.px.get_related_image_digest_index(self.bundles)
+
+        self.assertListEqual(
+            self.px.get_bundles_by_related_image_digest('sha256:111', index),
+            [self.bundles[0]])
+        self.assertListEqual(
+            self.px.get_bundles_by_related_image_digest('sha256:unknown', index), [])
+        digests = {
+            img['digest'] for bundle in self.bundles for img in bundle.get('related_images', [])
+        }
+        for digest in digests:
+            self.assertListEqual(
+                self.px.get_bundles_by_related_image_digest(digest, index),
+                self.px.get_bundles_by_related_image_digest(digest, self.bundles))
+
     @patch('freshmaker.pyxis.Pyxis._pagination')
     def test_get_bundles_by_digest(self, page):
         page.return_value = {"some_bundle"}
@@ -522,7 +572,7 @@ class TestQueryPyxis(helpers.FreshmakerTestCase):
             "filter": "bundle_path_digest==some_digest"
         })
 
-    @patch('freshmaker.pyxis.requests.get')
+    @patch('freshmaker.httpsession.requests.Session.get')
     def test_get_images_by_digest(self, mock_get):
         image_1 = {
             'brew': {
@@ -551,7 +601,7 @@ class TestQueryPyxis(helpers.FreshmakerTestCase):
         images = self.px.get_images_by_digest(digest)
         self.assertListEqual(images, [image_1])
 
-    @patch('freshmaker.pyxis.requests.get')
+    @patch('freshmaker.httpsession.requests.Session.get')
     def test_get_auto_rebuild_tags(self, mock_get):
         mock_get.return_value = Mock(ok=True)
         mock_get.return_value.json.return_value = {
@@ -22,11 +22,13 @@
 
 from unittest.mock import patch
 
+import kobo.rpmlib
 import pytest
 
 from freshmaker import conf
 from freshmaker.models import ArtifactType
 from freshmaker.utils import get_rebuilt_nvr, sorted_by_nvr, is_valid_ocp_versions_range
+from freshmaker.utils import NVR, nvr_sort_key
 from tests import helpers
 
 
@@ -81,3 +83,72 @@ class TestSortedByNVR(helpers.FreshmakerTestCase):
         expected = ["bar-1-2", "foo-1-1", "foo-1-10"]
         ret = sorted_by_nvr(lst, reverse=True)
         self.assertEqual(ret, list(reversed(expected)))
+
+    def test_versions_ordering(self):
+        # Sorted the same way as rpm.labelCompare sorts them.
+        expected = [
+            "foo-1.0~rc1-1",
+            "foo-1.0-1",
+            "foo-1.0^git1-1",
+            "foo-1.0a-1",
+            "foo-1.0.1-1",
+            "foo-1.2-1",
+            "foo-1.10-1",
+            "foo-1.10-1.el8",
+            "foo-1.10-2",
+            "foo-1.10-10",
+            "foo-1:0.1-1",
+        ]
+        ret = sorted_by_nvr(reversed(expected))
+        self.assertEqual(ret, expected)
+
+    def test_same_order_as_compare_nvr(self):
+        nvrs = ["foo-1.0-1", "foo-1.0-1.el8", "foo-1.00-1", "foo-1.a-1", "foo-1-1", "foo-a-1"]
+        for nvr1 in nvrs:
+            for nvr2 in nvrs:
+                expected = kobo.rpmlib.compare_nvr(
+                    kobo.rpmlib.parse_nvr(nvr1), kobo.rpmlib.parse_nvr(nvr2))
+                self.assertEqual(NVR.parse(nvr1).compare(NVR.parse(nvr2)), expected)
+
+    def test_nvr_sort_key(self):
+        lst = ["foo-1-10", "bar-1-2", "foo-1-1"]
+        self.assertEqual(sorted(lst, key=nvr_sort_key), ["bar-1-2", "foo-1-1", "foo-1-10"])
+
+
+class TestNVR(helpers.FreshmakerTestCase):
+
+    def test_parse(self):
+        nvr = NVR.parse("foo-bar-1.2-3.el8")
+        self.assertEqual(nvr.name, "foo-bar")
+        self.assertEqual(nvr.version, "1.2")
+        self.assertEqual(nvr.release, "3.el8")
+        self.assertEqual(nvr.epoch, "")
+        self.assertEqual(str(nvr), "foo-bar-1.2-3.el8")
+
+    def test_parse_interned(self):
+        self.assertIs(NVR.parse("foo-1-1"), NVR.parse("foo-1-1"))
+
+    def test_parse_invalid(self):
+        with self.assertRaises(ValueError):
+            NVR.parse("foo")
+
+    def test_parse_nvra(self):
+        nvr = NVR.parse_nvra("foo-1.2-3.el8.x86_64")
+        self.assertEqual((nvr.name, nvr.version, nvr.release), ("foo", "1.2", "3.el8"))
+        self.assertEqual(nvr, NVR.parse("foo-1.2-3.el8"))
+
+    def test_compare(self):
+        self.assertEqual(NVR.parse("foo-1-2").compare(NVR.parse("foo-1-10")), -1)
+        self.assertEqual(NVR.parse("foo-1-10").compare(NVR.parse("foo-1-2")), 1)
+        self.assertEqual(NVR.parse("foo-1-2").compare(NVR.parse("foo-1-02")), 0)
+        self.assertEqual(NVR.parse("foo-1:1-2").compare(NVR.parse("foo-1-2")), 1)
+        self.assertEqual(
+            NVR.parse("foo-1:1-2").compare(NVR.parse("foo-1-2"), ignore_epoch=True), 0)
+        with self.assertRaises(ValueError):
+            NVR.parse("foo-1-2").compare(NVR.parse("bar-1-2"))
+
+    def test_ordering(self):
+        self.assertLess(NVR.parse("bar-2-1"), NVR.parse("foo-1-1"))
+        self.assertLess(NVR.parse("foo-1-1"), NVR.parse("foo-1-1.el8"))
+        self.assertEqual(max([NVR.parse("foo-1-9"), NVR.parse("foo-1-10")]).nvr, "foo-1-10")
+        self.assertEqual(len({NVR.parse("foo-1-1"), NVR.parse("foo-1-01")}), 1)
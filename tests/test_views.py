@@ -699,6 +699,28 @@ class TestViews(helpers.ModelsTestCase):
         self.assertEqual(data['depends_on_events'], [event1.id])
         self.assertEqual(data['depending_events'], [])
 
+    def test_query_events_constant_number_of_queries(self):
+        for url in ('/api/1/events/', '/api/2/events/'):
+            db.session.expire_all()
+            with helpers.count_queries() as statements:
+                self.client.get(url)
+            count = len(statements)
+
+            for i in range(5):
+                event = models.Event.create(
+                    db.session, "%s-msg-%d" % (url, i), "10%d" % i, events.TestingEvent)
+                models.ArtifactBuild.create(db.session, event, "ed", "module", 1300 + i)
+                db.session.commit()
+                event.add_event_dependency(db.session, models.Event.query.get(1))
+                db.session.commit()
+
+            db.session.expire_all()
+            with helpers.count_queries() as statements:
+                data = self.client.get(url).json
+            self.assertEqual(len(statements), count)
+            self.assertEqual(len(data['items']), 7 if url == '/api/1/events/' else 10)
+            self.assertEqual(data['items'][0]['depends_on_events'], [1])
+
     def test_trailing_slash(self):
         urls = ('/api/2/builds', '/api/2/builds/',
                 '/api/2/events', '/api/2/events/')